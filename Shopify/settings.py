@@ -148,6 +148,46 @@ REST_FRAMEWORK = {
     'PAGE_SIZE': 10
 }
 
+# build list responses of the store API from compiled row readers
+STORE_FAST_READS = False
+
+# 'default' is local to each process and only holds derived data such as
+# counts and facets. Carts need a cache shared by every worker that outlives
+# restarts, the database cache below needs `manage.py createcachetable` and
+# can be pointed at a redis or memcached server instead
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'carts': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'store_cart_cache',
+        'TIMEOUT': None,
+        'OPTIONS': {'MAX_ENTRIES': 1000000},
+    },
+}
+
+# where active carts are kept, store.carts.CacheCartBackend keeps their lines
+# in the CART_CACHE_ALIAS cache and writes them to the database at checkout
+# or every CART_FLUSH_INTERVAL seconds of activity
+CART_BACKEND = 'store.carts.DatabaseCartBackend'
+CART_CACHE_ALIAS = 'carts'
+CART_FLUSH_INTERVAL = 60 * 5
+# carts without activity for this many days are deleted by collect_carts
+ABANDONED_CART_DAYS = 30
+
+# seconds a cart keeps its hold on the stock of its lines
+STOCK_RESERVATION_TTL = 60 * 15
+
+# queue orders and finalize them in a pool of ORDER_WORKERS local threads,
+# 0 finalizes them right after the placing transaction commits
+ORDER_FINALIZE_ASYNC = False
+ORDER_WORKERS = 4
+
+# seconds the response to a POST sent with an Idempotency-Key is replayed for,
+# lapsed records are deleted by expire_idempotency_keys
+IDEMPOTENCY_KEY_TTL = 60 * 60 * 24
+
 SIMPLE_JWT = {
     'AUTH_HEADER_TYPES': ('JWT',),
     "ACCESS_TOKEN_LIFETIME": timedelta(days=30),
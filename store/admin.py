@@ -3,12 +3,11 @@ from django.contrib import admin
 from django.db.models.query import QuerySet
 from django.http import HttpRequest
 from django.urls import reverse
-from django.db.models.aggregates import Count
 from django.utils.http import urlencode
 from django.utils.html import format_html
 from django.db.models import F
 
-from . import models
+from . import models, orders, rollups, versioning
 
 
 class AddressInline(admin.TabularInline):
@@ -25,10 +24,11 @@ class CustomerAdmin(admin.ModelAdmin):
     ]
     list_display = [
         'customer_id', 'first_name', 'last_name',
-        'email', 'membership', 'order_count'
+        'email', 'membership', 'order_count', 'lifetime_spend'
     ]
     list_filter = ['membership']
     list_editable = ['membership']
+    readonly_fields = ['order_count', 'lifetime_spend']
     inlines = [AddressInline]
     list_per_page = 10
 
@@ -39,11 +39,6 @@ class CustomerAdmin(admin.ModelAdmin):
         })
         return format_html('<a href={}>{}</a>', url, customer.order_count)
 
-    def get_queryset(self, request: HttpRequest) -> QuerySet[Any]:
-        return super().get_queryset(request).annotate(
-            order_count=Count('orders')
-        )
-
 
 @admin.register(models.Promotion)
 class PromotionAdmin(admin.ModelAdmin):
@@ -66,6 +61,7 @@ class CollectionAdmin(admin.ModelAdmin):
                     'products_count', ]
     list_per_page = 10
 
+    @admin.display(ordering='products_count')
     def products_count(self, collection: models.Collection):
         url = reverse('admin:store_product_changelist') + '?' + urlencode({
             'collection_id': str(collection.id)
@@ -73,11 +69,6 @@ class CollectionAdmin(admin.ModelAdmin):
 
         return format_html('<a href={}>{}</a>', url, collection.products_count)
 
-    def get_queryset(self, request: HttpRequest) -> QuerySet[Any]:
-        return super().get_queryset(request).annotate(
-            products_count=Count('product')
-        )
-
 
 class InventoryFilter(admin.SimpleListFilter):
     title = 'inventory status'
@@ -117,6 +108,9 @@ class ProductAdmin(admin.ModelAdmin):
     list_filter = ['collection', 'is_digital', 'last_update', InventoryFilter]
     list_per_page = 10
 
+    def get_queryset(self, request: HttpRequest) -> QuerySet[Any]:
+        return super().get_queryset(request).with_effective_price()
+
     @admin.display(ordering='stock__quantity_in_stock')
     def inventory_status(self, product: models.Product):
         if product.stock.quantity_in_stock > product.stock.threshold:
@@ -156,7 +150,9 @@ class StockAdmin(admin.ModelAdmin):
 
     @admin.action(description='clear stock')
     def clear_inventory(self, request, queryset):
+        product_ids = list(queryset.values_list('product_id', flat=True))
         updated_count = queryset.update(quantity_in_stock=0)
+        versioning.bump(*versioning.stock_keys(*product_ids))
         message = f'you have successfully updated {
             updated_count} product stock '
         self.message_user(request, message)
@@ -165,6 +161,7 @@ class StockAdmin(admin.ModelAdmin):
 class OrderItemAdminInline(admin.TabularInline):
     autocomplete_fields = ['product']
     model = models.OrderItem
+    readonly_fields = ['sub_total']
     min_num = 1
     extra = 0
 
@@ -175,16 +172,28 @@ class OrderAdmin(admin.ModelAdmin):
         'customer__first_name__istartswith',
         'customer__first_name__istartswith'
     ]
-    list_display = ['id', 'customer', 'order_status', 'payment_status']
+    list_display = ['id', 'customer', 'order_status', 'payment_status', 'total']
     list_editable = ['order_status', 'payment_status']
     list_filter = ['payment_status', 'order_status', 'placed_at']
     autocomplete_fields = ['customer']
+    readonly_fields = ['total']
     actions = ['payment_complete']
     inlines = [OrderItemAdminInline]
 
+    def save_related(self, request, form, formsets, change):
+        # edited lines keep their unit price, only the totals follow them,
+        # the sales rollups swap the old lines for the new ones
+        if change:
+            rollups.record_orders([form.instance.pk], -1)
+        super().save_related(request, form, formsets, change)
+        orders.update_totals([form.instance.pk])
+        rollups.record_orders([form.instance.pk])
+        models.reconcile_customers([form.instance.customer_id])
+
     @admin.action(description='payment completed')
     def payment_complete(self, request, queryset: QuerySet):
-        updated_count = queryset.update(payment_status='C')
+        updated, _ = orders.transition(queryset, {'payment_status': models.Order.status_complete})
+        updated_count = len(updated)
         placeholder = 'orders' if updated_count > 1 else 'order'
         message = f'you have successfully mark {
             updated_count} {placeholder} as complete'
@@ -0,0 +1,292 @@
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from uuid import UUID, uuid4
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Prefetch
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from . import models
+
+DEFAULT_BACKEND = 'store.carts.DatabaseCartBackend'
+
+
+class CartBusy(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'The cart is being changed by another request, try again.'
+    default_code = 'cart_busy'
+
+
+def get_backend():
+    return import_string(getattr(settings, 'CART_BACKEND', DEFAULT_BACKEND))()
+
+
+def price_lines(items):
+    # prices every line once from products already carrying their effective
+    # price, the serializers read sub_total and the returned total
+    items = list(items)
+    for item in items:
+        item.sub_total = item.quantity * item.product.new_price
+    return sum([item.sub_total for item in items])
+
+
+def price_cart(cart):
+    cart.total = price_lines(cart.items.all())
+    return cart
+
+
+class DatabaseCartBackend:
+    # carts live in the Cart and CartItem tables
+
+    def create(self):
+        return models.Cart.objects.create()
+
+    def get(self, cart_id, with_items=True):
+        carts = models.Cart.objects.all()
+        if with_items:
+            carts = carts.prefetch_related(
+                Prefetch('items__product', queryset=models.Product.objects.with_effective_price()))
+        cart = carts.get(pk=UUID(str(cart_id)))
+        return price_cart(cart) if with_items else cart
+
+    def items(self, cart_id):
+        items = list(self.item_queryset(cart_id))
+        price_lines(items)
+        return items
+
+    def get_item(self, cart_id, item_id):
+        item = self.item_queryset(cart_id).get(pk=item_id)
+        price_lines([item])
+        return item
+
+    @staticmethod
+    def item_queryset(cart_id):
+        return models.CartItem.objects \
+            .prefetch_related(Prefetch('product', queryset=models.Product.objects.with_effective_price())) \
+            .filter(cart_id=cart_id)
+
+    def add_item(self, cart_id, product_id, quantity):
+        if not self.touch(cart_id):
+            raise models.Cart.DoesNotExist
+        try:
+            item = models.CartItem.objects.get(cart_id=cart_id, product_id=product_id)
+            item.quantity += quantity
+            item.save()
+            return item
+        except models.CartItem.DoesNotExist:
+            return models.CartItem.objects.create(cart_id=cart_id, product_id=product_id, quantity=quantity)
+
+    def quantities(self, cart_id):
+        return dict(models.CartItem.objects.filter(cart_id=cart_id).values_list('product_id', 'quantity'))
+
+    def add_items(self, cart_id, quantities):
+        with transaction.atomic():
+            if not self.touch(cart_id):
+                raise models.Cart.DoesNotExist
+            existing = dict(models.CartItem.objects
+                            .filter(cart_id=cart_id, product_id__in=list(quantities))
+                            .values_list('product_id', 'quantity'))
+            models.upsert([
+                models.CartItem(cart_id=cart_id, product_id=product_id,
+                                quantity=existing.get(product_id, 0) + quantity)
+                for product_id, quantity in quantities.items()
+            ], ['cart', 'product'], ['quantity'])
+
+    def set_quantity(self, item, quantity):
+        self.touch(item.cart_id)
+        item.quantity = quantity
+        item.save()
+        return item
+
+    def remove_item(self, item):
+        self.touch(item.cart_id)
+        item.delete()
+
+    @staticmethod
+    def touch(cart_id):
+        # the UPDATE also locks the cart row for the rest of the transaction
+        return models.Cart.objects.filter(pk=cart_id).update(last_activity=timezone.now())
+
+    def flush(self, cart_id):
+        pass
+
+    def delete(self, cart_id):
+        models.Cart.objects.filter(pk=cart_id).delete()
+
+
+class CacheCartBackend:
+    # the cart row is written when the cart is created, its lines are kept
+    # in the cache as (created_at, {product_id: quantity}, flushed_at) and
+    # written to the tables at checkout, or when a change comes in more than
+    # CART_FLUSH_INTERVAL seconds after the last write, item ids are product
+    # ids
+    lock_timeout = 5
+
+    def __init__(self):
+        self.cache = caches[getattr(settings, 'CART_CACHE_ALIAS', 'carts')]
+        self.timeout = getattr(settings, 'CART_CACHE_TIMEOUT', 60 * 60 * 24 * 14)
+        self.flush_interval = getattr(settings, 'CART_FLUSH_INTERVAL', 60 * 5)
+
+    @staticmethod
+    def key(cart_id):
+        return f'store:cart:{UUID(str(cart_id))}'
+
+    def create(self):
+        # a cart lost from the cache is read back from its row and last flush
+        cart = models.Cart.objects.create()
+        self.cache.set(self.key(cart.id), (cart.created_at, {}, None), self.timeout)
+        cart._prefetched_objects_cache = {'items': []}
+        return cart
+
+    def get(self, cart_id, with_items=True):
+        cart_id = UUID(str(cart_id))
+        created_at, quantities, _ = self.load(cart_id)
+        cart = models.Cart(id=cart_id, created_at=created_at)
+        cart._prefetched_objects_cache = {
+            'items': self.build_items(cart, quantities) if with_items else []
+        }
+        return price_cart(cart) if with_items else cart
+
+    def items(self, cart_id):
+        return self.get(cart_id).items.all()
+
+    def get_item(self, cart_id, item_id):
+        for item in self.items(cart_id):
+            if str(item.id) == str(item_id):
+                return item
+        raise models.CartItem.DoesNotExist
+
+    def add_item(self, cart_id, product_id, quantity):
+        with self.change(cart_id) as quantities:
+            quantities[product_id] = quantities.get(product_id, 0) + quantity
+            return models.CartItem(
+                id=product_id, cart_id=cart_id, product_id=product_id, quantity=quantities[product_id])
+
+    def quantities(self, cart_id):
+        return dict(self.load(cart_id)[1])
+
+    def add_items(self, cart_id, quantities):
+        with self.change(cart_id) as lines:
+            for product_id, quantity in quantities.items():
+                lines[product_id] = lines.get(product_id, 0) + quantity
+
+    def set_quantity(self, item, quantity):
+        with self.change(item.cart_id) as quantities:
+            if item.product_id not in quantities:
+                raise models.CartItem.DoesNotExist
+            quantities[item.product_id] = item.quantity = quantity
+        return item
+
+    def remove_item(self, item):
+        with self.change(item.cart_id) as quantities:
+            quantities.pop(item.product_id, None)
+
+    def flush(self, cart_id):
+        with self.locked(cart_id):
+            try:
+                created_at, quantities, _ = self.load(cart_id)
+            except models.Cart.DoesNotExist:
+                return
+            self.write(cart_id, created_at, quantities)
+            self.cache.set(self.key(cart_id), (created_at, quantities, time.time()), self.timeout)
+
+    def delete(self, cart_id):
+        models.Cart.objects.filter(pk=cart_id).delete()
+        self.cache.delete(self.key(cart_id))
+
+    def load(self, cart_id):
+        # a cart missing from the cache is read back from its last flush
+        cart = self.cache.get(self.key(cart_id))
+        if cart is not None:
+            return cart
+
+        created_at = models.Cart.objects.filter(pk=cart_id).values_list('created_at', flat=True).first()
+        if created_at is None:
+            raise models.Cart.DoesNotExist
+        quantities = {}
+        for product_id, quantity in models.CartItem.objects.filter(cart_id=cart_id) \
+                .order_by('pk').values_list('product_id', 'quantity'):
+            quantities[product_id] = quantities.get(product_id, 0) + quantity
+        cart = (created_at, quantities, time.time())
+        self.cache.set(self.key(cart_id), cart, self.timeout)
+        return cart
+
+    @contextmanager
+    def change(self, cart_id):
+        with self.locked(cart_id):
+            created_at, quantities, flushed_at = self.load(cart_id)
+            yield quantities
+            if time.time() - (flushed_at or created_at.timestamp()) >= self.flush_interval:
+                self.write(cart_id, created_at, quantities)
+                flushed_at = time.time()
+            self.cache.set(self.key(cart_id), (created_at, quantities, flushed_at), self.timeout)
+
+    @contextmanager
+    def locked(self, cart_id):
+        # the lock holds a token of its own so a lock that expired and was
+        # taken by another request is never released from here
+        lock = self.key(cart_id) + ':lock'
+        token = uuid4().hex
+        deadline = time.monotonic() + self.lock_timeout
+        while not self.cache.add(lock, token, self.lock_timeout):
+            if time.monotonic() >= deadline:
+                raise CartBusy
+            time.sleep(0.005)
+        try:
+            yield
+        finally:
+            if self.cache.get(lock) == token:
+                self.cache.delete(lock)
+
+    @staticmethod
+    def write(cart_id, created_at, quantities):
+        with transaction.atomic():
+            _, created = models.Cart.objects.get_or_create(pk=cart_id)
+            models.Cart.objects.filter(pk=cart_id).update(
+                last_activity=timezone.now(), **({'created_at': created_at} if created else {}))
+            models.CartItem.objects.filter(cart_id=cart_id).exclude(product_id__in=list(quantities)).delete()
+            models.upsert([
+                models.CartItem(cart_id=cart_id, product_id=product_id, quantity=quantity)
+                for product_id, quantity in quantities.items()
+            ], ['cart', 'product'], ['quantity'])
+
+    @staticmethod
+    def build_items(cart, quantities):
+        products = models.Product.objects.with_effective_price().in_bulk(list(quantities))
+        return [
+            models.CartItem(id=product_id, cart=cart, product=products[product_id], quantity=quantity)
+            for product_id, quantity in quantities.items() if product_id in products
+        ]
+
+
+def abandoned_after():
+    return timedelta(days=getattr(settings, 'ABANDONED_CART_DAYS', 30))
+
+
+def collect_abandoned(max_age, batch_size=500, pause=0.1):
+    # deletes carts idle for longer than max_age a primary key ordered batch
+    # at a time, yielding (carts, items) deleted per batch and sleeping in
+    # between so no lock is held for long
+    cutoff = timezone.now() - max_age
+    last_pk = None
+    while True:
+        carts = models.Cart.objects.filter(last_activity__lt=cutoff).order_by('pk')
+        if last_pk is not None:
+            carts = carts.filter(pk__gt=last_pk)
+        batch = list(carts.values_list('pk', flat=True)[:batch_size])
+        if not batch:
+            return
+
+        with transaction.atomic():
+            _, deleted = models.Cart.objects.filter(pk__in=batch, last_activity__lt=cutoff).delete()
+            models.StockReservation.objects.filter(cart_id__in=batch).delete()
+        yield deleted.get('store.Cart', 0), deleted.get('store.CartItem', 0)
+
+        last_pk = batch[-1]
+        if len(batch) < batch_size:
+            return
+        time.sleep(pause)
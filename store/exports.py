@@ -0,0 +1,61 @@
+import csv
+import json
+from itertools import groupby
+from operator import itemgetter
+from django.core.serializers.json import DjangoJSONEncoder
+from . import models
+
+BATCH_SIZE = 1000
+ORDER_FIELDS = ['id', 'placed_at', 'order_status', 'payment_status', 'customer_id', 'total']
+LINE_FIELDS = ['product_id', 'product__title', 'quantity', 'unit_price', 'sub_total']
+LINE_KEYS = ['product_id', 'product_title', 'quantity', 'unit_price', 'sub_total']
+
+
+def order_batches(orders, batch_size=BATCH_SIZE):
+    # yields (order, lines) with orders read in primary key batches, and the
+    # lines of a batch through iterator(), so memory stays flat whatever the
+    # database driver buffers
+    orders = orders.order_by('pk')
+    last_pk = 0
+    while True:
+        batch = list(orders.filter(pk__gt=last_pk).values(*ORDER_FIELDS)[:batch_size])
+        if not batch:
+            return
+        lines = models.OrderItem.objects \
+            .filter(order_id__in=[order['id'] for order in batch]) \
+            .order_by('order_id', 'pk').values_list('order_id', *LINE_FIELDS)
+        lines_by_order = {
+            order_id: [line[1:] for line in order_lines]
+            for order_id, order_lines in groupby(lines.iterator(chunk_size=batch_size), key=itemgetter(0))
+        }
+        for order in batch:
+            yield order, lines_by_order.get(order['id'], [])
+        last_pk = batch[-1]['id']
+
+
+class Echo:
+    # csv.writer target handing back each formatted row
+    def write(self, value):
+        return value
+
+
+def csv_chunks(orders, batch_size=BATCH_SIZE):
+    # one row per line, repeating the order columns
+    writer = csv.writer(Echo())
+    yield writer.writerow(['order_id', *ORDER_FIELDS[1:], *LINE_KEYS])
+    for order, lines in order_batches(orders, batch_size):
+        head = [order[field] for field in ORDER_FIELDS]
+        yield ''.join(writer.writerow(head + list(line)) for line in lines or [[]])
+
+
+def ndjson_chunks(orders, batch_size=BATCH_SIZE):
+    # one object per order holding its lines
+    for order, lines in order_batches(orders, batch_size):
+        order['items'] = [dict(zip(LINE_KEYS, line)) for line in lines]
+        yield json.dumps(order, cls=DjangoJSONEncoder) + '\n'
+
+
+FORMATS = {
+    'csv': (csv_chunks, 'text/csv'),
+    'ndjson': (ndjson_chunks, 'application/x-ndjson')
+}
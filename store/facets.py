@@ -0,0 +1,78 @@
+from django.core.cache import cache
+from django.db.models import Case, CharField, Count, F, Q, Value, When
+from . import versioning
+
+# base price buckets as (label, lower bound, upper bound), the lower bound is
+# inclusive and the upper one exclusive
+PRICE_BUCKETS = [
+    ('0-10', None, 10),
+    ('10-25', 10, 25),
+    ('25-50', 25, 50),
+    ('50-100', 50, 100),
+    ('100+', 100, None),
+]
+STOCK_STATES = ['ok', 'low', 'out']
+CACHE_TIMEOUT = 60 * 60
+
+
+def price_bucket():
+    whens = []
+    for label, lower, upper in PRICE_BUCKETS:
+        condition = Q()
+        if lower is not None:
+            condition &= Q(price__gte=lower)
+        if upper is not None:
+            condition &= Q(price__lt=upper)
+        whens.append(When(condition, then=Value(label)))
+    return Case(*whens, output_field=CharField())
+
+
+def stock_state():
+    # mirrors ProductSerializer.status, a product without stock is out of stock
+    return Case(
+        When(Q(stock__isnull=True) | Q(stock__quantity_in_stock=0), then=Value('out')),
+        When(stock__quantity_in_stock__gt=F('stock__threshold'), then=Value('ok')),
+        default=Value('low'),
+        output_field=CharField()
+    )
+
+
+def count_facets(queryset):
+    facets = {
+        'count': 0,
+        'collection': {},
+        'price': {label: 0 for label, _, _ in PRICE_BUCKETS},
+        'is_digital': {'true': 0, 'false': 0},
+        'stock': {state: 0 for state in STOCK_STATES}
+    }
+
+    # one grouped query over every facet combination, rolled up here
+    groups = queryset.order_by() \
+        .annotate(facet_price=price_bucket(), facet_stock=stock_state()) \
+        .values('collection_id', 'facet_price', 'is_digital', 'facet_stock') \
+        .annotate(facet_count=Count('pk', distinct=True))
+
+    for group in groups:
+        count = group['facet_count']
+        facets['count'] += count
+        collection = str(group['collection_id'])
+        facets['collection'][collection] = facets['collection'].get(collection, 0) + count
+        facets['price'][group['facet_price']] += count
+        facets['is_digital']['true' if group['is_digital'] else 'false'] += count
+        facets['stock'][group['facet_stock']] += count
+    return facets
+
+
+def product_facets(queryset):
+    # the unfiltered catalog is the common case, it is cached until a product
+    # or stock write bumps its version
+    if queryset.query.where:
+        return count_facets(queryset)
+
+    state, _ = versioning.get_validators(['product', 'stock'])
+    key = f'store:facets:{state}'
+    facets = cache.get(key)
+    if facets is None:
+        facets = count_facets(queryset)
+        cache.set(key, facets, CACHE_TIMEOUT)
+    return facets
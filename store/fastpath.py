@@ -0,0 +1,201 @@
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import F, FloatField, Subquery
+from rest_framework import serializers
+from rest_framework.relations import PrimaryKeyRelatedField, RelatedField
+from . import models
+
+# fields whose representation of a database value is the value itself
+IDENTITY_FIELDS = (
+    serializers.CharField, serializers.SlugField, serializers.IntegerField,
+    serializers.BooleanField, serializers.ReadOnlyField
+)
+
+# compiled readers keyed by serializer class, the fields it ended up with and
+# the annotations of the queryset it reads from
+_readers = {}
+
+
+class Unsupported(Exception):
+    pass
+
+
+class Plan:
+    # the .values() lookups, price annotations and to-many relations needed to
+    # build the rows of one model, relations are fetched per page and attached
+    # to the parent rows under the relation name
+    def __init__(self, model, annotations=()):
+        self.model = model
+        self.annotations = set(annotations)
+        self.lookups = {'pk': None}
+        self.prices = {}
+        self.relations = {}
+
+    def resolve(self, names):
+        model = self.model
+        for index, name in enumerate(names):
+            prefix, last = names[:index], index == len(names) - 1
+            if not prefix and name in self.annotations:
+                return self.column([name]) if last else self.unsupported(names)
+            if name == 'pk':
+                return self.column(names) if last else self.unsupported(names)
+
+            try:
+                field = model._meta.get_field(name)
+            except FieldDoesNotExist:
+                if model is models.Product and name == 'new_price' and last:
+                    return self.new_price(prefix)
+                return self.unsupported(names)
+
+            if field.one_to_many or field.many_to_many:
+                if prefix:
+                    return self.unsupported(names)
+                getter = self.relation(name).resolve(names[1:])
+                return lambda row: [getter(item) for item in row[name]]
+            if last:
+                return self.column(names)
+            if not field.is_relation:
+                return self.unsupported(names)
+            model = field.related_model
+        return self.unsupported(names)
+
+    def relation(self, name):
+        if name not in self.relations:
+            field = self.model._meta.get_field(name)
+            if not (field.one_to_many or field.many_to_many):
+                raise Unsupported(name)
+            link = field.field.name if field.auto_created else field.related_query_name()
+            self.relations[name] = (link, Plan(field.related_model))
+        return self.relations[name][1]
+
+    def column(self, names):
+        lookup = '__'.join(names)
+        self.lookups[lookup] = None
+        return lambda row: row[lookup]
+
+    def new_price(self, prefix):
+        price = self.column(prefix + ['price'])
+        if not prefix and 'effective_discount' in self.annotations:
+            discount = 'effective_discount'
+        else:
+            discount = '_'.join(['', *prefix, 'discount'])
+            self.prices[discount] = '__'.join(prefix) or 'pk'
+        self.lookups[discount] = None
+
+        def get(row):
+            return models.discounted_price(price(row), row[discount])
+        return get
+
+    @staticmethod
+    def unsupported(names):
+        raise Unsupported('__'.join(names))
+
+    def values(self, queryset, at, *extra, **expressions):
+        for alias, product_ref in self.prices.items():
+            segment = models.price_segment_in_effect(product_ref, at)
+            queryset = queryset.annotate(**{
+                alias: Subquery(segment.values('discount')[:1], output_field=FloatField())
+            })
+        return queryset.prefetch_related(None).values(*self.lookups, *extra, **expressions)
+
+    def attach(self, rows, at):
+        rows = list(rows)
+        parents = [row['pk'] for row in rows]
+        for name, (link, plan) in self.relations.items():
+            children = plan.values(
+                plan.model._default_manager.filter(**{f'{link}__in': parents}), at, _parent=F(link))
+            grouped = {}
+            for child in plan.attach(children, at):
+                grouped.setdefault(child['_parent'], []).append(child)
+            for row in rows:
+                row[name] = grouped.get(row['pk'], [])
+        return rows
+
+
+class Reader:
+    def __init__(self, serializer, queryset):
+        self.plan = Plan(queryset.model, queryset.query.annotations)
+        self.mapper = compile_serializer(serializer, self.plan, [])
+
+    def values(self, queryset, at, *extra):
+        extra = [name for name in dict.fromkeys(extra) if name not in self.plan.lookups]
+        return self.plan.values(queryset, at, *extra)
+
+    def read(self, rows, at):
+        return [self.mapper(row) for row in self.plan.attach(rows, at)]
+
+
+def get_reader(serializer, queryset):
+    key = (
+        type(serializer),
+        tuple((name, type(field)) for name, field in serializer.fields.items()),
+        tuple(sorted(queryset.query.annotations))
+    )
+    if key not in _readers:
+        try:
+            _readers[key] = Reader(serializer, queryset)
+        except Unsupported:
+            _readers[key] = None
+    if _readers[key] is None:
+        raise Unsupported(type(serializer).__name__)
+    return _readers[key]
+
+
+def compile_serializer(serializer, plan, prefix):
+    meta = getattr(serializer, 'Meta', None)
+    fast_fields = getattr(meta, 'fast_fields', {})
+    fast_sources = getattr(meta, 'fast_sources', {})
+
+    writers = []
+    for name, field in serializer.fields.items():
+        if field.write_only:
+            continue
+        if name in fast_fields:
+            sources, function = fast_fields[name]
+            writers.append((name, computed(
+                function, [plan.resolve(prefix + source.split('__')) for source in sources])))
+            continue
+
+        if name in fast_sources:
+            path = prefix + fast_sources[name].split('__')
+        elif field.source != '*':
+            path = prefix + field.source_attrs
+        else:
+            raise Unsupported(name)
+
+        if isinstance(field, serializers.ListSerializer):
+            if len(path) != 1:
+                raise Unsupported(name)
+            writers.append((name, many(path[0], compile_serializer(field.child, plan.relation(path[0]), []))))
+        elif isinstance(field, serializers.BaseSerializer):
+            writers.append((name, nested(plan.resolve(path + ['pk']), compile_serializer(field, plan, path))))
+        elif isinstance(field, PrimaryKeyRelatedField) and field.pk_field is None:
+            writers.append((name, plan.resolve(path)))
+        elif isinstance(field, (RelatedField, serializers.ManyRelatedField, serializers.SerializerMethodField)):
+            raise Unsupported(name)
+        elif type(field) in IDENTITY_FIELDS:
+            writers.append((name, plan.resolve(path)))
+        else:
+            writers.append((name, represented(plan.resolve(path), field.to_representation)))
+
+    def mapper(row):
+        return {name: write(row) for name, write in writers}
+    return mapper
+
+
+def computed(function, getters):
+    return lambda row: function(*[get(row) for get in getters])
+
+
+def many(name, mapper):
+    return lambda row: [mapper(item) for item in row[name]]
+
+
+def nested(present, mapper):
+    return lambda row: None if present(row) is None else mapper(row)
+
+
+def represented(get, to_representation):
+    def write(row):
+        value = get(row)
+        return None if value is None else to_representation(value)
+    return write
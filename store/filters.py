@@ -1,5 +1,6 @@
 from django_filters import FilterSet
-from . import models
+from rest_framework.filters import SearchFilter
+from . import models, search
 
 
 class ProductFilter(FilterSet):
@@ -9,3 +10,21 @@ class ProductFilter(FilterSet):
             'collection_id': ['exact'],
             'price': ['gt', 'lt']
         }
+
+
+class ProductSearchFilter(SearchFilter):
+    def filter_queryset(self, request, queryset, view):
+        query = ' '.join(self.get_search_terms(request))
+        if not query:
+            return queryset
+        return search.search_products(queryset, query)
+
+
+class OrderFilter(FilterSet):
+    class Meta:
+        model = models.Order
+        fields = {
+            'placed_at': ['gte', 'lt'],
+            'order_status': ['exact'],
+            'payment_status': ['exact']
+        }
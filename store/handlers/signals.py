@@ -1,10 +1,217 @@
 from django.dispatch import receiver
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, pre_save, post_delete, pre_delete, m2m_changed
 from django.conf import settings
-from store.models import Customer
+from store.models import (
+    Customer, Collection, Order, Product, Promotion, Review, Stock, adjust_customer_stats, adjust_products_count,
+    spend_by_customer
+)
+from store import pricing, ratings, rollups, search, versioning
+from store.orders import orders_transitioned
 
 
 @receiver(post_save, sender=settings.AUTH_USER_MODEL)
 def create_default_customer_profile(sender, **kwargs):
     if kwargs['created']:
         Customer.objects.create(customer=kwargs['instance'])
+
+
+@receiver(post_save, sender=Product)
+def refresh_product_price_schedule(sender, instance: Product, **kwargs):
+    pricing.rebuild_price_schedule([instance.pk])
+
+
+@receiver(post_save, sender=Product)
+def refresh_product_search_terms(sender, instance: Product, **kwargs):
+    search.index_products([instance.pk])
+
+
+@receiver(m2m_changed, sender=Product.promotions.through)
+def refresh_price_schedule_on_promotions_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse and action == 'pre_clear':
+        instance._cleared_product_ids = list(instance.product_set.values_list('pk', flat=True))
+        return
+    if action not in ['post_add', 'post_remove', 'post_clear']:
+        return
+
+    if not reverse:
+        pricing.rebuild_price_schedule([instance.pk])
+    elif action == 'post_clear':
+        pricing.rebuild_price_schedule(instance._cleared_product_ids)
+    else:
+        pricing.rebuild_price_schedule(pk_set)
+
+
+@receiver(post_save, sender=Promotion)
+def refresh_price_schedule_on_promotion_save(sender, instance: Promotion, **kwargs):
+    if not kwargs['created']:
+        pricing.rebuild_price_schedule(pricing.products_affected_by(instance))
+
+
+@receiver(pre_delete, sender=Promotion)
+def collect_products_of_deleted_promotion(sender, instance: Promotion, **kwargs):
+    instance._affected_product_ids = list(pricing.products_affected_by(instance))
+
+
+@receiver(post_delete, sender=Promotion)
+def refresh_price_schedule_on_promotion_delete(sender, instance: Promotion, **kwargs):
+    pricing.rebuild_price_schedule(instance._affected_product_ids)
+
+
+@receiver(pre_save, sender=Collection)
+def track_collection_changes(sender, instance: Collection, **kwargs):
+    previous = Collection.objects.filter(pk=instance.pk).values_list('promotion_id', 'title').first()
+    instance._promotion_changed = not previous or previous[0] != instance.promotion_id
+    instance._title_changed = not previous or previous[1] != instance.title
+
+
+@receiver(post_save, sender=Collection)
+def refresh_price_schedule_on_collection_save(sender, instance: Collection, **kwargs):
+    if not kwargs['created'] and instance._promotion_changed:
+        pricing.rebuild_price_schedule(
+            Product.objects.filter(collection=instance).values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=Collection)
+def refresh_search_terms_on_collection_save(sender, instance: Collection, **kwargs):
+    if not kwargs['created'] and instance._title_changed:
+        search.index_products(
+            Product.objects.filter(collection=instance).values_list('pk', flat=True))
+
+
+@receiver(pre_save, sender=Product)
+def track_product_collection(sender, instance: Product, **kwargs):
+    instance._previous_collection_id = Product.objects.filter(pk=instance.pk) \
+        .values_list('collection_id', flat=True).first() if instance.pk else None
+
+
+@receiver(post_save, sender=Product)
+def count_product_in_collection(sender, instance: Product, **kwargs):
+    previous = instance._previous_collection_id
+    if previous == instance.collection_id:
+        return
+    adjust_products_count({previous: -1, instance.collection_id: 1} if previous else {instance.collection_id: 1})
+
+
+@receiver(post_delete, sender=Product)
+def uncount_product_in_collection(sender, instance: Product, **kwargs):
+    adjust_products_count({instance.collection_id: -1})
+
+
+@receiver(pre_save, sender=Review)
+def track_review_rating(sender, instance: Review, **kwargs):
+    instance._previous_rating = Review.objects.filter(pk=instance.pk) \
+        .values_list('product_id', 'rating').first() if instance.pk else None
+
+
+@receiver(post_save, sender=Review)
+def add_review_to_product_rating(sender, instance: Review, **kwargs):
+    previous = instance._previous_rating
+    if previous == (instance.product_id, instance.rating):
+        return
+    if previous:
+        ratings.apply_review_rating(*previous, -1)
+    ratings.apply_review_rating(instance.product_id, instance.rating, 1)
+
+
+@receiver(post_delete, sender=Review)
+def remove_review_from_product_rating(sender, instance: Review, **kwargs):
+    ratings.apply_review_rating(instance.product_id, instance.rating, -1)
+
+
+@receiver(pre_save, sender=Order)
+def track_order_payment_status(sender, instance: Order, update_fields=None, **kwargs):
+    instance._previous_payment_status = None
+    if instance.pk and (update_fields is None or 'payment_status' in update_fields):
+        instance._previous_payment_status = Order.objects.filter(pk=instance.pk) \
+            .values_list('payment_status', flat=True).first()
+
+
+@receiver(post_save, sender=Order)
+def move_order_between_paid_rollups(sender, instance: Order, **kwargs):
+    previous = instance._previous_payment_status
+    if previous and previous != instance.payment_status:
+        rollups.record_payment_changes({instance.pk: previous}, instance.payment_status)
+
+
+@receiver(post_save, sender=Order)
+def count_customer_order(sender, instance: Order, created, **kwargs):
+    paid = instance.payment_status == Order.status_complete
+    if created:
+        adjust_customer_stats({instance.customer_id: (1, instance.total or 0 if paid else 0)})
+        return
+    previous = instance._previous_payment_status
+    if previous and (previous == Order.status_complete) != paid:
+        adjust_customer_stats({instance.customer_id: (0, (instance.total or 0) * (1 if paid else -1))})
+
+
+@receiver(post_delete, sender=Order)
+def uncount_customer_order(sender, instance: Order, **kwargs):
+    paid = instance.payment_status == Order.status_complete
+    adjust_customer_stats({instance.customer_id: (-1, -(instance.total or 0) if paid else 0)})
+
+
+@receiver(orders_transitioned)
+def move_transitioned_orders_between_paid_rollups(sender, changes, previous, **kwargs):
+    if 'payment_status' in changes:
+        rollups.record_payment_changes(
+            {order_id: statuses['payment_status'] for order_id, statuses in previous.items()},
+            changes['payment_status'])
+
+
+@receiver(orders_transitioned)
+def move_transitioned_orders_spend(sender, changes, previous, **kwargs):
+    if 'payment_status' not in changes:
+        return
+    paid = changes['payment_status'] == Order.status_complete
+    crossing = [order_id for order_id, statuses in previous.items()
+                if (statuses['payment_status'] == Order.status_complete) != paid]
+    adjust_customer_stats({
+        customer_id: (0, spend if paid else -spend) for customer_id, spend in spend_by_customer(crossing).items()
+    })
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def bump_product_version(sender, instance: Product, **kwargs):
+    versioning.bump(
+        *versioning.product_keys(instance.pk),
+        'collection', f'collection:{instance.collection_id}'
+    )
+
+
+@receiver(m2m_changed, sender=Product.promotions.through)
+def bump_version_on_promotions_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ['post_add', 'post_remove', 'post_clear']:
+        return
+    if not reverse:
+        product_ids = [instance.pk]
+    elif action == 'post_clear':
+        # collected by refresh_price_schedule_on_promotions_change on pre_clear
+        product_ids = instance._cleared_product_ids
+    else:
+        product_ids = pk_set
+    versioning.bump(*versioning.product_keys(*product_ids))
+
+
+@receiver(post_save, sender=Stock)
+@receiver(post_delete, sender=Stock)
+def bump_stock_version(sender, instance: Stock, **kwargs):
+    versioning.bump(*versioning.stock_keys(instance.product_id))
+
+
+@receiver(post_save, sender=Promotion)
+@receiver(post_delete, sender=Promotion)
+def bump_promotion_version(sender, instance: Promotion, **kwargs):
+    versioning.bump('promotion', f'promotion:{instance.pk}', 'product', 'collection')
+
+
+@receiver(post_save, sender=Collection)
+@receiver(post_delete, sender=Collection)
+def bump_collection_version(sender, instance: Collection, **kwargs):
+    versioning.bump('collection', f'collection:{instance.pk}', 'product')
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def bump_review_version(sender, instance: Review, **kwargs):
+    versioning.bump(*versioning.product_keys(instance.product_id))
@@ -0,0 +1,92 @@
+import hashlib
+import json
+import time
+from datetime import timedelta
+from decimal import Decimal
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from . import models
+
+# longest key accepted, clients usually send a UUID
+MAX_KEY_LENGTH = 255
+# seconds a request keeps its key before a duplicate may take it over
+LOCK_TIMEOUT = 60
+BATCH_SIZE = 1000
+
+
+def get_ttl():
+    return timedelta(seconds=getattr(settings, 'IDEMPOTENCY_KEY_TTL', 60 * 60 * 24))
+
+
+def record_key(scope, key):
+    return hashlib.sha1(repr((scope, key)).encode()).hexdigest()
+
+
+def fingerprint(body):
+    return hashlib.sha1(body).hexdigest()
+
+
+def claim(record_key, fingerprint, wait):
+    # returns the (request fingerprint, status code, response data) recorded
+    # for the key, or None with whether the key was taken within `wait`
+    # seconds, the unique key makes a single request win across workers
+    deadline = time.monotonic() + wait
+    while True:
+        record, acquired = _try_claim(record_key, fingerprint)
+        if record is not None or acquired or time.monotonic() >= deadline:
+            return record, acquired
+        time.sleep(0.01)
+
+
+def _try_claim(record_key, fingerprint):
+    now = timezone.now()
+    values = {'fingerprint': fingerprint, 'locked_until': now + timedelta(seconds=LOCK_TIMEOUT),
+              'expires_at': now + get_ttl()}
+    record = models.IdempotencyRecord.objects.filter(pk=record_key) \
+        .values_list('fingerprint', 'status_code', 'body', 'locked_until', 'expires_at').first()
+    if record is None:
+        try:
+            with transaction.atomic():
+                models.IdempotencyRecord.objects.create(key=record_key, **values)
+            return None, True
+        except IntegrityError:
+            return None, False
+
+    recorded_fingerprint, status_code, body, locked_until, expires_at = record
+    if expires_at > now and status_code is not None:
+        return (recorded_fingerprint, status_code,
+                json.loads(body, parse_float=Decimal) if body is not None else None), False
+    if expires_at > now and locked_until > now:
+        return None, False
+    # a lapsed record, or one whose request died holding the key, is taken over
+    taken = models.IdempotencyRecord.objects \
+        .filter(Q(expires_at__lte=now) | Q(status_code__isnull=True, locked_until__lte=now), pk=record_key) \
+        .update(status_code=None, body=None, **values)
+    return None, bool(taken)
+
+
+def save(record_key, status_code, data):
+    models.IdempotencyRecord.objects.filter(pk=record_key).update(
+        status_code=status_code,
+        body=JSONRenderer().render(data).decode() if data is not None else None)
+
+
+def release(record_key):
+    # frees the key of a request that recorded nothing so a retry runs again
+    models.IdempotencyRecord.objects.filter(pk=record_key, status_code__isnull=True).delete()
+
+
+def expire(batch_size=BATCH_SIZE):
+    # deletes lapsed records a batch at a time, they are already ignored
+    now = timezone.now()
+    expired = 0
+    while True:
+        batch = list(models.IdempotencyRecord.objects
+                     .filter(expires_at__lte=now).order_by('expires_at')
+                     .values_list('pk', flat=True)[:batch_size])
+        if not batch:
+            return expired
+        expired += models.IdempotencyRecord.objects.filter(pk__in=batch).delete()[0]
@@ -0,0 +1,186 @@
+import csv
+import json
+from concurrent.futures import ProcessPoolExecutor
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import identify_hasher, make_password
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils.dateparse import parse_date
+from . import models
+
+BATCH_SIZE = 1000
+FORMATS = ['csv', 'json', 'jsonl']
+
+
+def read_rows(file, file_format):
+    # yields (row number, row) without loading the file, json is an array
+    # of objects and jsonl one object per line, a row that can not be
+    # decoded comes as the ValidationError reported for it
+    if file_format == 'csv':
+        reader = csv.DictReader(file)
+        for row in reader:
+            yield reader.line_num, row
+    elif file_format == 'jsonl':
+        for number, line in enumerate(file, start=1):
+            if line.strip():
+                try:
+                    yield number, json.loads(line)
+                except json.JSONDecodeError as error:
+                    yield number, invalid_json(error)
+    else:
+        number = 0
+        try:
+            for number, row in enumerate(iter_json_array(file), start=1):
+                yield number, row
+        except ValueError as error:
+            # the items after a broken one can not be told apart
+            yield number + 1, invalid_json(error)
+
+
+def invalid_json(error):
+    return ValidationError({'row': f'Invalid JSON: {error}'})
+
+
+def iter_json_array(file, chunk_size=1 << 16):
+    decoder = json.JSONDecoder()
+    buffer = file.read(chunk_size).lstrip()
+    if not buffer.startswith('['):
+        raise ValueError('expected a JSON array')
+    buffer = buffer[1:]
+    while True:
+        buffer = buffer.lstrip().lstrip(',').lstrip()
+        if buffer.startswith(']'):
+            return
+        try:
+            item, end = decoder.raw_decode(buffer)
+        except json.JSONDecodeError:
+            chunk = file.read(chunk_size)
+            if not chunk:
+                raise
+            buffer += chunk
+            continue
+        yield item
+        buffer = buffer[end:]
+        if len(buffer) < chunk_size:
+            buffer += file.read(chunk_size)
+
+
+def build(row):
+    # a user and customer from a row, not saved, with the password to hash
+    # or None when the row is done with it
+    if isinstance(row, ValidationError):
+        raise row
+    if not isinstance(row, dict):
+        raise ValidationError({'row': 'Expected an object'})
+    User = get_user_model()
+    row = {key: (value.strip() if isinstance(value, str) else value) for key, value in row.items() if value != ''}
+    user = User(
+        username=User.normalize_username(row.get('username', '')),
+        email=User.objects.normalize_email(row.get('email', '')),
+        first_name=row.get('first_name', ''),
+        last_name=row.get('last_name', ''),
+    )
+    password = None
+    if row.get('password_hash'):
+        try:
+            identify_hasher(row['password_hash'])
+        except ValueError:
+            raise ValidationError({'password_hash': 'Unknown password hash format'})
+        user.password = row['password_hash']
+    elif row.get('password'):
+        password = row['password']
+    else:
+        user.password = make_password(None)
+    user.clean_fields(exclude=['password'])
+
+    birth_date = row.get('birth_date')
+    if birth_date is not None:
+        birth_date = parse_date(str(birth_date))
+        if birth_date is None:
+            raise ValidationError({'birth_date': 'Use the YYYY-MM-DD format'})
+    customer = models.Customer(
+        phone=row.get('phone'), birth_date=birth_date,
+        membership=row.get('membership', models.Customer.membership_bronze))
+    customer.clean_fields(exclude=['customer'])
+    return user, customer, password
+
+
+def import_batch(rows, pool=None):
+    # returns the number of users created and the (row number, message) of
+    # the rows that were not
+    User = get_user_model()
+    errors = []
+    built = []
+    usernames, emails = set(), set()
+    for number, row in rows:
+        try:
+            user, customer, password = build(row)
+        except ValidationError as error:
+            errors.append((number, '; '.join(
+                f'{field}: {" ".join(messages)}' for field, messages in error.message_dict.items())))
+            continue
+        if user.username in usernames or user.email in emails:
+            errors.append((number, 'duplicates an earlier row'))
+            continue
+        usernames.add(user.username)
+        emails.add(user.email)
+        built.append((number, user, customer, password))
+
+    # one query finds the rows clashing with accounts already there
+    taken = list(User.objects.filter(Q(username__in=usernames) | Q(email__in=emails))
+                 .values_list('username', 'email'))
+    taken_usernames = {username for username, _ in taken}
+    taken_emails = {email for _, email in taken}
+    accepted = []
+    for number, user, customer, password in built:
+        if user.username in taken_usernames or user.email in taken_emails:
+            errors.append((number, 'username or email already exists'))
+        else:
+            accepted.append((number, user, customer, password))
+
+    to_hash = [(user, password) for _, user, _, password in accepted if password is not None]
+    hashed = (pool.map(make_password, [password for _, password in to_hash], chunksize=64) if pool
+              else map(make_password, [password for _, password in to_hash]))
+    for (user, _), password in zip(to_hash, hashed):
+        user.password = password
+
+    users = [user for _, user, _, _ in accepted]
+    try:
+        with transaction.atomic():
+            # bulk_create sends no post_save, so the per-user customer signal
+            # stays out of the way and the customers are inserted here
+            User.objects.bulk_create(users, batch_size=BATCH_SIZE)
+            if any(user.pk is None for user in users):
+                pks = dict(User.objects.filter(username__in=[user.username for user in users])
+                           .values_list('username', 'pk'))
+                for user in users:
+                    user.pk = pks[user.username]
+            customers = []
+            for _, user, customer, _ in accepted:
+                customer.customer_id = user.pk
+                customers.append(customer)
+            models.Customer.objects.bulk_create(customers, batch_size=BATCH_SIZE)
+    except IntegrityError as error:
+        # an account created meanwhile, the whole batch is reported as failed
+        errors.extend((number, f'not imported: {error}') for number, _, _, _ in accepted)
+        return 0, sorted(errors)
+    return len(users), sorted(errors)
+
+
+def import_customers(rows, batch_size=BATCH_SIZE, workers=0):
+    # yields (imported, errors) per batch of rows, passwords are hashed in a
+    # pool of worker processes when workers is above 0
+    pool = ProcessPoolExecutor(max_workers=workers) if workers else None
+    try:
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) == batch_size:
+                yield import_batch(batch, pool)
+                batch = []
+        if batch:
+            yield import_batch(batch, pool)
+    finally:
+        if pool:
+            pool.shutdown()
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from store import orders
+
+
+class Command(BaseCommand):
+    help = 'Persist line sub totals and order totals of orders placed before they were stored'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        updated = 0
+        for batch in orders.backfill_totals(options['batch_size']):
+            updated += batch
+            if options['verbosity'] > 1:
+                self.stdout.write(f'{updated} orders')
+        self.stdout.write(self.style.SUCCESS(
+            f'stored the totals of {updated} orders'))
@@ -0,0 +1,73 @@
+from datetime import timedelta
+from decimal import Decimal
+from time import perf_counter
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import RequestFactory
+from django.utils import timezone
+from rest_framework.request import Request
+from store import fastpath, models, serializers
+
+
+class Command(BaseCommand):
+    help = 'Compare the per-row cost of the product serializer and the compiled fast path'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=500)
+        parser.add_argument('--rounds', type=int, default=5)
+
+    def handle(self, *args, **options):
+        # the sample catalog is rolled back once measured
+        with transaction.atomic():
+            self.create_catalog(options['rows'])
+            request = Request(RequestFactory().get('/store/products/'))
+            queryset = models.Product.objects.with_effective_price() \
+                .select_related('collection', 'stock').prefetch_related('promotions')
+
+            # both sides start from rows already read from the database
+            context = {'request': request}
+            instances = list(queryset)
+            drf = self.measure(lambda: serializers.ProductSerializer(
+                instances, many=True, context=context).data, options)
+
+            at = timezone.now()
+            child = serializers.ProductSerializer(many=True, context=context).child
+            reader = fastpath.get_reader(child, queryset)
+            rows = reader.plan.attach(reader.values(queryset, at), at)
+            fast = self.measure(lambda: list(map(fastpath.get_reader(child, queryset).mapper, rows)), options)
+            transaction.set_rollback(True)
+
+        per_row = options['rows'] * options['rounds']
+        self.stdout.write(f'serializer  {drf / per_row * 1e6:8.1f} us/row')
+        self.stdout.write(f'fast path   {fast / per_row * 1e6:8.1f} us/row')
+        self.stdout.write(self.style.SUCCESS(f'{drf / fast:.1f}x faster'))
+
+    @staticmethod
+    def measure(function, options):
+        started = perf_counter()
+        for _ in range(options['rounds']):
+            function()
+        return perf_counter() - started
+
+    @staticmethod
+    def create_catalog(count):
+        now = timezone.now()
+        promotion = models.Promotion.objects.create(
+            title='benchmark', description='-', discount=0.1,
+            start_date=now, end_date=now + timedelta(days=1))
+        collection = models.Collection.objects.create(title='benchmark', promotion=promotion)
+        models.Product.objects.bulk_create([
+            models.Product(title=f'product {index}', slug=f'product-{index}', description='-',
+                           price=Decimal(index % 100 + 1), collection=collection)
+            for index in range(count)
+        ])
+        # read back since bulk_create leaves the primary keys unset on mysql
+        products = list(models.Product.objects.filter(collection=collection).order_by('pk'))
+        models.Stock.objects.bulk_create([
+            models.Stock(product=product, quantity_in_stock=index % 20, threshold=5)
+            for index, product in enumerate(products)
+        ])
+        # bulk_create priced the products from the collection's promotion
+        models.Product.promotions.through.objects.bulk_create([
+            models.Product.promotions.through(product=product, promotion=promotion) for product in products
+        ])
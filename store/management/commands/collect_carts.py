@@ -0,0 +1,29 @@
+from datetime import timedelta
+from time import perf_counter
+from django.core.management.base import BaseCommand
+from store import carts
+
+
+class Command(BaseCommand):
+    help = 'Delete carts abandoned for longer than ABANDONED_CART_DAYS'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=float)
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--pause', type=float, default=0.1, help='seconds to sleep between batches')
+
+    def handle(self, *args, **options):
+        max_age = timedelta(days=options['days']) if options['days'] is not None else carts.abandoned_after()
+        started = perf_counter()
+        total_carts = total_items = 0
+        for batch, (deleted_carts, deleted_items) in enumerate(
+                carts.collect_abandoned(max_age, options['batch_size'], options['pause']), start=1):
+            total_carts += deleted_carts
+            total_items += deleted_items
+            if options['verbosity'] > 1:
+                self.stdout.write(f'batch {batch}: {deleted_carts} carts, {deleted_items} items')
+
+        elapsed = perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'deleted {total_carts} carts and {total_items} items in {elapsed:.1f}s '
+            f'({total_carts / elapsed if elapsed else 0:.0f} carts/s)'))
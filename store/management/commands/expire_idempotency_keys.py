@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from store import idempotency
+
+
+class Command(BaseCommand):
+    help = 'Delete lapsed Idempotency-Key records'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=idempotency.BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        expired = idempotency.expire(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'expired {expired} idempotency keys'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from store import reservations
+
+
+class Command(BaseCommand):
+    help = 'Delete lapsed stock reservations'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=reservations.BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        expired = reservations.expire(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'expired {expired} reservations'))
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+from store import exports, filters, models
+
+
+class Command(BaseCommand):
+    help = 'Stream orders with their lines as CSV or NDJSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=list(exports.FORMATS), default='csv')
+        parser.add_argument('--output', help='file to write, standard output by default')
+        parser.add_argument('--placed-after', help='placed at or after this date or time')
+        parser.add_argument('--placed-before', help='placed before this date or time')
+        parser.add_argument('--order-status', choices=[value for value, _ in models.Order.order_status_choices])
+        parser.add_argument('--payment-status', choices=[value for value, _ in models.Order.payment_status_choices])
+        parser.add_argument('--batch-size', type=int, default=exports.BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        order_filter = filters.OrderFilter({
+            'placed_at__gte': options['placed_after'],
+            'placed_at__lt': options['placed_before'],
+            'order_status': options['order_status'],
+            'payment_status': options['payment_status']
+        }, models.Order.objects.all())
+        if not order_filter.is_valid():
+            raise CommandError(order_filter.errors.as_text())
+
+        chunks, _ = exports.FORMATS[options['format']]
+        chunks = chunks(order_filter.qs, options['batch_size'])
+        if not options['output']:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
+            return
+        with open(options['output'], 'w', newline='') as output:
+            output.writelines(chunks)
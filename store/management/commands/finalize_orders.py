@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from store import orders
+
+
+class Command(BaseCommand):
+    help = 'Finalize queued orders left behind by stopped workers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+
+    def handle(self, *args, **options):
+        finalized = orders.finalize_queued(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'finalized {finalized} orders'))
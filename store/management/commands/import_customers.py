@@ -0,0 +1,39 @@
+import os
+from time import perf_counter
+from django.core.management.base import BaseCommand, CommandError
+from store import imports
+
+
+class Command(BaseCommand):
+    help = 'Import users with their customer profiles in batches from a CSV, JSON or JSON lines file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=imports.FORMATS,
+                            help='read from the file extension by default')
+        parser.add_argument('--batch-size', type=int, default=imports.BATCH_SIZE)
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help='processes hashing plain passwords, 0 hashes in this one')
+
+    def handle(self, *args, **options):
+        file_format = options['format'] or os.path.splitext(options['path'])[1].lstrip('.').lower()
+        if file_format not in imports.FORMATS:
+            raise CommandError(f'unknown format {file_format!r}, pass --format')
+
+        started = perf_counter()
+        imported = failed = 0
+        with open(options['path'], newline='', encoding='utf-8') as file:
+            rows = imports.read_rows(file, file_format)
+            for batch, errors in imports.import_customers(rows, options['batch_size'], options['workers']):
+                imported += batch
+                failed += len(errors)
+                for number, message in errors:
+                    self.stderr.write(f'row {number}: {message}')
+                if options['verbosity'] > 1:
+                    elapsed = perf_counter() - started
+                    self.stdout.write(f'{imported} imported, {imported / elapsed if elapsed else 0:.0f} rows/s')
+
+        elapsed = perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'imported {imported} customers, {failed} rows failed, in {elapsed:.1f}s '
+            f'({(imported + failed) / elapsed if elapsed else 0:.0f} rows/s)'))
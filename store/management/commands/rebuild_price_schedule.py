@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from store import models, pricing
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the precomputed product price schedule'
+
+    def add_arguments(self, parser):
+        parser.add_argument('product_ids', nargs='*', type=int)
+        parser.add_argument(
+            '--prune', action='store_true',
+            help='only drop segments that ended in the past')
+
+    def handle(self, *args, **options):
+        if options['prune']:
+            deleted, _ = models.ProductPriceSegment.objects \
+                .filter(valid_to__lte=timezone.now()).delete()
+            self.stdout.write(f'pruned {deleted} expired price segments')
+            return
+
+        product_ids = options['product_ids'] or \
+            models.Product.objects.order_by('pk').values_list('pk', flat=True)
+        pricing.rebuild_price_schedule(product_ids)
+        self.stdout.write(self.style.SUCCESS(
+            f'rebuilt price schedule for {len(product_ids)} products'))
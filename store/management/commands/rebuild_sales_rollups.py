@@ -0,0 +1,19 @@
+from datetime import date
+from time import perf_counter
+from django.core.management.base import BaseCommand
+from store import rollups
+
+
+class Command(BaseCommand):
+    help = 'Recompute the daily product and collection sales rollups from the order lines'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', type=date.fromisoformat, help='first day to rebuild, YYYY-MM-DD')
+        parser.add_argument('--end', type=date.fromisoformat, help='last day to rebuild, YYYY-MM-DD')
+        parser.add_argument('--batch-size', type=int, default=rollups.BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        started = perf_counter()
+        written = rollups.rebuild(options['start'], options['end'], options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'wrote {written} rollup rows in {perf_counter() - started:.1f}s'))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from store import models, search
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the product search index'
+
+    def add_arguments(self, parser):
+        parser.add_argument('product_ids', nargs='*', type=int)
+
+    def handle(self, *args, **options):
+        product_ids = options['product_ids'] or \
+            models.Product.objects.order_by('pk').values_list('pk', flat=True)
+        search.index_products(product_ids)
+        self.stdout.write(self.style.SUCCESS(
+            f'indexed {len(product_ids)} products'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from store import models
+
+
+class Command(BaseCommand):
+    help = 'Repair the stored order count and lifetime spend of customers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('customer_ids', nargs='*', type=int)
+
+    def handle(self, *args, **options):
+        repaired = models.reconcile_customers(options['customer_ids'] or None)
+        self.stdout.write(self.style.SUCCESS(
+            f'repaired {repaired} customers'))
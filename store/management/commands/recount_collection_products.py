@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from store import models
+
+
+class Command(BaseCommand):
+    help = 'Repair the stored products count of collections'
+
+    def add_arguments(self, parser):
+        parser.add_argument('collection_ids', nargs='*', type=int)
+
+    def handle(self, *args, **options):
+        repaired = models.recount_products(options['collection_ids'] or None)
+        self.stdout.write(self.style.SUCCESS(
+            f'repaired {repaired} collections'))
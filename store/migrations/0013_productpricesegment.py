@@ -0,0 +1,136 @@
+# Generated by Django 4.2.7 on 2026-10-18 01:39
+
+from django.db import migrations, models
+from datetime import timedelta
+
+import django.db.models.deletion
+
+# a copy of store.pricing as of this migration, so later changes to the
+# app code do not change what it does
+TICK = timedelta(microseconds=1)
+
+
+def build_segments(promotions, collection_promotion=None):
+    candidates = list(promotions)
+    if collection_promotion:
+        candidates.append(collection_promotion)
+
+    boundaries = sorted(
+        {start for _, _, start, _ in candidates}
+        | {end + TICK for _, _, _, end in candidates}
+    )
+
+    segments = []
+    for index, valid_from in enumerate(boundaries):
+        valid_to = boundaries[index + 1] if index + 1 < len(boundaries) else None
+        active = [
+            (promotion_id, discount)
+            for promotion_id, discount, start, end in promotions
+            if start <= valid_from <= end
+        ]
+        if active:
+            promotion_id, discount = min(active, key=lambda item: (-item[1], item[0]))
+        elif (
+            collection_promotion
+            and collection_promotion[2] <= valid_from <= collection_promotion[3]
+        ):
+            promotion_id, discount = collection_promotion[:2]
+        else:
+            promotion_id, discount = None, None
+
+        if segments and segments[-1][2:] == (promotion_id, discount):
+            segments[-1] = (segments[-1][0], valid_to, promotion_id, discount)
+        else:
+            segments.append((valid_from, valid_to, promotion_id, discount))
+
+    return segments
+
+
+def build_price_schedule(apps, schema_editor):
+    Product = apps.get_model("store", "Product")
+    Promotion = apps.get_model("store", "Promotion")
+    ProductPriceSegment = apps.get_model("store", "ProductPriceSegment")
+
+    promotions = {
+        promotion[0]: promotion
+        for promotion in Promotion.objects.values_list(
+            "pk", "discount", "start_date", "end_date"
+        )
+    }
+    product_promotions = {}
+    for product_id, promotion_id in Product.promotions.through.objects.values_list(
+        "product_id", "promotion_id"
+    ):
+        product_promotions.setdefault(product_id, []).append(promotions[promotion_id])
+
+    segments = [
+        ProductPriceSegment(
+            product_id=product_id,
+            valid_from=valid_from,
+            valid_to=valid_to,
+            promotion_id=promotion_id,
+            discount=discount,
+        )
+        for product_id, collection_promotion_id in Product.objects.values_list(
+            "pk", "collection__promotion_id"
+        ).iterator()
+        for valid_from, valid_to, promotion_id, discount in build_segments(
+            product_promotions.get(product_id, []),
+            promotions.get(collection_promotion_id),
+        )
+    ]
+    ProductPriceSegment.objects.bulk_create(segments, batch_size=500)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("store", "0012_alter_cartitem_quantity"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ProductPriceSegment",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("discount", models.FloatField(blank=True, null=True)),
+                ("valid_from", models.DateTimeField()),
+                ("valid_to", models.DateTimeField(blank=True, null=True)),
+                (
+                    "product",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="price_segments",
+                        to="store.product",
+                    ),
+                ),
+                (
+                    "promotion",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="store.promotion",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["product", "valid_from"],
+                "indexes": [
+                    models.Index(
+                        fields=["product", "valid_from"],
+                        name="store_produ_product_76c4e4_idx",
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(build_price_schedule, migrations.RunPython.noop),
+    ]
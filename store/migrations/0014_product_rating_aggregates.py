@@ -0,0 +1,59 @@
+# Generated by Django 4.2.7 on 2026-10-18 01:40
+
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def aggregate_reviews(apps, schema_editor):
+    Product = apps.get_model("store", "Product")
+    Review = apps.get_model("store", "Review")
+
+    aggregates = {}
+    for product_id, rating, count in (
+        Review.objects.order_by()
+        .values_list("product_id", "rating")
+        .annotate(count=Count("id"))
+    ):
+        num_reviews, rating_total, histogram = aggregates.setdefault(
+            product_id, [0, Decimal(0), {}]
+        )
+        aggregates[product_id] = [
+            num_reviews + count,
+            rating_total + Decimal(rating) * count,
+            {**histogram, rating: count},
+        ]
+
+    for product_id, (num_reviews, rating_total, histogram) in aggregates.items():
+        Product.objects.filter(pk=product_id).update(
+            num_reviews=num_reviews,
+            rating_total=rating_total,
+            rating_histogram=histogram,
+        )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("store", "0013_productpricesegment"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="product",
+            name="num_reviews",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="product",
+            name="rating_histogram",
+            field=models.JSONField(default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name="product",
+            name="rating_total",
+            field=models.DecimalField(
+                decimal_places=1, default=0, editable=False, max_digits=9
+            ),
+        ),
+        migrations.RunPython(aggregate_reviews, migrations.RunPython.noop),
+    ]
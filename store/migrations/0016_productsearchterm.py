@@ -0,0 +1,96 @@
+# Generated by Django 4.2.7 on 2026-10-18 01:42
+
+from django.db import migrations, models
+import re
+from collections import Counter
+
+import django.db.models.deletion
+
+# a copy of store.search as of this migration, so later changes to the app
+# code do not change what it does
+TOKEN_PATTERN = re.compile(r"\w+")
+MAX_TERM_LENGTH = 64
+MAX_DESCRIPTION_OCCURRENCES = 3
+FIELD_WEIGHTS = {"title": 10, "collection_title": 4, "slug": 2, "description": 1}
+
+
+def tokenize(text):
+    return [
+        token[:MAX_TERM_LENGTH] for token in TOKEN_PATTERN.findall((text or "").lower())
+    ]
+
+
+def product_terms(title, slug, description, collection_title):
+    weights = Counter()
+    for field, text in [
+        ("title", title),
+        ("slug", slug),
+        ("collection_title", collection_title),
+    ]:
+        for term in set(tokenize(text)):
+            weights[term] += FIELD_WEIGHTS[field]
+
+    for term, occurrences in Counter(tokenize(description)).items():
+        weights[term] += FIELD_WEIGHTS["description"] * min(
+            occurrences, MAX_DESCRIPTION_OCCURRENCES
+        )
+    return weights
+
+
+def index_products(apps, schema_editor):
+    Product = apps.get_model("store", "Product")
+    ProductSearchTerm = apps.get_model("store", "ProductSearchTerm")
+
+    products = Product.objects.values_list(
+        "pk", "title", "slug", "description", "collection__title"
+    )
+    ProductSearchTerm.objects.bulk_create(
+        (
+            ProductSearchTerm(product_id=product_id, term=term, weight=weight)
+            for product_id, *fields in products.iterator()
+            for term, weight in product_terms(*fields).items()
+        ),
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("store", "0015_keyset_pagination_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ProductSearchTerm",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("term", models.CharField(max_length=64)),
+                ("weight", models.PositiveIntegerField()),
+                (
+                    "product",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="search_terms",
+                        to="store.product",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["term", "product", "weight"],
+                        name="store_produ_term_773882_idx",
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(index_products, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.7 on 2026-10-18 01:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("store", "0016_productsearchterm"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ResourceVersion",
+            fields=[
+                (
+                    "key",
+                    models.CharField(max_length=100, primary_key=True, serialize=False),
+                ),
+                ("version", models.PositiveBigIntegerField(default=0)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="productpricesegment",
+            index=models.Index(
+                fields=["valid_from"], name="store_produ_valid_f_1b0900_idx"
+            ),
+        ),
+    ]
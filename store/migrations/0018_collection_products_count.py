@@ -0,0 +1,37 @@
+# Generated by Django 4.2.7 on 2026-10-18 01:55
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def count_products(apps, schema_editor):
+    Collection = apps.get_model("store", "Collection")
+    Product = apps.get_model("store", "Product")
+
+    for collection_id, count in (
+        Product.objects.order_by()
+        .values_list("collection_id")
+        .annotate(count=Count("id"))
+    ):
+        Collection.objects.filter(pk=collection_id).update(products_count=count)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("store", "0017_resourceversion"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="collection",
+            name="products_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name="collection",
+            index=models.Index(
+                fields=["products_count", "id"], name="store_colle_product_474de8_idx"
+            ),
+        ),
+        migrations.RunPython(count_products, migrations.RunPython.noop),
+    ]
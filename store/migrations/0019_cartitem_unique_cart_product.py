@@ -0,0 +1,35 @@
+# Generated by Django 4.2.7 on 2026-10-18 01:58
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def merge_duplicate_lines(apps, schema_editor):
+    CartItem = apps.get_model("store", "CartItem")
+
+    for line in (
+        CartItem.objects.order_by()
+        .values("cart_id", "product_id")
+        .annotate(lines=Count("id"), kept=Min("id"), quantity=Sum("quantity"))
+        .filter(lines__gt=1)
+    ):
+        CartItem.objects.filter(
+            cart_id=line["cart_id"], product_id=line["product_id"]
+        ).exclude(pk=line["kept"]).delete()
+        CartItem.objects.filter(pk=line["kept"]).update(quantity=line["quantity"])
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("store", "0018_collection_products_count"),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_lines, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="cartitem",
+            constraint=models.UniqueConstraint(
+                fields=("cart", "product"), name="unique_cart_product"
+            ),
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 4.2.7 on 2026-10-18 02:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("store", "0019_cartitem_unique_cart_product"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="StockReservation",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("cart_id", models.UUIDField()),
+                ("quantity", models.PositiveIntegerField()),
+                ("expires_at", models.DateTimeField()),
+                (
+                    "product",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="reservations",
+                        to="store.product",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["product", "expires_at", "quantity"],
+                        name="store_stock_product_254e3f_idx",
+                    ),
+                    models.Index(
+                        fields=["expires_at"], name="store_stock_expires_f1477d_idx"
+                    ),
+                    models.Index(
+                        fields=["cart_id"], name="store_stock_cart_id_172fff_idx"
+                    ),
+                ],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="stockreservation",
+            constraint=models.UniqueConstraint(
+                fields=("product", "cart_id"), name="unique_product_cart_reservation"
+            ),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.7 on 2026-10-18 02:00
+
+from django.db import migrations, models
+from django.db.models import F
+import django.utils.timezone
+
+
+def start_from_creation(apps, schema_editor):
+    Cart = apps.get_model("store", "Cart")
+    Cart.objects.update(last_activity=F("created_at"))
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("store", "0020_stockreservation"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="cart",
+            name="last_activity",
+            field=models.DateTimeField(
+                db_index=True, default=django.utils.timezone.now
+            ),
+        ),
+        migrations.RunPython(start_from_creation, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 4.2.7 on 2026-10-18 02:05
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("store", "0021_cart_last_activity"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="order",
+            name="cart_id",
+            field=models.UUIDField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="order",
+            name="processing_error",
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name="order",
+            name="processing_status",
+            field=models.CharField(
+                choices=[("Q", "Queued"), ("D", "Finalized"), ("F", "Failed")],
+                default="D",
+                max_length=1,
+            ),
+        ),
+        migrations.AlterField(
+            model_name="orderitem",
+            name="unit_price",
+            field=models.DecimalField(
+                decimal_places=2,
+                max_digits=6,
+                null=True,
+                validators=[django.core.validators.MinValueValidator(0.1)],
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="order",
+            index=models.Index(
+                fields=["processing_status", "id"],
+                name="store_order_process_0ac995_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,108 @@
+# Generated by Django 4.2.7 on 2026-10-18 02:10
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("store", "0023_order_totals"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CollectionDailySales",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("day", models.DateField()),
+                ("units", models.PositiveIntegerField(default=0)),
+                (
+                    "revenue",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=14),
+                ),
+                ("orders", models.PositiveIntegerField(default=0)),
+                ("paid_units", models.PositiveIntegerField(default=0)),
+                (
+                    "paid_revenue",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=14),
+                ),
+                ("paid_orders", models.PositiveIntegerField(default=0)),
+                (
+                    "collection",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="daily_sales",
+                        to="store.collection",
+                    ),
+                ),
+            ],
+        ),
+        migrations.CreateModel(
+            name="ProductDailySales",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("day", models.DateField()),
+                ("units", models.PositiveIntegerField(default=0)),
+                (
+                    "revenue",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=14),
+                ),
+                ("orders", models.PositiveIntegerField(default=0)),
+                ("paid_units", models.PositiveIntegerField(default=0)),
+                (
+                    "paid_revenue",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=14),
+                ),
+                ("paid_orders", models.PositiveIntegerField(default=0)),
+                (
+                    "product",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="daily_sales",
+                        to="store.product",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["product", "day"], name="store_produ_product_69898d_idx"
+                    )
+                ],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="productdailysales",
+            constraint=models.UniqueConstraint(
+                fields=("day", "product"), name="unique_product_daily_sales"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="collectiondailysales",
+            index=models.Index(
+                fields=["collection", "day"], name="store_colle_collect_335fa1_idx"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="collectiondailysales",
+            constraint=models.UniqueConstraint(
+                fields=("day", "collection"), name="unique_collection_daily_sales"
+            ),
+        ),
+    ]
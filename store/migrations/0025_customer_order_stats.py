@@ -0,0 +1,66 @@
+# Generated by Django 4.2.7 on 2026-10-18 02:14
+
+from django.db import migrations, models
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Sum
+
+
+def count_orders(apps, schema_editor):
+    # spend is summed from the order lines, the totals of orders placed
+    # before 0023 are only filled by the backfill_order_totals command
+    Customer = apps.get_model("store", "Customer")
+    Order = apps.get_model("store", "Order")
+    OrderItem = apps.get_model("store", "OrderItem")
+
+    spend = dict(
+        OrderItem.objects.filter(order__payment_status="C")
+        .order_by()
+        .values_list("order__customer_id")
+        .annotate(
+            spend=Sum(
+                ExpressionWrapper(
+                    F("unit_price") * F("quantity"),
+                    output_field=DecimalField(max_digits=14, decimal_places=2),
+                )
+            )
+        )
+    )
+    for customer_id, orders in (
+        Order.objects.order_by().values_list("customer_id").annotate(orders=Count("id"))
+    ):
+        Customer.objects.filter(pk=customer_id).update(
+            order_count=orders, lifetime_spend=spend.get(customer_id) or 0
+        )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("store", "0024_daily_sales"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="customer",
+            name="lifetime_spend",
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=14),
+        ),
+        migrations.AddField(
+            model_name="customer",
+            name="order_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name="customer",
+            index=models.Index(
+                fields=["lifetime_spend", "customer"],
+                name="store_custo_lifetim_866ae5_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="customer",
+            index=models.Index(
+                fields=["order_count", "customer"],
+                name="store_custo_order_c_5b3e48_idx",
+            ),
+        ),
+        migrations.RunPython(count_orders, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.2.7 on 2026-10-18 02:58
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("store", "0026_idempotency_records"),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name="review",
+            options={
+                "ordering": [
+                    "created_at",
+                    "is_updated",
+                    "updated_at",
+                    "customer__customer__first_name",
+                    "customer__customer__last_name",
+                ]
+            },
+        ),
+    ]
@@ -0,0 +1,120 @@
+from django.conf import settings
+from django.utils import timezone
+from django.utils.http import http_date, parse_http_date_safe, parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+from . import fastpath, idempotency, versioning
+
+
+class ConditionalGetMixin:
+    # views return the version keys their representation depends on, and the
+    # price segments it reflects, from get_version_keys / get_price_segments
+    def list(self, request, *args, **kwargs):
+        return self.respond_conditionally(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.respond_conditionally(super().retrieve, request, *args, **kwargs)
+
+    def get_version_keys(self):
+        raise NotImplementedError
+
+    def get_price_segments(self):
+        return None
+
+    def respond_conditionally(self, handler, request, *args, **kwargs):
+        self.version_state, last_modified = versioning.get_validators(
+            self.get_version_keys(), self.get_price_segments())
+        etag = versioning.vary(self.version_state, request.get_full_path(), request.META.get('HTTP_ACCEPT', ''))
+        headers = {'ETag': etag}
+        if last_modified:
+            headers['Last-Modified'] = http_date(last_modified.timestamp())
+
+        if self.is_not_modified(request, etag, last_modified):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+        response = handler(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            for header, value in headers.items():
+                response[header] = value
+        return response
+
+    def is_not_modified(self, request, etag, last_modified):
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        if if_none_match:
+            if if_none_match.strip() == '*':
+                # only matches a resource that exists, get_object raises 404
+                if (self.lookup_url_kwarg or self.lookup_field) in self.kwargs:
+                    self.get_object()
+                return True
+            return etag in parse_etags(if_none_match)
+
+        if_modified_since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+        return bool(last_modified and if_modified_since) and \
+            int(last_modified.timestamp()) <= if_modified_since
+
+
+class FastReadMixin:
+    # with STORE_FAST_READS on, list responses are built from .values() rows
+    # by a reader compiled from the serializer, serializers it can not
+    # compile fall back to the regular path
+    def list(self, request, *args, **kwargs):
+        if not getattr(settings, 'STORE_FAST_READS', False):
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset())
+        try:
+            reader = fastpath.get_reader(self.get_serializer(many=True).child, queryset)
+        except fastpath.Unsupported:
+            return super().list(request, *args, **kwargs)
+
+        at = timezone.now()
+        ordering = [field for field in queryset.query.order_by if isinstance(field, str)]
+        ordering += getattr(self, 'cursor_ordering', [])
+        queryset = reader.values(queryset, at, *[field.lstrip('-') for field in ordering])
+
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(reader.read(page, at))
+        return Response(reader.read(queryset, at))
+
+
+class IdempotencyMixin:
+    # a POST carrying an Idempotency-Key header runs once per key, user and
+    # path, retries get the recorded response back and concurrent duplicates
+    # wait for the first one, only responses returned by the handler are
+    # recorded so a request that raised runs again when retried
+    idempotency_wait = 10
+
+    def create(self, request, *args, **kwargs):
+        return self.respond_idempotently(super().create, request, *args, **kwargs)
+
+    def respond_idempotently(self, handler, request, *args, **kwargs):
+        key = request.META.get('HTTP_IDEMPOTENCY_KEY')
+        if not key:
+            return handler(request, *args, **kwargs)
+        if len(key) > idempotency.MAX_KEY_LENGTH:
+            return Response({'error': 'Idempotency-Key is too long'}, status=status.HTTP_400_BAD_REQUEST)
+
+        record_key = idempotency.record_key((request.user.pk, request.path), key)
+        fingerprint = idempotency.fingerprint(request.body)
+        record, acquired = idempotency.claim(record_key, fingerprint, self.idempotency_wait)
+        if record is not None:
+            recorded_fingerprint, status_code, data = record
+            if recorded_fingerprint != fingerprint:
+                return Response({'error': 'Idempotency-Key was used for another request'},
+                                status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+            return Response(data, status=status_code, headers={'Idempotent-Replayed': 'true'})
+        if not acquired:
+            return Response({'error': 'A request with this Idempotency-Key is in progress'},
+                            status=status.HTTP_409_CONFLICT)
+
+        try:
+            response = handler(request, *args, **kwargs)
+        except BaseException:
+            idempotency.release(record_key)
+            raise
+        if response.status_code < 500:
+            idempotency.save(record_key, response.status_code, response.data)
+        else:
+            idempotency.release(record_key)
+        return response
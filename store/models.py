@@ -1,5 +1,11 @@
+from collections import Counter
 from collections.abc import Iterable
-from django.db import models
+from django.db import connections, models, router, transaction
+from django.db.models import (
+    Case, Count, DecimalField, ExpressionWrapper, F, FloatField, IntegerField, OuterRef, Subquery, Sum, Value,
+    When
+)
+from django.db.models.functions import Coalesce
 from django.core.validators import MinLengthValidator, MinValueValidator
 from Shopify.settings import AUTH_USER_MODEL
 from decimal import Decimal
@@ -26,6 +32,10 @@ class Customer(models.Model):
 
     membership = models.CharField(
         max_length=1, choices=membership_status, default=membership_bronze)
+    # kept by the order signals, lifetime_spend sums the totals of the
+    # orders whose payment is complete
+    order_count = models.PositiveIntegerField(default=0)
+    lifetime_spend = models.DecimalField(max_digits=14, decimal_places=2, default=0)
 
     def __str__(self) -> str:
         return f'{self.customer.first_name} {self.customer.last_name}'
@@ -44,6 +54,10 @@ class Customer(models.Model):
 
     class Meta:
         ordering = ['customer__first_name', 'customer__last_name']
+        indexes = [
+            models.Index(fields=['lifetime_spend', 'customer']),
+            models.Index(fields=['order_count', 'customer'])
+        ]
 
 
 class Address(models.Model):
@@ -94,18 +108,192 @@ class Collection(models.Model):
         "Product", on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
     promotion = models.ForeignKey(
         Promotion, on_delete=models.SET_NULL, related_name='collection', null=True, blank=True)
+    products_count = models.PositiveIntegerField(default=0, editable=False)
 
     def __str__(self) -> str:
         return self.title
 
     class Meta:
         ordering = ['title']
+        indexes = [
+            models.Index(fields=['products_count', 'id'])
+        ]
 
     def save(self, *args, **kwargs):
         self.slug = slugify(self.title)
         super(Collection, self).save(*args, **kwargs)
 
 
+def adjust_products_count(deltas):
+    # deltas maps collection ids to the number of products gained or lost,
+    # collections moving by the same amount share one UPDATE
+    collections = {}
+    for collection_id, delta in deltas.items():
+        if delta:
+            collections.setdefault(delta, []).append(collection_id)
+
+    with transaction.atomic():
+        for delta, collection_ids in sorted(collections.items()):
+            Collection.objects.filter(pk__in=collection_ids) \
+                .update(products_count=F('products_count') + delta)
+
+
+def recount_products(collection_ids=None):
+    # repairs drifted counts and returns how many collections were off
+    from . import versioning
+    collections = Collection.objects.all()
+    if collection_ids is not None:
+        collections = collections.filter(pk__in=list(collection_ids))
+    counted = Coalesce(Subquery(
+        Product.objects.filter(collection=OuterRef('pk')).order_by()
+        .values('collection').annotate(products=Count('pk')).values('products')
+    ), 0)
+    drifted = list(collections.exclude(products_count=counted).values_list('pk', flat=True))
+    if not drifted:
+        return 0
+    repaired = Collection.objects.filter(pk__in=drifted).update(products_count=counted)
+    versioning.bump('collection', *(f'collection:{collection_id}' for collection_id in drifted))
+    return repaired
+
+
+def adjust_customer_stats(deltas, batch_size=500):
+    # deltas maps customer ids to the (orders, spend) they gained or lost,
+    # applied as one increment per batch of customers
+    deltas = [(customer_id, delta) for customer_id, delta in deltas.items() if any(delta)]
+    spend = DecimalField(max_digits=14, decimal_places=2)
+    with transaction.atomic():
+        for start in range(0, len(deltas), batch_size):
+            batch = deltas[start:start + batch_size]
+            Customer.objects.filter(pk__in=[customer_id for customer_id, _ in batch]).update(
+                order_count=F('order_count') + Case(
+                    *[When(pk=customer_id, then=Value(orders)) for customer_id, (orders, _) in batch],
+                    default=Value(0), output_field=IntegerField()),
+                lifetime_spend=F('lifetime_spend') + Case(
+                    *[When(pk=customer_id, then=Value(amount)) for customer_id, (_, amount) in batch],
+                    default=Value(0), output_field=spend)
+            )
+
+
+def spend_by_customer(order_ids):
+    # the summed totals of the given orders per customer, whatever their status
+    return {
+        customer_id: spend or 0
+        for customer_id, spend in Order.objects.filter(pk__in=list(order_ids)).order_by()
+        .values_list('customer').annotate(spend=Sum('total'))
+    }
+
+
+def reconcile_customers(customer_ids=None):
+    # repairs drifted order counts and spend, returns how many customers were off
+    customers = Customer.objects.all()
+    if customer_ids is not None:
+        customers = customers.filter(pk__in=list(customer_ids))
+    orders = Order.objects.filter(customer=OuterRef('pk')).order_by().values('customer')
+    counted = Coalesce(Subquery(orders.annotate(orders=Count('pk')).values('orders')), 0)
+    spent = Coalesce(
+        Subquery(orders.filter(payment_status=Order.status_complete)
+                 .annotate(spend=Sum('total')).values('spend')),
+        Value(Decimal(0)), output_field=DecimalField(max_digits=14, decimal_places=2))
+    return customers.exclude(order_count=counted, lifetime_spend=spent) \
+        .update(order_count=counted, lifetime_spend=spent)
+
+
+def upsert(objs, unique_fields, update_fields):
+    # bulk insert that overwrites update_fields on rows already holding the
+    # unique_fields, MySQL finds the conflicting key on its own
+    objs = list(objs)
+    if not objs:
+        return objs
+    model = type(objs[0])
+    options = {'update_conflicts': True, 'update_fields': update_fields}
+    if connections[router.db_for_write(model)].features.supports_update_conflicts_with_target:
+        options['unique_fields'] = unique_fields
+    return model.objects.bulk_create(objs, **options)
+
+
+def discounted_price(price, discount):
+    if discount is None:
+        return price
+    return price * Decimal(1 - discount)
+
+
+def price_segment_in_effect(product_ref='pk', at=None):
+    # prices are read from the precomputed schedule, the segment that starts
+    # last before `at` (defaults to now) is the one in effect
+    return ProductPriceSegment.objects.filter(
+        product=OuterRef(product_ref), valid_from__lte=at or timezone.now()
+    ).order_by('-valid_from')
+
+
+class ProductQuerySet(models.QuerySet):
+    # bulk writes skip the product signals, so they keep the collection
+    # product counts, price schedules, search terms and versions themselves
+    def bulk_create(self, objs, *args, **kwargs):
+        from . import pricing, search, versioning
+        objs = list(objs)
+        with transaction.atomic():
+            last_pk = self.model.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+            created = super().bulk_create(objs, *args, **kwargs)
+            collections = Counter(product.collection_id for product in created)
+            if kwargs.get('ignore_conflicts') or kwargs.get('update_conflicts'):
+                # which rows were inserted is unknown here
+                recount_products(collections)
+            else:
+                adjust_products_count(collections)
+
+            product_ids = [product.pk for product in created]
+            if None in product_ids:
+                # backends such as mysql leave the primary keys unset
+                product_ids = list(self.model.objects.filter(pk__gt=last_pk).values_list('pk', flat=True))
+            pricing.rebuild_price_schedule(product_ids)
+            search.index_products(product_ids)
+            versioning.bump(
+                *versioning.product_keys(*product_ids),
+                'collection', *(f'collection:{collection_id}' for collection_id in collections)
+            )
+        return created
+
+    def update(self, **kwargs):
+        if 'collection' not in kwargs and 'collection_id' not in kwargs:
+            return super().update(**kwargs)
+
+        # the moved products also take the new collection's promotion and
+        # title, which the product signals would otherwise rebuild
+        from . import pricing, search, versioning
+        with transaction.atomic():
+            moved = list(self.order_by().values_list('pk', 'collection_id'))
+            deltas = Counter()
+            for _, collection_id in moved:
+                deltas[collection_id] -= 1
+            updated = super().update(**kwargs)
+            collection = kwargs.get('collection_id', kwargs.get('collection'))
+            deltas[getattr(collection, 'pk', collection)] += updated
+            adjust_products_count(deltas)
+
+            product_ids = [product_id for product_id, _ in moved]
+            pricing.rebuild_price_schedule(product_ids)
+            search.index_products(product_ids)
+            versioning.bump(
+                *versioning.product_keys(*product_ids),
+                'collection', *(f'collection:{collection_id}' for collection_id in deltas)
+            )
+        return updated
+
+    def with_effective_price(self, at=None):
+        segment = price_segment_in_effect(at=at)
+
+        return self.annotate(
+            effective_discount=Subquery(
+                segment.values('discount')[:1], output_field=FloatField()),
+            effective_promotion_id=Subquery(segment.values('promotion_id')[:1]),
+        ).annotate(
+            effective_price=ExpressionWrapper(
+                F('price') * (1 - Coalesce('effective_discount', 0.0)),
+                output_field=DecimalField(max_digits=9, decimal_places=3)
+            )
+        )
+
+
 class Product(models.Model):
     title = models.CharField(
         max_length=255, validators=[MinLengthValidator(3)]
@@ -118,29 +306,26 @@ class Product(models.Model):
     collection = models.ForeignKey(
         Collection, on_delete=models.PROTECT, related_name='product')
     is_digital = models.BooleanField(default=False)
+    num_reviews = models.PositiveIntegerField(default=0, editable=False)
+    rating_total = models.DecimalField(
+        max_digits=9, decimal_places=1, default=0, editable=False)
+    rating_histogram = models.JSONField(default=dict, editable=False)
+
+    objects = ProductQuerySet.as_manager()
 
     def __str__(self) -> str:
         return self.title
 
     @property
     def new_price(self):
-        now = timezone.now()
-        if self.promotions.exists():
-            if (
-                product_promotion := self.promotions.filter(
-                    start_date__lte=now, end_date__gte=now
-                )
-                .order_by('-discount')
-                .first()
-            ):
-                return self.price * Decimal(1 - product_promotion.discount)
-
-        if self.collection and self.collection.promotion:
-            collection_promotion = self.collection.promotion
-            if collection_promotion.start_date <= now <= collection_promotion.end_date:
-                return self.price * Decimal(1 - collection_promotion.discount)
-
-        return self.price
+        if hasattr(self, 'effective_discount'):
+            discount = self.effective_discount
+        else:
+            discount = Product.objects.with_effective_price() \
+                .values_list('effective_discount', flat=True) \
+                .get(pk=self.pk)
+
+        return discounted_price(self.price, discount)
 
     def save(self, *args, **kwargs):
         self.slug = slugify(self.title)
@@ -150,7 +335,45 @@ class Product(models.Model):
         ordering = ['title', 'price']
         indexes = [
             models.Index(fields=['title', 'slug']),
-            models.Index(fields=['price', 'title'])
+            models.Index(fields=['price', 'title']),
+            models.Index(fields=['title', 'id']),
+            models.Index(fields=['price', 'id']),
+            models.Index(fields=['last_update', 'id'])
+        ]
+
+
+class ProductPriceSegment(models.Model):
+    product = models.ForeignKey(
+        Product, on_delete=models.CASCADE, related_name='price_segments')
+    promotion = models.ForeignKey(
+        Promotion, on_delete=models.CASCADE, related_name='+', null=True, blank=True)
+    discount = models.FloatField(null=True, blank=True)
+    valid_from = models.DateTimeField()
+    valid_to = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self) -> str:
+        return f'{self.product_id} - {self.valid_from}'
+
+    class Meta:
+        ordering = ['product', 'valid_from']
+        indexes = [
+            models.Index(fields=['product', 'valid_from']),
+            models.Index(fields=['valid_from'])
+        ]
+
+
+class ProductSearchTerm(models.Model):
+    term = models.CharField(max_length=64)
+    product = models.ForeignKey(
+        Product, on_delete=models.CASCADE, related_name='search_terms')
+    weight = models.PositiveIntegerField()
+
+    def __str__(self) -> str:
+        return f'{self.term} - {self.product_id}'
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['term', 'product', 'weight'])
         ]
 
 
@@ -172,6 +395,29 @@ class Stock(models.Model):
         ]
 
 
+class StockReservation(models.Model):
+    # a cart's hold on stock, cart_id is not a foreign key since carts may
+    # live in the cache until checkout
+    product = models.ForeignKey(
+        Product, on_delete=models.CASCADE, related_name='reservations')
+    cart_id = models.UUIDField()
+    quantity = models.PositiveIntegerField()
+    expires_at = models.DateTimeField()
+
+    def __str__(self) -> str:
+        return f'{self.cart_id} - {self.quantity}'
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'cart_id'], name='unique_product_cart_reservation')
+        ]
+        indexes = [
+            models.Index(fields=['product', 'expires_at', 'quantity']),
+            models.Index(fields=['expires_at']),
+            models.Index(fields=['cart_id'])
+        ]
+
+
 class Review(models.Model):
     customer = models.ForeignKey(
         Customer, on_delete=models.CASCADE, related_name='reviews')
@@ -199,6 +445,11 @@ class Review(models.Model):
     def __str__(self) -> str:
         return self.rating
 
+    def save(self, *args, **kwargs):
+        # the product rating aggregates are updated from post_save
+        with transaction.atomic():
+            super(Review, self).save(*args, **kwargs)
+
     class Meta:
         ordering = [
             'created_at', 'is_updated',
@@ -206,12 +457,15 @@ class Review(models.Model):
         ]
         indexes = [
             models.Index(fields=['product', 'customer', 'rating']),
+            models.Index(fields=['product', 'created_at', 'id']),
+            models.Index(fields=['product', 'rating', 'id'])
         ]
 
 
 class Cart(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid4, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
+    last_activity = models.DateTimeField(default=timezone.now, db_index=True)
 
     def __str__(self) -> str:
         return 'Cart'
@@ -228,6 +482,11 @@ class CartItem(models.Model):
     def __str__(self) -> str:
         return f'{self.product.title} - {self.quantity}'
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['cart', 'product'], name='unique_cart_product')
+        ]
+
 
 class Order(models.Model):
     placed_at = models.DateTimeField(auto_now_add=True)
@@ -260,18 +519,46 @@ class Order(models.Model):
     customer = models.ForeignKey(
         Customer, on_delete=models.PROTECT, related_name='orders')
 
+    # orders placed asynchronously are queued with their lines unpriced and
+    # the cart's stock held under cart_id until a worker finalizes them
+    processing_queued = 'Q'
+    processing_finalized = 'D'
+    processing_failed = 'F'
+
+    processing_status_choices = [
+        (processing_queued, 'Queued'),
+        (processing_finalized, 'Finalized'),
+        (processing_failed, 'Failed')
+    ]
+
+    processing_status = models.CharField(
+        max_length=1, choices=processing_status_choices, default=processing_finalized)
+    processing_error = models.CharField(max_length=255, blank=True)
+    cart_id = models.UUIDField(null=True, blank=True)
+    # sum of the line sub totals, persisted when the lines are priced
+    total = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
+
     def __str__(self) -> str:
         return f'{self.order_status} - {self.customer}'
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['placed_at', 'id']),
+            models.Index(fields=['customer', 'placed_at', 'id']),
+            models.Index(fields=['processing_status', 'id'])
+        ]
+
 
 class OrderItem(models.Model):
     order = models.ForeignKey(
         Order, on_delete=models.PROTECT, related_name='item')
     product = models.ForeignKey(
         Product, on_delete=models.PROTECT, related_name='items')
+    # null until a queued order is finalized
     unit_price = models.DecimalField(
-        max_digits=6, decimal_places=2, validators=[MinValueValidator(0.1)])
+        max_digits=6, decimal_places=2, validators=[MinValueValidator(0.1)], null=True)
     quantity = models.PositiveIntegerField()
+    sub_total = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
 
     def __str__(self) -> str:
         return f'{self.product.title} - {self.quantity}'
@@ -283,3 +570,74 @@ class OrderItem(models.Model):
             models.Index(fields=['order', 'product']),
             models.Index(fields=['quantity', 'unit_price'])
         ]
+
+
+class ResourceVersion(models.Model):
+    key = models.CharField(max_length=100, primary_key=True)
+    version = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self) -> str:
+        return f'{self.key} - {self.version}'
+
+
+class IdempotencyRecord(models.Model):
+    # a POST sent with an Idempotency-Key, status_code and body stay empty
+    # while the first request runs, another request may take the key over
+    # after locked_until should that one have died
+    key = models.CharField(max_length=40, primary_key=True)
+    fingerprint = models.CharField(max_length=40)
+    status_code = models.PositiveSmallIntegerField(null=True)
+    body = models.TextField(null=True)
+    locked_until = models.DateTimeField()
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self) -> str:
+        return f'{self.key} - {self.status_code}'
+
+
+class SalesRollup(models.Model):
+    # sales of the day, placed_at is truncated in the current time zone, the
+    # paid_ columns only count orders whose payment is complete
+    day = models.DateField()
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    orders = models.PositiveIntegerField(default=0)
+    paid_units = models.PositiveIntegerField(default=0)
+    paid_revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    paid_orders = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        abstract = True
+
+
+class ProductDailySales(SalesRollup):
+    product = models.ForeignKey(
+        Product, on_delete=models.CASCADE, related_name='daily_sales')
+
+    def __str__(self) -> str:
+        return f'{self.day} - {self.product_id}'
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'product'], name='unique_product_daily_sales')
+        ]
+        indexes = [
+            models.Index(fields=['product', 'day'])
+        ]
+
+
+class CollectionDailySales(SalesRollup):
+    collection = models.ForeignKey(
+        Collection, on_delete=models.CASCADE, related_name='daily_sales')
+
+    def __str__(self) -> str:
+        return f'{self.day} - {self.collection_id}'
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'collection'], name='unique_collection_daily_sales')
+        ]
+        indexes = [
+            models.Index(fields=['collection', 'day'])
+        ]
@@ -0,0 +1,138 @@
+from decimal import Decimal
+from functools import reduce
+from operator import or_
+from django.db import transaction
+from django.db.models import DecimalField, ExpressionWrapper, F, OuterRef, Prefetch, Q, Subquery, Sum
+from django.dispatch import Signal
+from . import models, reservations, rollups, versioning
+
+SHORTFALL_ERROR = 'Not enough instance of the product In stock'
+CENT = Decimal('0.01')
+CHUNK_SIZE = 1000
+
+# the statuses each status may move to
+TRANSITIONS = {
+    'order_status': {
+        models.Order.status_pending: [
+            models.Order.status_shipped, models.Order.status_delivered, models.Order.status_complete],
+        models.Order.status_shipped: [models.Order.status_delivered],
+    },
+    'payment_status': {
+        models.Order.status_pending: [models.Order.status_complete, models.Order.status_fail],
+        models.Order.status_fail: [models.Order.status_pending, models.Order.status_complete],
+    }
+}
+
+# sent once per bulk transition with the changes made and, for every order
+# moved, its previous statuses as {order_id: {field: status}}
+orders_transitioned = Signal()
+
+
+def capture_prices(order, items):
+    # prices the lines from products carrying their effective price, unit
+    # prices are rounded the way they are stored so the totals add up
+    for item in items:
+        item.unit_price = item.product.new_price.quantize(CENT)
+        item.sub_total = item.unit_price * item.quantity
+    order.total = sum([item.sub_total for item in items], Decimal(0))
+
+
+def update_totals(order_ids):
+    # recomputes the persisted totals from the captured unit prices
+    order_ids = list(order_ids)
+    models.OrderItem.objects.filter(order_id__in=order_ids).update(sub_total=ExpressionWrapper(
+        F('unit_price') * F('quantity'), output_field=DecimalField(max_digits=10, decimal_places=2)))
+    totals = models.OrderItem.objects.filter(order=OuterRef('pk')) \
+        .order_by().values('order').annotate(total=Sum('sub_total')).values('total')
+    return models.Order.objects.filter(pk__in=order_ids).update(total=Subquery(totals))
+
+
+def backfill_totals(batch_size=1000):
+    # yields the number of orders given totals per primary key ordered batch,
+    # queued orders get theirs when finalized and failed ones have none
+    last_pk = 0
+    while True:
+        batch = list(models.Order.objects
+                     .filter(total__isnull=True, pk__gt=last_pk,
+                             processing_status=models.Order.processing_finalized)
+                     .order_by('pk').values_list('pk', flat=True)[:batch_size])
+        if not batch:
+            return
+        with transaction.atomic():
+            yield update_totals(batch)
+        last_pk = batch[-1]
+
+
+def finalize(order_id):
+    # second phase of an asynchronous checkout, prices the lines as of the
+    # time the order was placed and settles the stock held for its cart,
+    # orders no longer queued are left alone so running it twice is harmless
+    with transaction.atomic():
+        order = models.Order.objects.select_for_update() \
+            .filter(pk=order_id, processing_status=models.Order.processing_queued).first()
+        if order is None:
+            return None
+
+        items = list(models.OrderItem.objects.filter(order=order).prefetch_related(
+            Prefetch('product', queryset=models.Product.objects.with_effective_price(at=order.placed_at))))
+        capture_prices(order, items)
+        quantities = {}
+        for item in items:
+            quantities[item.product_id] = quantities.get(item.product_id, 0) + item.quantity
+
+        if reservations.commit(order.cart_id, quantities):
+            reservations.release(order.cart_id)
+            order.processing_status = models.Order.processing_failed
+            order.processing_error = SHORTFALL_ERROR
+            order.save(update_fields=['processing_status', 'processing_error'])
+            return order
+
+        models.OrderItem.objects.bulk_update(items, ['unit_price', 'sub_total'])
+        order.processing_status = models.Order.processing_finalized
+        order.save(update_fields=['processing_status', 'total'])
+        rollups.record_orders([order.pk])
+        if order.payment_status == models.Order.status_complete:
+            models.adjust_customer_stats({order.customer_id: (0, order.total)})
+        versioning.bump(*versioning.stock_keys(*quantities))
+    return order
+
+
+def finalize_queued(batch_size=100):
+    # picks up orders whose worker never ran, e.g. after a restart
+    finalized = 0
+    last_pk = 0
+    while True:
+        batch = list(models.Order.objects
+                     .filter(processing_status=models.Order.processing_queued, pk__gt=last_pk)
+                     .order_by('pk').values_list('pk', flat=True)[:batch_size])
+        if not batch:
+            return finalized
+        for order_id in batch:
+            finalized += finalize(order_id) is not None
+        last_pk = batch[-1]
+
+
+def transition(orders, changes, chunk_size=CHUNK_SIZE):
+    # moves the orders to the statuses in changes, {field: status}, checking
+    # the transitions with set-based queries, orders already there are left
+    # alone and orders that may not move are rejected as a whole
+    allowed = Q()
+    for field, target in changes.items():
+        sources = [source for source, targets in TRANSITIONS[field].items() if target in targets]
+        allowed &= Q(**{field + '__in': sources + [target]})
+    moving = reduce(or_, [~Q(**{field: target}) for field, target in changes.items()])
+    orders = orders.order_by()
+
+    with transaction.atomic():
+        rejected = list(orders.exclude(allowed).order_by('pk').values_list('pk', flat=True))
+        previous = {
+            order_id: dict(zip(changes, statuses))
+            for order_id, *statuses in orders.filter(allowed).filter(moving)
+            .select_for_update().order_by('pk').values_list('pk', *changes)
+        }
+        order_ids = list(previous)
+        for start in range(0, len(order_ids), chunk_size):
+            models.Order.objects.filter(pk__in=order_ids[start:start + chunk_size]).update(**changes)
+        if order_ids:
+            orders_transitioned.send(sender=models.Order, changes=changes, previous=previous)
+    return order_ids, rejected
@@ -0,0 +1,181 @@
+import hashlib
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime
+from django.core.cache import cache
+from django.db import connections
+from django.db.models import Q
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import LimitOffsetPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+def estimate_count(queryset):
+    # the planner's row estimate of an unfiltered table, None where the
+    # database keeps none
+    connection = connections[queryset.db]
+    table = queryset.model._meta.db_table
+    if connection.vendor == 'mysql':
+        sql = 'SELECT TABLE_ROWS FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s'
+    elif connection.vendor == 'postgresql':
+        sql = 'SELECT reltuples::bigint FROM pg_class WHERE relname = %s'
+    else:
+        return None
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [table])
+        row = cursor.fetchone()
+    return row[0] if row and row[0] is not None and row[0] >= 0 else None
+
+
+class StorePagination(LimitOffsetPagination):
+    # a `cursor` parameter (empty for the first page) switches to keyset
+    # pages positioned on the ordering fields plus the primary key, views opt
+    # in with `cursor_ordering_fields` and a default `cursor_ordering`
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    # offset pages count from the planner estimate of large unfiltered tables
+    # or from a cached count, keyed by the view's version state when it has
+    # one and expiring otherwise, `?count=exact` always counts
+    count_query_param = 'count'
+    count_cache_timeout = 60
+    versioned_count_cache_timeout = 60 * 60
+    count_estimate_threshold = 100000
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_mode = self.cursor_query_param in request.query_params
+        if not self.cursor_mode:
+            self.request, self.view = request, view
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        self.limit = self.get_limit(request)
+        self.ordering = self.get_ordering(queryset, view)
+        position, self.reverse = self.decode_cursor(queryset)
+
+        ordering = self.ordering
+        if self.reverse:
+            ordering = [self.flip(field) for field in ordering]
+
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(self.after(ordering, position))
+
+        results = list(queryset[:self.limit + 1])
+        has_more = len(results) > self.limit
+        results = results[:self.limit]
+        if self.reverse:
+            results.reverse()
+
+        self.has_next = has_more if not self.reverse else True
+        self.has_previous = has_more if self.reverse else position is not None
+        self.first_position = self.position_of(results[0]) if results else position
+        self.last_position = self.position_of(results[-1]) if results else position
+        return results
+
+    def get_paginated_response(self, data):
+        if not self.cursor_mode:
+            return Response({
+                'count': self.count,
+                'count_is_exact': self.count_is_exact,
+                'next': self.get_next_link(),
+                'previous': self.get_previous_link(),
+                'results': data
+            })
+
+        return Response({
+            'next': self.get_cursor_link(self.last_position, False) if self.has_next else None,
+            'previous': self.get_cursor_link(self.first_position, True) if self.has_previous else None,
+            'results': data
+        })
+
+    def get_count(self, queryset):
+        self.count_is_exact = True
+        if self.request.query_params.get(self.count_query_param) == 'exact':
+            return super().get_count(queryset)
+
+        if not queryset.query.where:
+            estimate = estimate_count(queryset)
+            if estimate is not None and estimate >= self.count_estimate_threshold:
+                self.count_is_exact = False
+                return estimate
+
+        state = getattr(self.view, 'version_state', None)
+        sql, params = queryset.query.sql_with_params()
+        key = 'store:count:' + hashlib.sha1(repr((sql, params, state)).encode()).hexdigest()
+        count = cache.get(key)
+        if count is not None:
+            self.count_is_exact = state is not None
+            return count
+
+        count = super().get_count(queryset)
+        cache.set(key, count, self.versioned_count_cache_timeout if state else self.count_cache_timeout)
+        return count
+
+    def get_ordering(self, queryset, view):
+        ordering = list(queryset.query.order_by) or list(getattr(view, 'cursor_ordering', []))
+        allowed = getattr(view, 'cursor_ordering_fields', []) + ['pk']
+        for field in ordering:
+            if field.lstrip('-') not in allowed:
+                raise ValidationError({
+                    'ordering': f'cursor pagination supports ordering by {", ".join(allowed[:-1])}'
+                })
+
+        if ordering and ordering[-1].lstrip('-') == 'pk':
+            return ordering
+        descending = bool(ordering) and ordering[0].startswith('-')
+        return ordering + ['-pk' if descending else 'pk']
+
+    @staticmethod
+    def flip(field):
+        return field[1:] if field.startswith('-') else '-' + field
+
+    @staticmethod
+    def after(ordering, position):
+        # (a, b, pk) > (x, y, z) spelled out so mixed directions still work
+        condition = Q()
+        equal = Q()
+        for field, value in zip(ordering, position):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+        return condition
+
+    def position_of(self, item):
+        names = [field.lstrip('-') for field in self.ordering]
+        if isinstance(item, dict):
+            return [item[name] for name in names]
+        return [getattr(item, name) for name in names]
+
+    def decode_cursor(self, queryset):
+        encoded = self.request.query_params[self.cursor_query_param]
+        if not encoded:
+            return None, False
+
+        try:
+            cursor = json.loads(urlsafe_b64decode(encoded.encode('ascii')))
+            fields = [self.get_field(queryset, field.lstrip('-')) for field in self.ordering]
+            if len(fields) != len(cursor['p']):
+                raise ValueError
+            position = [field.to_python(value) for field, value in zip(fields, cursor['p'])]
+            return position, bool(cursor['r'])
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+
+    @staticmethod
+    def get_field(queryset, name):
+        if name == 'pk':
+            return queryset.model._meta.pk
+        if name in queryset.query.annotations:
+            return queryset.query.annotations[name].output_field
+        return queryset.model._meta.get_field(name)
+
+    def get_cursor_link(self, position, reverse):
+        values = [value.isoformat() if isinstance(value, datetime) else str(value) for value in position]
+        cursor = json.dumps({'p': values, 'r': int(reverse)}, separators=(',', ':'))
+        url = remove_query_param(self.request.build_absolute_uri(), self.offset_query_param)
+        return replace_query_param(
+            url, self.cursor_query_param, urlsafe_b64encode(cursor.encode('ascii')).decode('ascii'))
@@ -0,0 +1,94 @@
+from datetime import timedelta
+from django.db import transaction
+from django.db.models import Q
+from . import models
+
+# promotions are active on both of their boundaries, so a promotion stops
+# applying one tick after its end date
+TICK = timedelta(microseconds=1)
+BATCH_SIZE = 500
+
+
+def build_segments(promotions, collection_promotion=None):
+    """
+    Turn promotion windows into contiguous (valid_from, valid_to, promotion_id,
+    discount) segments. Promotions are (id, discount, start_date, end_date).
+    """
+    candidates = list(promotions)
+    if collection_promotion:
+        candidates.append(collection_promotion)
+
+    boundaries = sorted(
+        {start for _, _, start, _ in candidates} |
+        {end + TICK for _, _, _, end in candidates}
+    )
+
+    segments = []
+    for index, valid_from in enumerate(boundaries):
+        valid_to = boundaries[index + 1] if index + 1 < len(boundaries) else None
+        active = [
+            (promotion_id, discount)
+            for promotion_id, discount, start, end in promotions
+            if start <= valid_from <= end
+        ]
+        if active:
+            promotion_id, discount = min(active, key=lambda item: (-item[1], item[0]))
+        elif collection_promotion and collection_promotion[2] <= valid_from <= collection_promotion[3]:
+            promotion_id, discount = collection_promotion[:2]
+        else:
+            promotion_id, discount = None, None
+
+        if segments and segments[-1][2:] == (promotion_id, discount):
+            segments[-1] = (segments[-1][0], valid_to, promotion_id, discount)
+        else:
+            segments.append((valid_from, valid_to, promotion_id, discount))
+
+    return segments
+
+
+def rebuild_price_schedule(product_ids):
+    product_ids = list(product_ids)
+    for offset in range(0, len(product_ids), BATCH_SIZE):
+        _rebuild_batch(product_ids[offset:offset + BATCH_SIZE])
+
+
+def _rebuild_batch(product_ids):
+    collection_promotion = dict(
+        models.Product.objects.filter(pk__in=product_ids)
+        .values_list('pk', 'collection__promotion_id')
+    )
+    product_promotions = {}
+    for product_id, promotion_id in models.Product.promotions.through.objects \
+            .filter(product_id__in=product_ids) \
+            .values_list('product_id', 'promotion_id'):
+        product_promotions.setdefault(product_id, []).append(promotion_id)
+
+    promotion_ids = {pk for pk in collection_promotion.values() if pk}
+    promotion_ids.update(pk for pks in product_promotions.values() for pk in pks)
+    promotions = {
+        promotion[0]: promotion
+        for promotion in models.Promotion.objects.filter(pk__in=promotion_ids)
+        .values_list('pk', 'discount', 'start_date', 'end_date')
+    }
+
+    segments = [
+        models.ProductPriceSegment(
+            product_id=product_id, valid_from=valid_from, valid_to=valid_to,
+            promotion_id=promotion_id, discount=discount
+        )
+        for product_id in collection_promotion
+        for valid_from, valid_to, promotion_id, discount in build_segments(
+            [promotions[pk] for pk in product_promotions.get(product_id, [])],
+            promotions.get(collection_promotion[product_id])
+        )
+    ]
+
+    with transaction.atomic():
+        models.ProductPriceSegment.objects.filter(product_id__in=product_ids).delete()
+        models.ProductPriceSegment.objects.bulk_create(segments)
+
+
+def products_affected_by(promotion: models.Promotion):
+    return models.Product.objects \
+        .filter(Q(promotions=promotion) | Q(collection__promotion=promotion)) \
+        .values_list('pk', flat=True).distinct()
@@ -0,0 +1,21 @@
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import F
+from . import models
+
+
+def apply_review_rating(product_id, rating, delta):
+    # delta is 1 when a review with this rating is added and -1 when removed
+    with transaction.atomic():
+        histogram = models.Product.objects.select_for_update() \
+            .values_list('rating_histogram', flat=True) \
+            .get(pk=product_id)
+        histogram[rating] = histogram.get(rating, 0) + delta
+        if not histogram[rating]:
+            del histogram[rating]
+
+        models.Product.objects.filter(pk=product_id).update(
+            num_reviews=F('num_reviews') + delta,
+            rating_total=F('rating_total') + Decimal(rating) * delta,
+            rating_histogram=histogram
+        )
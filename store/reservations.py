@@ -0,0 +1,120 @@
+from datetime import timedelta
+from functools import reduce
+from operator import or_
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, OuterRef, PositiveIntegerField, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from . import models
+
+BATCH_SIZE = 1000
+
+
+def get_ttl():
+    return timedelta(seconds=getattr(settings, 'STOCK_RESERVATION_TTL', 60 * 15))
+
+
+def available(product_ids, exclude_cart=None, at=None):
+    # available to promise, the stock not held by other carts, products
+    # without stock are missing from the result
+    held = models.StockReservation.objects \
+        .filter(product=OuterRef('pk'), expires_at__gt=at or timezone.now()) \
+        .exclude(cart_id=exclude_cart) \
+        .order_by().values('product').annotate(held=Sum('quantity')).values('held')
+
+    return {
+        product_id: quantity - held
+        for product_id, quantity, held in models.Product.objects
+        .filter(pk__in=list(product_ids), stock__isnull=False)
+        .annotate(held=Coalesce(Subquery(held), 0))
+        .values_list('pk', 'stock__quantity_in_stock', 'held')
+    }
+
+
+def hold(cart_id, quantities):
+    # sets the cart's holds to the given quantities, returns the products
+    # that could not be held with the quantity still available for them
+    now = timezone.now()
+    product_ids = sorted(quantities)
+    with transaction.atomic():
+        # stock rows are locked in product order so concurrent holds queue up
+        list(models.Stock.objects.select_for_update()
+             .filter(pk__in=product_ids).order_by('pk').values_list('pk'))
+        promised = available(product_ids, exclude_cart=cart_id, at=now)
+
+        shortfalls = {
+            product_id: max(promised.get(product_id, 0), 0)
+            for product_id in product_ids
+            if quantities[product_id] > promised.get(product_id, 0)
+        }
+        models.upsert([
+            models.StockReservation(
+                product_id=product_id, cart_id=cart_id,
+                quantity=quantities[product_id], expires_at=now + get_ttl())
+            for product_id in product_ids if product_id not in shortfalls
+        ], ['product', 'cart_id'], ['quantity', 'expires_at'])
+    return shortfalls
+
+
+def commit(cart_id, quantities):
+    # turns the cart's holds into stock decrements with a fixed number of
+    # statements whatever the number of lines, returns the products that are
+    # short with the quantity still available, nothing is decremented then
+    if not quantities:
+        return {}
+    now = timezone.now()
+    product_ids = sorted(quantities)
+    with transaction.atomic():
+        # same lock order as `hold` so concurrent checkouts can not deadlock
+        list(models.Stock.objects.select_for_update()
+             .filter(pk__in=product_ids).order_by('pk').values_list('pk'))
+        held = dict(models.StockReservation.objects
+                    .filter(product_id__in=product_ids, expires_at__gt=now)
+                    .exclude(cart_id=cart_id)
+                    .order_by().values('product').annotate(held=Sum('quantity'))
+                    .values_list('product', 'held'))
+        needed = {product_id: quantities[product_id] + held.get(product_id, 0) for product_id in product_ids}
+
+        # a row is only decremented while it still covers the line, so a row
+        # missing from the affected count is a shortfall and never an oversell
+        decremented = models.Stock.objects \
+            .filter(reduce(or_, [Q(pk=product_id, quantity_in_stock__gte=needed[product_id])
+                                 for product_id in product_ids])) \
+            .update(quantity_in_stock=F('quantity_in_stock') - Case(
+                *[When(pk=product_id, then=Value(quantities[product_id])) for product_id in product_ids],
+                output_field=PositiveIntegerField()))
+
+        if decremented == len(product_ids):
+            release(cart_id)
+            return {}
+        transaction.set_rollback(True)
+
+    # the decrements are rolled back, what is read is the stock as it was
+    stock = dict(models.Stock.objects.filter(pk__in=product_ids).values_list('pk', 'quantity_in_stock'))
+    return {
+        product_id: max(stock.get(product_id, 0) - held.get(product_id, 0), 0)
+        for product_id in product_ids
+        if stock.get(product_id, 0) < needed[product_id]
+    }
+
+
+def release(cart_id, product_ids=None):
+    reservations = models.StockReservation.objects.filter(cart_id=cart_id)
+    if product_ids is not None:
+        reservations = reservations.filter(product_id__in=list(product_ids))
+    reservations.delete()
+
+
+def expire(batch_size=BATCH_SIZE):
+    # deletes lapsed holds a batch at a time, lapsed holds are already
+    # ignored by `available`
+    now = timezone.now()
+    expired = 0
+    while True:
+        batch = list(models.StockReservation.objects
+                     .filter(expires_at__lte=now).order_by('expires_at')
+                     .values_list('pk', flat=True)[:batch_size])
+        if not batch:
+            return expired
+        expired += models.StockReservation.objects.filter(pk__in=batch).delete()[0]
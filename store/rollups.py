@@ -0,0 +1,129 @@
+from functools import reduce
+from operator import or_
+from django.db import transaction
+from django.db.models import Case, Count, DecimalField, ExpressionWrapper, F, IntegerField, Q, Sum, Value, When
+from django.db.models.functions import Coalesce, TruncDate
+from . import models
+
+BATCH_SIZE = 500
+METRICS = ['units', 'revenue', 'orders']
+PAID_METRICS = ['paid_units', 'paid_revenue', 'paid_orders']
+# rollup model, its key field and the order line path to that key
+ROLLUPS = {
+    'product': (models.ProductDailySales, 'product', 'product_id'),
+    'collection': (models.CollectionDailySales, 'collection', 'product__collection_id'),
+}
+
+REVENUE = DecimalField(max_digits=14, decimal_places=2)
+
+
+def line_revenue():
+    return Coalesce(ExpressionWrapper(F('unit_price') * F('quantity'), output_field=REVENUE), Value(0), output_field=REVENUE)
+
+
+def sold_lines(order_ids=None):
+    # lines of finalized orders, queued ones are recorded once priced
+    lines = models.OrderItem.objects \
+        .filter(order__processing_status=models.Order.processing_finalized) \
+        .annotate(day=TruncDate('order__placed_at')).order_by()
+    if order_ids is not None:
+        lines = lines.filter(order_id__in=list(order_ids))
+    return lines
+
+
+def aggregate(lines, key):
+    # (day, key, units, revenue, orders) per day and key
+    return lines.values_list('day', key).annotate(
+        units=Sum('quantity'), revenue=Sum(line_revenue()), orders=Count('order', distinct=True))
+
+
+def add(model, field, rows, metrics, sign=1):
+    # adds signed (day, key, *metrics) rows to the rollup, missing rollup
+    # rows are created empty first so every change is one increment
+    rows = [row for row in rows if row[1] is not None]
+    if not rows:
+        return
+    model.objects.bulk_create([model(day=day, **{field + '_id': key}) for day, key, *_ in rows],
+                              ignore_conflicts=True)
+    for start in range(0, len(rows), BATCH_SIZE):
+        batch = rows[start:start + BATCH_SIZE]
+        keys = [Q(day=day, **{field: key}) for day, key, *_ in batch]
+        model.objects.filter(reduce(or_, keys)).update(**{
+            metric: F(metric) + Case(
+                *[When(key, then=Value(sign * values[index])) for key, (_, _, *values) in zip(keys, batch)],
+                default=Value(0),
+                output_field=REVENUE if metric.endswith('revenue') else IntegerField())
+            for index, metric in enumerate(metrics)
+        })
+
+
+def record_orders(order_ids, sign=1):
+    # adds the lines of the orders to the rollups, or takes them out with a
+    # sign of -1, paid orders also count towards the paid_ columns
+    order_ids = list(order_ids)
+    paid = list(models.Order.objects.filter(pk__in=order_ids, payment_status=models.Order.status_complete)
+                .values_list('pk', flat=True))
+    for model, field, key in ROLLUPS.values():
+        add(model, field, aggregate(sold_lines(order_ids), key), METRICS, sign)
+        if paid:
+            add(model, field, aggregate(sold_lines(paid), key), PAID_METRICS, sign)
+
+
+def record_payment_changes(previous_statuses, payment_status):
+    # previous_statuses maps the orders whose payment status changed to the
+    # one they had, only changes to or from complete move the paid_ columns
+    complete = models.Order.status_complete
+    order_ids = [order_id for order_id, previous in previous_statuses.items()
+                 if (previous == complete) != (payment_status == complete)]
+    if not order_ids:
+        return
+    sign = 1 if payment_status == complete else -1
+    for model, field, key in ROLLUPS.values():
+        add(model, field, aggregate(sold_lines(order_ids), key), PAID_METRICS, sign)
+
+
+def rebuild(start=None, end=None, batch_size=BATCH_SIZE):
+    # recomputes the rollups of the days from start to end, both included,
+    # or of every day, returns the number of rollup rows written
+    written = 0
+    lines = sold_lines()
+    if start:
+        lines = lines.filter(day__gte=start)
+    if end:
+        lines = lines.filter(day__lte=end)
+
+    paid = Q(order__payment_status=models.Order.status_complete)
+    for model, field, key in ROLLUPS.values():
+        with transaction.atomic():
+            rollups = model.objects.all()
+            if start:
+                rollups = rollups.filter(day__gte=start)
+            if end:
+                rollups = rollups.filter(day__lte=end)
+            rollups.delete()
+
+            rows = lines.filter(**{key + '__isnull': False}).values_list('day', key).annotate(
+                units=Sum('quantity'), revenue=Sum(line_revenue()), orders=Count('order', distinct=True),
+                paid_units=Coalesce(Sum('quantity', filter=paid), 0),
+                paid_revenue=Coalesce(Sum(line_revenue(), filter=paid), Value(0), output_field=REVENUE),
+                paid_orders=Count('order', distinct=True, filter=paid)
+            ).order_by('day', key)
+            batch = []
+            for day, key_id, *values in rows.iterator(chunk_size=batch_size):
+                batch.append(model(day=day, **{field + '_id': key_id}, **dict(zip(METRICS + PAID_METRICS, values))))
+                if len(batch) == batch_size:
+                    written += len(model.objects.bulk_create(batch))
+                    batch = []
+            written += len(model.objects.bulk_create(batch))
+    return written
+
+
+def sales(by, start, end, key_ids=None, per_day=False):
+    # summed rollups of the range, per key or per key and day
+    model, field, _ = ROLLUPS[by]
+    rollups = model.objects.filter(day__gte=start, day__lte=end)
+    if key_ids:
+        rollups = rollups.filter(**{field + '__in': key_ids})
+    group = [field + '_id', 'day'] if per_day else [field + '_id']
+    return rollups.values(*group).annotate(
+        **{metric: Sum(metric) for metric in METRICS + PAID_METRICS}).order_by(*group)
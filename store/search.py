@@ -0,0 +1,82 @@
+import re
+from collections import Counter
+from functools import reduce
+from operator import or_
+from django.db import transaction
+from django.db.models import Case, Max, OuterRef, Q, Subquery, Sum, When
+from . import models
+
+TOKEN_PATTERN = re.compile(r'\w+')
+MAX_TERM_LENGTH = 64
+MAX_QUERY_TERMS = 8
+MAX_DESCRIPTION_OCCURRENCES = 3
+BATCH_SIZE = 500
+
+FIELD_WEIGHTS = {
+    'title': 10,
+    'collection_title': 4,
+    'slug': 2,
+    'description': 1
+}
+
+
+def tokenize(text):
+    return [token[:MAX_TERM_LENGTH] for token in TOKEN_PATTERN.findall((text or '').lower())]
+
+
+def product_terms(title, slug, description, collection_title):
+    weights = Counter()
+    for field, text in [('title', title), ('slug', slug), ('collection_title', collection_title)]:
+        for term in set(tokenize(text)):
+            weights[term] += FIELD_WEIGHTS[field]
+
+    for term, occurrences in Counter(tokenize(description)).items():
+        weights[term] += FIELD_WEIGHTS['description'] * min(occurrences, MAX_DESCRIPTION_OCCURRENCES)
+    return weights
+
+
+def index_products(product_ids):
+    product_ids = list(product_ids)
+    for offset in range(0, len(product_ids), BATCH_SIZE):
+        _index_batch(product_ids[offset:offset + BATCH_SIZE])
+
+
+def _index_batch(product_ids):
+    products = models.Product.objects.filter(pk__in=product_ids) \
+        .values_list('pk', 'title', 'slug', 'description', 'collection__title')
+    terms = [
+        models.ProductSearchTerm(product_id=product_id, term=term, weight=weight)
+        for product_id, *fields in products
+        for term, weight in product_terms(*fields).items()
+    ]
+
+    with transaction.atomic():
+        models.ProductSearchTerm.objects.filter(product_id__in=product_ids).delete()
+        models.ProductSearchTerm.objects.bulk_create(terms, batch_size=BATCH_SIZE)
+
+
+def search_products(queryset, query):
+    # every query term has to prefix-match one of the product's terms and
+    # products are ranked by the summed weight of the matching terms
+    terms = list(dict.fromkeys(tokenize(query)))[:MAX_QUERY_TERMS]
+    if not terms:
+        return queryset
+
+    conditions = [Q(term__startswith=term) for term in terms]
+    matches = models.ProductSearchTerm.objects \
+        .filter(reduce(or_, conditions)) \
+        .values('product_id') \
+        .annotate(
+            search_rank=Sum('weight'),
+            **{
+                f'matches_{index}': Max(Case(When(condition, then=1), default=0))
+                for index, condition in enumerate(conditions)
+            }
+        ) \
+        .filter(**{f'matches_{index}': 1 for index in range(len(conditions))}) \
+        .order_by()
+
+    return queryset \
+        .filter(pk__in=matches.values('product_id')) \
+        .annotate(search_rank=Subquery(matches.filter(product_id=OuterRef('pk')).values('search_rank')[:1])) \
+        .order_by('-search_rank', 'pk')
@@ -1,7 +1,69 @@
+from datetime import timedelta
 from rest_framework import serializers
 from django.utils import timezone
 from django.db import transaction
-from . import models
+from django.db.models import Prefetch
+from . import carts, filters, models, orders, reservations, rollups, versioning, workers
+
+
+def get_query_list(request, param):
+    value = request.query_params.get(param, '') if request is not None else ''
+    return [name.strip() for name in value.split(',') if name.strip()]
+
+
+def stock_status(quantity_in_stock, threshold):
+    if quantity_in_stock is None or quantity_in_stock == 0:
+        return {"in_stock": False, 'stock_level': None}
+
+    out_put = 'Ok' if quantity_in_stock > threshold else 'Low'
+    return {'in_stock': True, 'stock_level': out_put, 'stock': quantity_in_stock}
+
+
+def average_rating(num_reviews, rating_total):
+    if num_reviews:
+        average_review = float(rating_total) / num_reviews
+        rounded_average = min([1, 1.5, 2, 2.5, 3, 3.5, 4, 4.5, 5], key=lambda x: abs(x - average_review))
+        return rounded_average
+    return 0
+
+
+def rating_histogram(histogram):
+    return {rating: histogram.get(rating, 0) for rating, _ in models.Review.rating_choices}
+
+
+def line_total(quantity, price):
+    return quantity * price
+
+
+class DynamicFieldsMixin:
+    # ?fields= keeps only the listed fields, ?omit= drops fields and ?expand=
+    # swaps in the serializers declared in Meta.expandable_fields
+    @classmethod
+    def requested_fields(cls, request):
+        expandable = getattr(cls.Meta, 'expandable_fields', {})
+        expand = [name for name in get_query_list(request, 'expand') if name in expandable]
+        names = list(cls.Meta.fields) + [name for name in expand if name not in cls.Meta.fields]
+
+        selected = get_query_list(request, 'fields')
+        if selected:
+            names = [name for name in names if name in selected or name in expand]
+        omitted = get_query_list(request, 'omit')
+        return [name for name in names if name not in omitted]
+
+    def requested_expansions(self, request):
+        expandable = getattr(self.Meta, 'expandable_fields', {})
+        return {name: expandable[name] for name in get_query_list(request, 'expand') if name in expandable}
+
+    def get_fields(self):
+        fields = super().get_fields()
+        request = self.context.get('request')
+        parent = self.parent.parent if isinstance(self.parent, serializers.ListSerializer) else self.parent
+        if request is None or parent is not None:
+            return fields
+
+        for name, field in self.requested_expansions(request).items():
+            fields[name] = field()
+        return {name: fields[name] for name in self.requested_fields(request)}
 
 
 class CustomerSerializer(serializers.ModelSerializer):
@@ -9,10 +71,9 @@ class CustomerSerializer(serializers.ModelSerializer):
         model = models.Customer
         fields = [
             'customer_id', 'first_name', 'last_name', 'birth_date', 'phone',
-            'email', 'membership', 'order_count'
+            'email', 'membership', 'order_count', 'lifetime_spend'
         ]
-
-    order_count = serializers.IntegerField(read_only=True)
+        read_only_fields = ['order_count', 'lifetime_spend']
 
 
 class UpdateCustomerSerializer(serializers.ModelSerializer):
@@ -36,7 +97,7 @@ class SimpleProductSerializer(serializers.ModelSerializer):
         fields = ['id', 'title', 'price']
 
 
-class CollectionSerializer(serializers.ModelSerializer):
+class CollectionSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     slug = serializers.SlugField()
     featured_product = SimpleProductSerializer()
     products_count = serializers.IntegerField()
@@ -47,6 +108,9 @@ class CollectionSerializer(serializers.ModelSerializer):
             'id', 'title', 'slug', 'featured_product',
             'promotion', 'products_count'
         ]
+        expandable_fields = {
+            'promotion': lambda: SimplePromotionSerializer(read_only=True)
+        }
 
 
 class CreateCollectionSerializer(serializers.ModelSerializer):
@@ -113,7 +177,7 @@ class SimplePromotionSerializer(serializers.ModelSerializer):
         fields = ['id', 'title', 'discount']
 
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     slug = serializers.SlugField()
     collection = SimpleCollection()
     promotions = SimplePromotionSerializer(many=True)
@@ -124,29 +188,37 @@ class ProductSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'title', 'slug', 'description',
             'price', 'new_price', 'last_update',
-            'collection', 'promotions', 'status', 'num_reviews', 'last_update', 'average_rating'
+            'collection', 'promotions', 'status', 'num_reviews', 'last_update', 'average_rating',
+            'rating_histogram'
         ]
+        expandable_fields = {
+            'stock': lambda: StockSerializer(read_only=True, allow_null=True)
+        }
+        fast_fields = {
+            'status': (['stock__quantity_in_stock', 'stock__threshold'], stock_status),
+            'average_rating': (['num_reviews', 'rating_total'], average_rating),
+            'rating_histogram': (['rating_histogram'], rating_histogram)
+        }
 
     status = serializers.SerializerMethodField(method_name='get_status')
 
     @staticmethod
     def get_status(product: models.Product):
-        if not hasattr(product, 'stock') or product.stock.quantity_in_stock == 0:
-            return {"in_stock": False, 'stock_level': None}
-
-        out_put = 'Ok' if product.stock.quantity_in_stock > product.stock.threshold else 'Low'
-        return {'in_stock': True, 'stock_level': out_put, 'stock': product.stock.quantity_in_stock}
+        if not hasattr(product, 'stock'):
+            return stock_status(None, None)
+        return stock_status(product.stock.quantity_in_stock, product.stock.threshold)
 
     average_rating = serializers.SerializerMethodField(method_name='get_average_reviews')
 
     @staticmethod
     def get_average_reviews(product: models.Product):
-        reviews = [float(review.rating) for review in product.reviews.all()]
-        if len(reviews):
-            average_review = sum(reviews) / len(reviews)
-            rounded_average = min([1, 1.5, 2, 2.5, 3, 3.5, 4, 4.5, 5], key=lambda x: abs(x - average_review))
-            return rounded_average
-        return 0
+        return average_rating(product.num_reviews, product.rating_total)
+
+    rating_histogram = serializers.SerializerMethodField(method_name='get_rating_histogram')
+
+    @staticmethod
+    def get_rating_histogram(product: models.Product):
+        return rating_histogram(product.rating_histogram)
 
 
 class CreateProductSerializer(serializers.ModelSerializer):
@@ -187,6 +259,10 @@ class SimpleCustomerSerializer(serializers.ModelSerializer):
     class Meta:
         model = models.Customer
         fields = ['customer_id', 'first_name', 'last_name', 'membership']
+        fast_sources = {
+            'first_name': 'customer__first_name',
+            'last_name': 'customer__last_name'
+        }
 
 
 class ReviewSerializer(serializers.ModelSerializer):
@@ -237,10 +313,12 @@ class CartItemSerializer(serializers.ModelSerializer):
 
     @staticmethod
     def get_sub_total(items: models.CartItem):
-        return items.quantity * items.product.new_price
+        if hasattr(items, 'sub_total'):
+            return items.sub_total
+        return line_total(items.quantity, items.product.new_price)
 
 
-class CartSerializer(serializers.ModelSerializer):
+class CartSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     items = CartItemSerializer(many=True, read_only=True)
 
     class Meta:
@@ -251,6 +329,8 @@ class CartSerializer(serializers.ModelSerializer):
 
     @staticmethod
     def get_total(cart: models.Cart):
+        if hasattr(cart, 'total'):
+            return cart.total
         return sum([item.product.new_price * item.quantity for item in cart.items.all()])
 
 
@@ -282,55 +362,108 @@ class CreateCartItemSerializer(serializers.ModelSerializer):
         product_id = self.validated_data['product_id']
         quantity = self.validated_data['quantity']
 
-        try:
-            stock = models.Stock.objects.get(pk=product_id)
+        backend = carts.get_backend()
+        # the hold is rolled back with the add, an unknown cart raises
+        # Cart.DoesNotExist and keeps no stock from the others
+        with transaction.atomic():
+            # the whole line is held for the cart, not just the added quantity
+            line_quantity = backend.quantities(cart_id).get(product_id, 0) + quantity
             error = {'error': 'Quantity provided is greater than quantity in stock'}
-            if quantity > stock.quantity_in_stock:
+            if reservations.hold(cart_id, {product_id: line_quantity}):
                 raise serializers.ValidationError(error)
 
-            items = models.CartItem.objects.get(
-                cart_id=cart_id, product_id=product_id)
-            items.quantity += quantity
-            items.save()
-            self.instance = items
-        except models.CartItem.DoesNotExist:
-            self.instance = models.CartItem.objects.create(
-                cart_id=cart_id, **self.validated_data)
-
+            self.instance = backend.add_item(cart_id, product_id, quantity)
         return self.instance
 
 
+class BulkCartItemListSerializer(serializers.ListSerializer):
+    # lines are checked against stock together, valid lines are added and
+    # the others reported in line_errors at their position
+    def create(self, validated_data):
+        cart_id = self.context['cart_id']
+        backend = carts.get_backend()
+        existing = backend.quantities(cart_id)
+        stock = dict(models.Product.objects
+                     .filter(pk__in=[line['product_id'] for line in validated_data])
+                     .values_list('pk', 'stock__quantity_in_stock'))
+
+        quantities = {}
+        self.line_errors = []
+        for line in validated_data:
+            product_id, quantity = line['product_id'], line['quantity']
+            requested = quantities.get(product_id, 0) + quantity
+            if product_id not in stock:
+                self.line_errors.append({'product_id': ['Product with the Given ID does not exist']})
+            elif not stock[product_id]:
+                self.line_errors.append({'product_id': ['Product has no stock']})
+            elif requested > stock[product_id]:
+                self.line_errors.append({'quantity': ['Quantity provided is greater than quantity in stock']})
+            else:
+                quantities[product_id] = requested
+                self.line_errors.append({})
+
+        with transaction.atomic():
+            shortfalls = reservations.hold(cart_id, {
+                product_id: existing.get(product_id, 0) + quantity for product_id, quantity in quantities.items()
+            }) if quantities else {}
+            for line, errors in zip(validated_data, self.line_errors):
+                if not errors and line['product_id'] in shortfalls:
+                    errors['quantity'] = ['Quantity provided is greater than quantity in stock']
+
+            quantities = {
+                product_id: quantity for product_id, quantity in quantities.items() if product_id not in shortfalls
+            }
+            if quantities:
+                backend.add_items(cart_id, quantities)
+        return validated_data
+
+
+class BulkCartItemSerializer(serializers.Serializer):
+    product_id = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=1, max_value=32767)
+
+    class Meta:
+        list_serializer_class = BulkCartItemListSerializer
+
+
 class UpdateCartItemSerializer(serializers.ModelSerializer):
     class Meta:
         model = models.CartItem
         fields = ['quantity']
 
     def update(self, instance: models.CartItem, validated_data):
-        product_id = validated_data.get('product_id', instance.product.pk)
-
         quantity = validated_data.get('quantity', instance.quantity)
-        stock = models.Stock.objects.get(pk=product_id)
         error = {'error': 'Quantity provided is greater than quantity in stock'}
-        if stock.quantity_in_stock < quantity:
-            raise serializers.ValidationError(error)
+        # the hold is rolled back with a change that fails
+        with transaction.atomic():
+            if reservations.hold(instance.cart_id, {instance.product_id: quantity}):
+                raise serializers.ValidationError(error)
+            return carts.get_backend().set_quantity(instance, quantity)
 
-        return super().update(instance, validated_data)
+
+class OrderedProductSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = models.Product
+        fields = ['id', 'title']
+
+
+class OrderItemSerializer(serializers.ModelSerializer):
+    # lines are read as priced at checkout, nothing is computed per read
+    product = OrderedProductSerializer()
+
+    class Meta:
+        model = models.OrderItem
+        fields = ['id', 'product', 'quantity', 'unit_price', 'sub_total']
 
 
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     customer = SimpleCustomerSerializer()
-    item = CartItemSerializer(many=True)
+    item = OrderItemSerializer(many=True)
 
     class Meta:
         model = models.Order
         fields = ['id', 'placed_at', 'order_status',
-                  'payment_status', 'customer', 'item', 'total']
-
-    total = serializers.SerializerMethodField(method_name='get_total')
-
-    @staticmethod
-    def get_total(order: models.Order):
-        return sum([item.product.new_price * item.quantity for item in order.item.all()])
+                  'payment_status', 'processing_status', 'customer', 'item', 'total']
 
 
 class CreateOrderSerializer(serializers.Serializer):
@@ -338,6 +471,7 @@ class CreateOrderSerializer(serializers.Serializer):
 
     @staticmethod
     def validate_cart_id(cart_id):
+        carts.get_backend().flush(cart_id)
         if not models.Cart.objects.filter(pk=cart_id).exists():
             raise serializers.ValidationError('Cart Does Not Exist')
         if models.CartItem.objects.filter(cart_id=cart_id).count() == 0:
@@ -349,37 +483,127 @@ class CreateOrderSerializer(serializers.Serializer):
             cart = self.validated_data['cart_id']
             user_id = self.context['user_id']
             customer = models.Customer.objects.get(customer_id=user_id)
-            order = models.Order.objects.create(customer=customer)
+            order = models.Order(customer=customer)
 
             cart_item = models.CartItem.objects.prefetch_related(
-                'product').filter(cart=cart)
+                Prefetch('product', queryset=models.Product.objects.with_effective_price())
+            ).filter(cart=cart)
             items = [models.OrderItem(
                 order=order,
                 product=item.product,
-                quantity=item.quantity,
-                unit_price=item.product.new_price)
+                quantity=item.quantity)
                 for item in cart_item
             ]
+            orders.capture_prices(order, items)
 
-            models.OrderItem.objects \
-                .select_related('product__collection__promotion') \
-                .prefetch_related('product__collection__promotions') \
-                .bulk_create(items)
+            order.save()
+            models.OrderItem.objects.bulk_create(items)
+            rollups.record_orders([order.pk])
 
-            for instance in items:
-                product_stock = instance.product.stock.quantity_in_stock
-                quantity = instance.quantity
-                if quantity > product_stock:
-                    raise serializers.ValidationError(
-                        {'error': 'Not enough instance of the product In stock'})
+            quantities = {}
+            for item in items:
+                quantities[item.product_id] = quantities.get(item.product_id, 0) + item.quantity
+            # stock held by other carts can not be sold to this one
+            if reservations.commit(cart, quantities):
+                raise serializers.ValidationError(
+                    {'error': 'Not enough instance of the product In stock'})
 
-                models.Stock.objects.select_related('product').filter(product_id=instance.product.pk) \
-                    .update(quantity_in_stock=product_stock - quantity)
+            versioning.bump(*versioning.stock_keys(*(item.product_id for item in items)))
 
-            models.Cart.objects.filter(pk=cart).delete()
+            carts.get_backend().delete(cart)
             return order
 
 
+class PlaceOrderSerializer(CreateOrderSerializer):
+    # first phase of an asynchronous checkout, the cart's lines are held and
+    # recorded on a queued order that a worker prices and settles
+    def save(self, **kwargs):
+        with transaction.atomic():
+            cart = self.validated_data['cart_id']
+            customer = models.Customer.objects.get(customer_id=self.context['user_id'])
+
+            quantities = {}
+            for product_id, quantity in models.CartItem.objects.filter(cart_id=cart) \
+                    .values_list('product_id', 'quantity'):
+                quantities[product_id] = quantities.get(product_id, 0) + quantity
+            if reservations.hold(cart, quantities):
+                raise serializers.ValidationError({'error': orders.SHORTFALL_ERROR})
+
+            order = models.Order.objects.create(
+                customer=customer, cart_id=cart, processing_status=models.Order.processing_queued)
+            models.OrderItem.objects.bulk_create([
+                models.OrderItem(order=order, product_id=product_id, quantity=quantity)
+                for product_id, quantity in quantities.items()
+            ])
+
+            carts.get_backend().delete(cart)
+            workers.submit(orders.finalize, order.pk)
+            return order
+
+
+class TransitionOrdersSerializer(serializers.Serializer):
+    # the orders are given by id, by an order filter or, to move every
+    # order, by all set to true, at least one of the statuses is given as
+    # the target
+    ids = serializers.ListField(child=serializers.IntegerField(), required=False, allow_empty=False)
+    filter = serializers.DictField(required=False, allow_empty=False)
+    all = serializers.BooleanField(default=False)
+    order_status = serializers.ChoiceField(models.Order.order_status_choices, required=False)
+    payment_status = serializers.ChoiceField(models.Order.payment_status_choices, required=False)
+
+    @staticmethod
+    def validate_filter(value):
+        # the filter set ignores unknown and blank keys, a typo would select
+        # every order
+        unknown = sorted(set(value) - set(filters.OrderFilter.base_filters))
+        if unknown:
+            raise serializers.ValidationError(f'Unknown filters: {", ".join(unknown)}')
+        blank = sorted(key for key, item in value.items() if item in (None, ''))
+        if blank:
+            raise serializers.ValidationError(f'Blank filters: {", ".join(blank)}')
+        return value
+
+    def validate(self, attrs):
+        if [('ids' in attrs), ('filter' in attrs), attrs['all']].count(True) != 1:
+            raise serializers.ValidationError('Send one of ids, filter or all')
+        attrs['changes'] = {field: attrs[field] for field in orders.TRANSITIONS if field in attrs}
+        if not attrs['changes']:
+            raise serializers.ValidationError('Send order_status or payment_status')
+
+        if 'ids' in attrs:
+            attrs['orders'] = models.Order.objects.filter(pk__in=attrs['ids'])
+            return attrs
+        if attrs['all']:
+            attrs['orders'] = models.Order.objects.all()
+            return attrs
+        order_filter = filters.OrderFilter(attrs['filter'], models.Order.objects.all())
+        if not order_filter.is_valid():
+            raise serializers.ValidationError({'filter': order_filter.errors})
+        attrs['orders'] = order_filter.qs
+        return attrs
+
+
+class SalesQuerySerializer(serializers.Serializer):
+    start = serializers.DateField(required=False)
+    end = serializers.DateField(required=False)
+    ids = serializers.ListField(child=serializers.IntegerField(), required=False)
+    per_day = serializers.BooleanField(default=False)
+
+    def to_internal_value(self, data):
+        # ids come in as one comma separated query parameter
+        data = {key: value for key, value in data.items()}
+        if data.get('ids'):
+            data['ids'] = data['ids'].split(',')
+        return super().to_internal_value(data)
+
+    def validate(self, attrs):
+        attrs.setdefault('end', timezone.localdate())
+        attrs.setdefault('start', attrs['end'] - timedelta(days=30))
+        if attrs['start'] > attrs['end']:
+            raise serializers.ValidationError('start must not be after end')
+        return attrs
+
+
 class UpdateOrderSerializer(serializers.ModelSerializer):
     class Meta:
         model = models.Order
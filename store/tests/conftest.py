@@ -0,0 +1,55 @@
+from decimal import Decimal
+
+import pytest
+from django.core.cache import cache
+from rest_framework.test import APIClient
+
+from core.models import User
+from store import models
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    # counts and facets are cached, keep them from leaking between tests
+    cache.clear()
+
+
+@pytest.fixture
+def lamp(request):
+    # a product in stock, tests change its price or stock with
+    # @pytest.mark.parametrize('lamp', [{'price': ..., 'stock': ...}], indirect=True)
+    options = {'price': Decimal('10.00'), 'stock': 100, **getattr(request, 'param', {})}
+    collection = models.Collection.objects.create(title='collection')
+    product = models.Product.objects.create(
+        title='lamp', description='-', price=options['price'], collection=collection)
+    models.Stock.objects.create(product=product, quantity_in_stock=options['stock'], threshold=1)
+    return product
+
+
+@pytest.fixture
+def buyer():
+    # returns an authenticated client for a new user
+    def create(username='buyer'):
+        client = APIClient()
+        client.force_authenticate(User.objects.create(username=username, email=f'{username}@shop.com'))
+        return client
+    return create
+
+
+@pytest.fixture
+def fill_cart():
+    # returns the id of a new cart holding the (product, quantity) lines
+    def fill(client, lines):
+        cart_id = client.post('/store/carts/').data['id']
+        for product, quantity in lines:
+            client.post(f'/store/carts/{cart_id}/items/', {'product_id': product.pk, 'quantity': quantity})
+        return cart_id
+    return fill
+
+
+@pytest.fixture
+def place_order(fill_cart):
+    # checks out a new cart holding the (product, quantity) lines
+    def place(client, lines):
+        return client.post('/store/orders/', {'cart_id': fill_cart(client, lines)})
+    return place
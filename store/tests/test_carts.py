@@ -0,0 +1,215 @@
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from uuid import UUID
+
+import pytest
+from django.core.cache import caches
+from django.core.management import call_command
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework import status
+
+from core.models import User
+from store import models
+from store.carts import CacheCartBackend
+
+BACKENDS = ['store.carts.DatabaseCartBackend', 'store.carts.CacheCartBackend']
+
+
+@pytest.fixture
+def products():
+    collection = models.Collection.objects.create(title='collection')
+    products = []
+    for title, price in [('lamp', '20.00'), ('mug', '5.00')]:
+        product = models.Product.objects.create(
+            title=title, description='-', price=Decimal(price), collection=collection)
+        models.Stock.objects.create(product=product, quantity_in_stock=10, threshold=2)
+        products.append(product)
+    return products
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('backend', BACKENDS)
+class TestCartBackends:
+
+    def test_cart_api_behaves_the_same(self, settings, backend, products):
+        settings.CART_BACKEND = backend
+        lamp, mug = products
+        client = APIClient()
+
+        cart_id = client.post('/store/carts/').data['id']
+        items_url = f'/store/carts/{cart_id}/items/'
+        client.post(items_url, {'product_id': lamp.pk, 'quantity': 1})
+        client.post(items_url, {'product_id': lamp.pk, 'quantity': 2})
+        client.post(items_url, {'product_id': mug.pk, 'quantity': 4})
+        mug_item = [item for item in client.get(items_url).data['results'] if item['product']['id'] == mug.pk][0]
+        client.patch(f'{items_url}{mug_item["id"]}/', {'quantity': 2})
+        lamp_item = [item for item in client.get(items_url).data['results'] if item['product']['id'] == lamp.pk][0]
+        assert client.delete(f'{items_url}{lamp_item["id"]}/').status_code == status.HTTP_204_NO_CONTENT
+
+        cart = client.get(f'/store/carts/{cart_id}/').data
+
+        assert [(item['product']['title'], item['quantity']) for item in cart['items']] == [('mug', 2)]
+        assert cart['total'] == Decimal('10.00')
+        assert client.get(f'/store/carts/{cart_id}/items/{lamp_item["id"]}/').status_code == \
+            status.HTTP_404_NOT_FOUND
+
+    def test_checkout_flushes_the_cart(self, settings, backend, products):
+        settings.CART_BACKEND = backend
+        client = APIClient()
+        client.force_authenticate(User.objects.create(username='buyer', email='buyer@shop.com'))
+
+        cart_id = client.post('/store/carts/').data['id']
+        client.post(f'/store/carts/{cart_id}/items/', {'product_id': products[0].pk, 'quantity': 3})
+        response = client.post('/store/orders/', {'cart_id': cart_id})
+
+        assert response.status_code == status.HTTP_200_OK
+        assert [(item['product']['id'], item['quantity']) for item in response.data['item']] == [(products[0].pk, 3)]
+        assert not models.Cart.objects.filter(pk=cart_id).exists()
+        assert client.get(f'/store/carts/{cart_id}/').status_code == status.HTTP_404_NOT_FOUND
+
+
+@pytest.mark.django_db
+class TestCacheCartBackend:
+
+    def test_cart_lines_stay_out_of_the_database_between_flushes(self, settings, products):
+        settings.CART_BACKEND = 'store.carts.CacheCartBackend'
+        client = APIClient()
+
+        cart_id = client.post('/store/carts/').data['id']
+        client.post(f'/store/carts/{cart_id}/items/', {'product_id': products[0].pk, 'quantity': 1})
+        assert models.Cart.objects.filter(pk=cart_id).exists()
+        assert not models.CartItem.objects.exists()
+
+        settings.CART_FLUSH_INTERVAL = 0
+        client.post(f'/store/carts/{cart_id}/items/', {'product_id': products[1].pk, 'quantity': 1})
+
+        assert list(models.CartItem.objects.filter(cart_id=cart_id).order_by('product_id')
+                    .values_list('product_id', 'quantity')) == [(products[0].pk, 1), (products[1].pk, 1)]
+
+    def test_a_cart_locked_by_another_request_is_refused(self, settings, products, monkeypatch):
+        settings.CART_BACKEND = 'store.carts.CacheCartBackend'
+        monkeypatch.setattr(CacheCartBackend, 'lock_timeout', 0.05)
+        client = APIClient()
+        cart_id = client.post('/store/carts/').data['id']
+        cache = caches[settings.CART_CACHE_ALIAS]
+        lock = CacheCartBackend.key(cart_id) + ':lock'
+        cache.set(lock, 'other', 60)
+
+        response = client.post(f'/store/carts/{cart_id}/items/', {'product_id': products[0].pk, 'quantity': 1})
+
+        assert response.status_code == status.HTTP_409_CONFLICT
+        assert cache.get(lock) == 'other'
+        assert not models.StockReservation.objects.exists()
+
+    def test_carts_outlive_the_cache(self, settings, products):
+        settings.CART_BACKEND = 'store.carts.CacheCartBackend'
+        client = APIClient()
+        cart_id = client.post('/store/carts/').data['id']
+
+        caches[settings.CART_CACHE_ALIAS].clear()
+        response = client.post(f'/store/carts/{cart_id}/items/', {'product_id': products[0].pk, 'quantity': 1})
+
+        assert response.status_code == status.HTTP_201_CREATED
+        assert client.get(f'/store/carts/{cart_id}/').data['items'][0]['quantity'] == 1
+
+
+@pytest.mark.django_db
+class TestCartPricing:
+
+    # the cache backend reads the cart from the cache table and the products
+    @pytest.mark.parametrize('backend, queries', list(zip(BACKENDS, [3, 2])))
+    def test_cart_reads_run_constant_queries(self, settings, django_assert_num_queries, products, backend, queries):
+        settings.CART_BACKEND = backend
+        client = APIClient()
+        cart_id = client.post('/store/carts/').data['id']
+        for product in products:
+            client.post(f'/store/carts/{cart_id}/items/', {'product_id': product.pk, 'quantity': 2})
+
+        with django_assert_num_queries(queries):
+            cart = client.get(f'/store/carts/{cart_id}/').data
+
+        assert cart['total'] == Decimal('50.00')
+        assert [item['sub_total'] for item in cart['items']] == [Decimal('40.00'), Decimal('10.00')]
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('backend', BACKENDS)
+class TestBulkCartItems:
+
+    def test_valid_lines_are_merged_and_invalid_ones_reported(self, settings, backend, products):
+        settings.CART_BACKEND = backend
+        lamp, mug = products
+        models.Stock.objects.filter(product=mug).update(quantity_in_stock=3)
+        client = APIClient()
+        cart_id = client.post('/store/carts/').data['id']
+        client.post(f'/store/carts/{cart_id}/items/', {'product_id': lamp.pk, 'quantity': 1})
+
+        response = client.post(f'/store/carts/{cart_id}/items/bulk/', [
+            {'product_id': lamp.pk, 'quantity': 2},
+            {'product_id': mug.pk, 'quantity': 5},
+            {'product_id': 0, 'quantity': 1},
+            {'product_id': mug.pk, 'quantity': 3},
+        ], format='json')
+
+        assert response.status_code == status.HTTP_200_OK
+        assert [(item['product']['id'], item['quantity']) for item in response.data['items']] == \
+            [(lamp.pk, 3), (mug.pk, 3)]
+        assert response.data['errors'] == [
+            {},
+            {'quantity': ['Quantity provided is greater than quantity in stock']},
+            {'product_id': ['Product with the Given ID does not exist']},
+            {}
+        ]
+
+    def test_bulk_add_runs_constant_queries(self, settings, backend, products, django_assert_max_num_queries):
+        settings.CART_BACKEND = backend
+        collection = products[0].collection
+        basket = [
+            models.Product.objects.create(title=f'product {index}', description='-', price=1, collection=collection)
+            for index in range(30)
+        ]
+        models.Stock.objects.bulk_create([models.Stock(product=product, quantity_in_stock=5, threshold=1) for product in basket])
+        client = APIClient()
+        cart_id = client.post('/store/carts/').data['id']
+
+        # lines, stock, the stock lock, availability and holds, the cart, its
+        # lines, the upsert and the priced lines, plus three savepoint pairs,
+        # the cache backend reads and writes the cart and its lock instead
+        with django_assert_max_num_queries({BACKENDS[0]: 16, BACKENDS[1]: 24}[backend]):
+            response = client.post(f'/store/carts/{cart_id}/items/bulk/', [
+                {'product_id': product.pk, 'quantity': 1} for product in basket
+            ], format='json')
+
+        assert len(response.data['items']) == 30
+
+
+@pytest.mark.django_db
+class TestAbandonedCarts:
+
+    def test_idle_carts_are_collected_in_batches(self, products):
+        client = APIClient()
+        idle = [client.post('/store/carts/').data['id'] for _ in range(3)]
+        for cart_id in idle:
+            client.post(f'/store/carts/{cart_id}/items/', {'product_id': products[0].pk, 'quantity': 1})
+        models.Cart.objects.update(last_activity=timezone.now() - timedelta(days=40))
+        active = client.post('/store/carts/').data['id']
+        out = StringIO()
+
+        call_command('collect_carts', batch_size=2, pause=0, stdout=out)
+
+        assert list(models.Cart.objects.values_list('pk', flat=True)) == [UUID(active)]
+        assert not models.CartItem.objects.exists()
+        assert not models.StockReservation.objects.exists()
+        assert 'deleted 3 carts and 3 items' in out.getvalue()
+
+    def test_activity_keeps_a_cart(self, products):
+        client = APIClient()
+        cart_id = client.post('/store/carts/').data['id']
+        models.Cart.objects.update(last_activity=timezone.now() - timedelta(days=40))
+        client.post(f'/store/carts/{cart_id}/items/', {'product_id': products[0].pk, 'quantity': 1})
+
+        call_command('collect_carts', pause=0, stdout=StringIO())
+
+        assert models.Cart.objects.filter(pk=cart_id).exists()
@@ -0,0 +1,122 @@
+import threading
+
+import pytest
+from django.db import DatabaseError, connection
+from django.db.models import Sum
+from django.test.utils import CaptureQueriesContext
+from rest_framework.exceptions import ValidationError
+
+from core.models import User
+from store import models, reservations
+from store.serializers import CreateOrderSerializer
+
+
+def create_products(count, quantity_in_stock):
+    collection = models.Collection.objects.create(title='collection')
+    products = [
+        models.Product.objects.create(title=f'product {index}', description='-', price=10, collection=collection)
+        for index in range(count)
+    ]
+    models.Stock.objects.bulk_create([
+        models.Stock(product=product, quantity_in_stock=quantity_in_stock, threshold=1) for product in products
+    ])
+    return products
+
+
+def create_cart(products, quantity):
+    # lines are written straight to the table, no stock is held for them
+    cart = models.Cart.objects.create()
+    models.CartItem.objects.bulk_create([
+        models.CartItem(cart=cart, product=product, quantity=quantity) for product in products
+    ])
+    return cart
+
+
+def check_out(cart, user):
+    serializer = CreateOrderSerializer(data={'cart_id': cart.pk}, context={'user_id': user.pk})
+    serializer.is_valid(raise_exception=True)
+    return serializer.save()
+
+
+def stock_of(products):
+    return dict(models.Stock.objects.filter(pk__in=[product.pk for product in products])
+                .values_list('pk', 'quantity_in_stock'))
+
+
+@pytest.mark.django_db
+class TestCheckout:
+
+    def test_statements_do_not_grow_with_the_lines(self):
+        user = User.objects.create(username='buyer', email='buyer@shop.com')
+        products = create_products(6, quantity_in_stock=5)
+        small, large = create_cart(products[:1], 1), create_cart(products[1:], 1)
+
+        with CaptureQueriesContext(connection) as one_line:
+            check_out(small, user)
+        with CaptureQueriesContext(connection) as five_lines:
+            check_out(large, user)
+
+        assert len(five_lines) == len(one_line)
+        assert set(stock_of(products).values()) == {4}
+
+    def test_a_short_line_decrements_nothing(self):
+        user = User.objects.create(username='buyer', email='buyer@shop.com')
+        plenty, scarce = create_products(2, quantity_in_stock=2)
+        models.Stock.objects.filter(pk=scarce.pk).update(quantity_in_stock=1)
+        cart = create_cart([plenty, scarce], 2)
+
+        with pytest.raises(ValidationError):
+            check_out(cart, user)
+
+        assert stock_of([plenty, scarce]) == {plenty.pk: 2, scarce.pk: 1}
+        assert not models.Order.objects.exists()
+        assert models.CartItem.objects.filter(cart=cart).count() == 2
+
+    def test_stock_held_by_other_carts_is_not_sold(self):
+        lamp, = create_products(1, quantity_in_stock=3)
+        other = models.Cart.objects.create()
+        reservations.hold(other.pk, {lamp.pk: 2})
+        cart = create_cart([lamp], 2)
+
+        assert reservations.commit(cart.pk, {lamp.pk: 2}) == {lamp.pk: 1}
+        assert reservations.commit(cart.pk, {lamp.pk: 1}) == {}
+        assert stock_of([lamp]) == {lamp.pk: 2}
+
+
+@pytest.mark.django_db(transaction=True)
+class TestConcurrentCheckout:
+
+    def test_concurrent_checkouts_never_oversell(self):
+        stock, quantity, buyers = 5, 2, 8
+        products = create_products(3, quantity_in_stock=stock)
+        users = [User.objects.create(username=f'buyer{index}', email=f'buyer{index}@shop.com')
+                 for index in range(buyers)]
+        # every cart lists the products in a different order
+        carts = [create_cart(products[index % 3:] + products[:index % 3], quantity) for index in range(buyers)]
+
+        barrier = threading.Barrier(buyers)
+        orders, refused = [], []
+
+        def buy(cart, user):
+            try:
+                barrier.wait()
+                orders.append(check_out(cart, user).pk)
+            except (ValidationError, DatabaseError):
+                refused.append(cart.pk)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=buy, args=pair) for pair in zip(carts, users)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        sold = dict(models.OrderItem.objects.values('product').annotate(sold=Sum('quantity'))
+                    .values_list('product', 'sold'))
+        assert len(orders) + len(refused) == buyers
+        assert 1 <= len(orders) <= stock // quantity
+        assert models.Order.objects.count() == len(orders)
+        for product_id, remaining in stock_of(products).items():
+            assert remaining >= 0
+            assert remaining + sold.get(product_id, 0) == stock
@@ -1,6 +1,12 @@
+from datetime import timedelta
+
+import pytest
+from django.utils import timezone
 from rest_framework.test import APIClient
 from rest_framework import status
 
+from store import models, search
+
 
 class TestCreateCOllection:
 
@@ -8,3 +14,89 @@ class TestCreateCOllection:
         client = APIClient()
         response = client.post('/store/collections/', {'title': 'a'})
         assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+@pytest.mark.django_db
+class TestProductsCount:
+
+    def test_product_writes_keep_the_count(self):
+        toys, books = [models.Collection.objects.create(title=title) for title in ['toys', 'books']]
+        ball, kite = [
+            models.Product.objects.create(title=title, description='-', price=1, collection=toys)
+            for title in ['ball', 'kite']
+        ]
+        kite.collection = books
+        kite.save()
+        ball.delete()
+
+        assert [(collection.title, collection.products_count) for collection in models.Collection.objects.all()] == \
+            [('books', 1), ('toys', 0)]
+
+    def test_bulk_writes_keep_the_count(self):
+        toys, books = [models.Collection.objects.create(title=title) for title in ['toys', 'books']]
+        models.Product.objects.bulk_create([
+            models.Product(title=f'product {index}', description='-', price=1, collection=toys)
+            for index in range(3)
+        ])
+        models.Product.objects.filter(title__in=['product 0', 'product 1']).update(collection=books)
+
+        toys.refresh_from_db()
+        books.refresh_from_db()
+        assert (toys.products_count, books.products_count) == (1, 2)
+        assert models.recount_products() == 0
+
+    def test_bulk_creates_price_index_and_version_the_products(self, django_capture_on_commit_callbacks):
+        now = timezone.now()
+        sale = models.Promotion.objects.create(
+            title='sale', description='-', discount=0.5,
+            start_date=now - timedelta(days=1), end_date=now + timedelta(days=1))
+        toys = models.Collection.objects.create(title='toys', promotion=sale)
+
+        with django_capture_on_commit_callbacks(execute=True):
+            ball, = models.Product.objects.bulk_create([
+                models.Product(title='ball', description='-', price=10, collection=toys)])
+
+        assert models.Product.objects.get(pk=ball.pk).new_price == 5
+        assert list(search.search_products(models.Product.objects.all(), 'ball')) == [ball]
+        assert set(models.ResourceVersion.objects.values_list('key', flat=True)) >= {
+            'product', f'product:{ball.pk}', f'collection:{toys.pk}'}
+
+    def test_bulk_moves_refresh_prices_terms_and_versions(self, django_capture_on_commit_callbacks):
+        now = timezone.now()
+        sale = models.Promotion.objects.create(
+            title='sale', description='-', discount=0.5,
+            start_date=now - timedelta(days=1), end_date=now + timedelta(days=1))
+        toys = models.Collection.objects.create(title='toys', promotion=sale)
+        books = models.Collection.objects.create(title='books')
+        ball = models.Product.objects.create(title='ball', description='-', price=10, collection=toys)
+
+        with django_capture_on_commit_callbacks(execute=True):
+            models.Product.objects.filter(pk=ball.pk).update(collection=books)
+
+        assert models.Product.objects.get(pk=ball.pk).new_price == 10
+        assert list(search.search_products(models.Product.objects.all(), 'books')) == [ball]
+        assert not search.search_products(models.Product.objects.all(), 'toys').exists()
+        assert set(models.ResourceVersion.objects.values_list('key', flat=True)) >= {
+            f'product:{ball.pk}', f'collection:{toys.pk}', f'collection:{books.pk}'}
+
+    def test_recount_repairs_drift(self, django_capture_on_commit_callbacks):
+        toys = models.Collection.objects.create(title='toys')
+        models.Product.objects.create(title='ball', description='-', price=1, collection=toys)
+        models.Collection.objects.filter(pk=toys.pk).update(products_count=5)
+        models.ResourceVersion.objects.all().delete()
+
+        with django_capture_on_commit_callbacks(execute=True):
+            assert models.recount_products() == 1
+        toys.refresh_from_db()
+        assert toys.products_count == 1
+        assert models.ResourceVersion.objects.filter(key=f'collection:{toys.pk}').exists()
+
+    def test_listing_sorts_on_the_stored_count(self, django_assert_num_queries):
+        toys, books = [models.Collection.objects.create(title=title) for title in ['toys', 'books']]
+        models.Product.objects.create(title='ball', description='-', price=1, collection=toys)
+
+        with django_assert_num_queries(4) as context:
+            response = APIClient().get('/store/collections/?ordering=-products_count&fields=id,products_count')
+
+        assert [collection['products_count'] for collection in response.data['results']] == [1, 0]
+        assert 'GROUP BY' not in context.captured_queries[-1]['sql']
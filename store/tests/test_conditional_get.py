@@ -0,0 +1,65 @@
+from datetime import timedelta
+
+import pytest
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework import status
+
+from store import models
+
+
+@pytest.mark.django_db(transaction=True)
+class TestConditionalGet:
+
+    def test_unchanged_catalog_returns_304(self):
+        collection = models.Collection.objects.create(title='collection')
+        models.Product.objects.create(title='product', description='-', price=10, collection=collection)
+        client = APIClient()
+
+        etag = client.get('/store/products/')['ETag']
+        response = client.get('/store/products/', HTTP_IF_NONE_MATCH=etag)
+
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+        assert client.get('/store/products/?limit=1', HTTP_IF_NONE_MATCH=etag).status_code == status.HTTP_200_OK
+
+    def test_writes_change_the_etag(self):
+        collection = models.Collection.objects.create(title='collection')
+        product = models.Product.objects.create(title='product', description='-', price=10, collection=collection)
+        client = APIClient()
+        list_etag = client.get('/store/products/')['ETag']
+        detail_etag = client.get(f'/store/products/{product.pk}/')['ETag']
+        collection_etag = client.get('/store/collections/')['ETag']
+
+        models.Stock.objects.create(product=product, quantity_in_stock=5, threshold=1)
+
+        assert client.get('/store/products/', HTTP_IF_NONE_MATCH=list_etag).status_code == status.HTTP_200_OK
+        response = client.get(f'/store/products/{product.pk}/', HTTP_IF_NONE_MATCH=detail_etag)
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['status']['stock'] == 5
+        assert client.get('/store/collections/', HTTP_IF_NONE_MATCH=collection_etag).status_code == \
+            status.HTTP_304_NOT_MODIFIED
+
+    def test_any_tag_only_matches_existing_resources(self):
+        collection = models.Collection.objects.create(title='collection')
+        product = models.Product.objects.create(title='product', description='-', price=10, collection=collection)
+        client = APIClient()
+
+        assert client.get(f'/store/products/{product.pk}/', HTTP_IF_NONE_MATCH='*').status_code == \
+            status.HTTP_304_NOT_MODIFIED
+        assert client.get(f'/store/products/{product.pk + 1}/', HTTP_IF_NONE_MATCH='*').status_code == \
+            status.HTTP_404_NOT_FOUND
+
+    def test_promotion_side_changes_change_the_product_etag(self):
+        collection = models.Collection.objects.create(title='collection')
+        product = models.Product.objects.create(title='product', description='-', price=10, collection=collection)
+        now = timezone.now()
+        promotion = models.Promotion.objects.create(
+            title='sale', description='-', discount=0.5,
+            start_date=now + timedelta(days=1), end_date=now + timedelta(days=2))
+        client = APIClient()
+        url = f'/store/products/{product.pk}/'
+
+        for change in [lambda: promotion.product_set.add(product), lambda: promotion.product_set.clear()]:
+            etag = client.get(url)['ETag']
+            change()
+            assert client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == status.HTTP_200_OK
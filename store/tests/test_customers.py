@@ -0,0 +1,57 @@
+from decimal import Decimal
+
+import pytest
+from django.core.management import call_command
+from rest_framework.test import APIClient
+
+from core.models import User
+from store import models, orders
+
+
+def stats(client):
+    return {key: client.get('/store/customers/me/').data[key] for key in ['order_count', 'lifetime_spend']}
+
+
+@pytest.mark.django_db
+class TestCustomerOrderStats:
+
+    def test_orders_and_payments_keep_the_stats(self, lamp, buyer, place_order):
+        client = buyer()
+        first = models.Order.objects.get(pk=place_order(client, [(lamp, 2)]).data['id'])
+        second = models.Order.objects.get(pk=place_order(client, [(lamp, 3)]).data['id'])
+        assert stats(client) == {'order_count': 2, 'lifetime_spend': Decimal('0.00')}
+
+        first.payment_status = models.Order.status_complete
+        first.save()
+        orders.transition(models.Order.objects.filter(pk=second.pk), {'payment_status': models.Order.status_complete})
+        assert stats(client) == {'order_count': 2, 'lifetime_spend': Decimal('50.00')}
+
+        orders.transition(models.Order.objects.all(), {'payment_status': models.Order.status_pending})
+        assert stats(client)['lifetime_spend'] == Decimal('50.00')
+        first.payment_status = models.Order.status_fail
+        first.save()
+        assert stats(client)['lifetime_spend'] == Decimal('30.00')
+
+    def test_staff_sort_by_spend_without_aggregates(self, lamp, buyer, place_order, django_assert_num_queries):
+        for username, quantity in [('small', 1), ('big', 5)]:
+            place_order(buyer(username), [(lamp, quantity)])
+        orders.transition(models.Order.objects.all(), {'payment_status': models.Order.status_complete})
+        staff = APIClient()
+        staff.force_authenticate(User.objects.create(username='staff', email='staff@shop.com', is_staff=True))
+
+        with django_assert_num_queries(2) as captured:
+            response = staff.get('/store/customers/?ordering=-lifetime_spend')
+
+        assert not any('GROUP BY' in query['sql'] for query in captured.captured_queries)
+        assert [customer['lifetime_spend'] for customer in response.data['results']][:2] == [
+            Decimal('50.00'), Decimal('10.00')]
+
+    def test_reconcile_repairs_drift(self, lamp, buyer, place_order):
+        client = buyer()
+        place_order(client, [(lamp, 2)])
+        orders.transition(models.Order.objects.all(), {'payment_status': models.Order.status_complete})
+        models.Customer.objects.update(order_count=7, lifetime_spend=0)
+
+        call_command('reconcile_customers')
+
+        assert stats(client) == {'order_count': 1, 'lifetime_spend': Decimal('20.00')}
@@ -0,0 +1,91 @@
+import csv
+import io
+import json
+from decimal import Decimal
+
+import pytest
+from django.core.management import call_command
+from rest_framework.test import APIClient
+from rest_framework import status
+
+from core.models import User
+from store import models
+
+
+@pytest.fixture
+def order_history():
+    collection = models.Collection.objects.create(title='collection')
+    lamp, desk = [
+        models.Product.objects.create(title=title, description='-', price=price, collection=collection)
+        for title, price in [('lamp', 10), ('desk', 100)]
+    ]
+    customer = User.objects.create(username='buyer', email='buyer@shop.com').customer
+    placed = []
+    for payment_status, lines in [('C', [(lamp, 2), (desk, 1)]), ('P', [(lamp, 1)]), ('C', [(desk, 3)])]:
+        order = models.Order.objects.create(
+            customer=customer, payment_status=payment_status,
+            total=sum([product.price * quantity for product, quantity in lines]))
+        models.OrderItem.objects.bulk_create([
+            models.OrderItem(order=order, product=product, quantity=quantity,
+                             unit_price=product.price, sub_total=product.price * quantity)
+            for product, quantity in lines
+        ])
+        placed.append(order)
+    return placed
+
+
+@pytest.fixture
+def staff():
+    client = APIClient()
+    client.force_authenticate(User.objects.create(username='staff', email='staff@shop.com', is_staff=True))
+    return client
+
+
+def streamed(response):
+    return b''.join(response.streaming_content).decode()
+
+
+@pytest.mark.django_db
+class TestOrderExport:
+
+    def test_csv_has_a_row_per_line(self, staff, order_history):
+        response = staff.get('/store/orders/export/')
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response['Content-Type'] == 'text/csv'
+        rows = list(csv.DictReader(io.StringIO(streamed(response))))
+        assert [(int(row['order_id']), row['product_title'], row['quantity']) for row in rows] == [
+            (order_history[0].pk, 'lamp', '2'), (order_history[0].pk, 'desk', '1'),
+            (order_history[1].pk, 'lamp', '1'), (order_history[2].pk, 'desk', '3')
+        ]
+        assert rows[0]['total'] == '120.00'
+
+    def test_ndjson_has_an_object_per_order(self, staff, order_history):
+        response = staff.get('/store/orders/export/?as=ndjson&payment_status=C')
+
+        orders = [json.loads(line) for line in streamed(response).splitlines()]
+        assert [order['id'] for order in orders] == [order_history[0].pk, order_history[2].pk]
+        assert orders[0]['items'][1] == {
+            'product_id': orders[0]['items'][1]['product_id'], 'product_title': 'desk',
+            'quantity': 1, 'unit_price': '100.00', 'sub_total': '100.00'}
+
+    def test_reads_in_batches(self, order_history, django_assert_num_queries):
+        # two queries per batch of orders and one to find there are no more
+        output = io.StringIO()
+        with django_assert_num_queries(5):
+            call_command('export_orders', '--batch-size=2', '--placed-after=2000-01-01', stdout=output)
+
+        assert len(output.getvalue().splitlines()) == 5
+
+    def test_is_staff_only(self, order_history):
+        client = APIClient()
+        client.force_authenticate(User.objects.create(username='customer', email='customer@shop.com'))
+
+        assert client.get('/store/orders/export/').status_code == status.HTTP_403_FORBIDDEN
+
+    def test_command_writes_the_same_export(self, staff, order_history):
+        output = io.StringIO()
+        call_command('export_orders', '--format=ndjson', '--payment-status=P', stdout=output)
+
+        assert [json.loads(line)['id'] for line in output.getvalue().splitlines()] == [order_history[1].pk]
+        assert Decimal(json.loads(output.getvalue())['total']) == 10
@@ -0,0 +1,60 @@
+from decimal import Decimal
+
+import pytest
+from rest_framework.test import APIClient
+from rest_framework import status
+
+from store import models
+
+
+@pytest.fixture
+def catalog():
+    toys = models.Collection.objects.create(title='toys')
+    books = models.Collection.objects.create(title='books')
+    for title, price, collection, quantity, is_digital in [
+        ('ball', '5.00', toys, 10, False),
+        ('kite', '30.00', toys, 1, False),
+        ('novel', '12.00', books, None, True),
+        ('atlas', '120.00', books, 0, False),
+    ]:
+        product = models.Product.objects.create(
+            title=title, description='-', price=Decimal(price), collection=collection, is_digital=is_digital)
+        if quantity is not None:
+            models.Stock.objects.create(product=product, quantity_in_stock=quantity, threshold=2)
+    return toys, books
+
+
+@pytest.mark.django_db
+class TestProductFacets:
+
+    def test_counts_every_facet_in_one_query(self, catalog, django_assert_num_queries):
+        toys, books = catalog
+
+        with django_assert_num_queries(1):
+            response = APIClient().get('/store/products/facets/?price__lt=50')
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data == {
+            'count': 3,
+            'collection': {str(toys.pk): 2, str(books.pk): 1},
+            'price': {'0-10': 1, '10-25': 1, '25-50': 1, '50-100': 0, '100+': 0},
+            'is_digital': {'true': 1, 'false': 2},
+            'stock': {'ok': 1, 'low': 1, 'out': 1}
+        }
+
+    def test_facets_follow_search(self, catalog):
+        response = APIClient().get('/store/products/facets/?search=novel')
+
+        assert response.data['count'] == 1
+        assert response.data['is_digital'] == {'true': 1, 'false': 0}
+        assert response.data['stock'] == {'ok': 0, 'low': 0, 'out': 1}
+
+    def test_unfiltered_facets_are_cached_until_products_change(self, catalog, django_assert_num_queries):
+        client = APIClient()
+        client.get('/store/products/facets/')
+
+        with django_assert_num_queries(1):
+            cached = client.get('/store/products/facets/').data
+
+        assert cached['count'] == 4
+        assert cached['stock'] == {'ok': 1, 'low': 1, 'out': 2}
@@ -0,0 +1,107 @@
+from datetime import timedelta
+from decimal import Decimal
+
+import pytest
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework import status
+
+from core.models import User
+from store import fastpath, models
+
+
+def create_promotion(discount):
+    now = timezone.now()
+    return models.Promotion.objects.create(
+        title=f'promotion {discount}', description='-', discount=discount,
+        start_date=now - timedelta(days=1), end_date=now + timedelta(days=1))
+
+
+def create_product(collection, price, title):
+    product = models.Product.objects.create(
+        title=title, description='-', price=price, collection=collection)
+    models.Stock.objects.create(product=product, quantity_in_stock=10, threshold=2)
+    return product
+
+
+@pytest.fixture
+def catalog():
+    promotion = create_promotion(0.25)
+    discounted = models.Collection.objects.create(title='discounted', promotion=promotion)
+    plain = models.Collection.objects.create(title='plain')
+    products = [
+        create_product(discounted, price=Decimal('19.99'), title='lamp'),
+        create_product(plain, price=Decimal('5.50'), title='mug'),
+        models.Product.objects.create(
+            title='ebook', description='-', price=Decimal('7.00'), collection=plain, is_digital=True)
+    ]
+    products[0].promotions.add(create_promotion(0.1), create_promotion(0.3))
+    models.Stock.objects.filter(product=products[1]).update(quantity_in_stock=1)
+    discounted.featured_product = products[0]
+    discounted.save()
+
+    users = [User.objects.create(username=f'user{index}', email=f'user{index}@shop.com') for index in range(2)]
+    for user, rating in zip(users, ['4.5', '2']):
+        models.Review.objects.create(customer=user.customer, product=products[0], rating=rating, description='-')
+
+    for user in users:
+        order = models.Order.objects.create(customer=user.customer)
+        for quantity, product in enumerate(products[:2], start=1):
+            models.OrderItem.objects.create(order=order, product=product, quantity=quantity, unit_price=product.price)
+
+    admin = User.objects.create(username='admin', email='admin@shop.com', is_staff=True)
+    return products, admin
+
+
+def assert_same_bytes(settings, client, url):
+    settings.STORE_FAST_READS = False
+    expected = client.get(url)
+    settings.STORE_FAST_READS = True
+    actual = client.get(url)
+
+    assert expected.status_code == status.HTTP_200_OK
+    assert actual.content == expected.content
+
+
+@pytest.mark.django_db
+class TestFastReads:
+
+    @pytest.mark.parametrize('query', [
+        '', '?ordering=-price', '?fields=id,new_price,status', '?omit=description&expand=stock',
+        '?search=lamp', '?cursor=&ordering=-price&limit=2', '?collection_id=2'
+    ])
+    def test_products_match_serializer(self, settings, catalog, query):
+        assert_same_bytes(settings, APIClient(), f'/store/products/{query}')
+
+    # grouped querysets ignore Meta.ordering, so these pin an explicit order
+    @pytest.mark.parametrize('query', [
+        '?ordering=title', '?ordering=title&expand=promotion', '?ordering=-products_count', '?fields=id,title'
+    ])
+    def test_collections_match_serializer(self, settings, catalog, query):
+        assert_same_bytes(settings, APIClient(), f'/store/collections/{query}')
+
+    @pytest.mark.parametrize('query', ['', '?ordering=-rating', '?cursor=&limit=1'])
+    def test_reviews_match_serializer(self, settings, catalog, query):
+        products, _ = catalog
+        assert_same_bytes(settings, APIClient(), f'/store/products/{products[0].pk}/reviews/{query}')
+
+    @pytest.mark.parametrize('query', ['?ordering=placed_at', '?ordering=-placed_at&fields=id,total', '?cursor=&limit=1'])
+    def test_orders_match_serializer(self, settings, catalog, query):
+        _, admin = catalog
+        client = APIClient()
+        client.force_authenticate(admin)
+        assert_same_bytes(settings, client, f'/store/orders/{query}')
+
+    def test_listing_uses_the_compiled_reader(self, settings, catalog, django_assert_num_queries):
+        settings.STORE_FAST_READS = True
+        client = APIClient()
+        client.get('/store/products/')
+
+        # count, page and the promotions of the page on top of the two ETag queries
+        with django_assert_num_queries(5) as context:
+            response = client.get('/store/products/')
+
+        assert response.status_code == status.HTTP_200_OK
+        assert 'store_stock' in context.captured_queries[-2]['sql']
+        assert fastpath._readers and None not in fastpath._readers.values()
+
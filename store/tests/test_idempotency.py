@@ -0,0 +1,129 @@
+import threading
+from datetime import timedelta
+from uuid import uuid4
+
+import pytest
+from django.db import connection
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework import status
+
+from core.models import User
+from store import idempotency, models
+from store.mixins import IdempotencyMixin
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('lamp', [{'stock': 5}], indirect=True)
+class TestIdempotentOrders:
+
+    def test_retries_replay_the_order(self, lamp, buyer, fill_cart, django_assert_num_queries):
+        client = buyer()
+        cart_id = fill_cart(client, [(lamp, 2)])
+        placed = client.post('/store/orders/', {'cart_id': cart_id}, HTTP_IDEMPOTENCY_KEY='order-1')
+
+        # the recorded response is read back, nothing runs again
+        with django_assert_num_queries(1):
+            retried = client.post('/store/orders/', {'cart_id': cart_id}, HTTP_IDEMPOTENCY_KEY='order-1')
+
+        assert placed.status_code == retried.status_code == status.HTTP_200_OK
+        assert retried.data == placed.data
+        assert retried['Idempotent-Replayed'] == 'true'
+        assert models.Order.objects.count() == 1
+        assert models.Stock.objects.get(pk=lamp.pk).quantity_in_stock == 3
+
+    def test_keys_are_scoped_to_the_user(self, lamp, buyer, fill_cart):
+        first = buyer('first')
+        first_cart = fill_cart(first, [(lamp, 2)])
+        second = buyer('second')
+        second_cart = fill_cart(second, [(lamp, 2)])
+
+        first.post('/store/orders/', {'cart_id': first_cart}, HTTP_IDEMPOTENCY_KEY='order-1')
+        response = second.post('/store/orders/', {'cart_id': second_cart}, HTTP_IDEMPOTENCY_KEY='order-1')
+
+        assert response.status_code == status.HTTP_200_OK
+        assert 'Idempotent-Replayed' not in response
+        assert models.Order.objects.count() == 2
+
+    def test_a_reused_key_with_another_body_is_refused(self, lamp, buyer, fill_cart):
+        client = buyer()
+        cart_id = fill_cart(client, [(lamp, 2)])
+        client.post('/store/orders/', {'cart_id': cart_id}, HTTP_IDEMPOTENCY_KEY='order-1')
+
+        other_cart = fill_cart(buyer('other'), [(lamp, 2)])
+        response = client.post('/store/orders/', {'cart_id': other_cart}, HTTP_IDEMPOTENCY_KEY='order-1')
+
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+    def test_cart_item_posts_are_replayed(self, lamp):
+        client = APIClient()
+        cart_id = client.post('/store/carts/').data['id']
+        for _ in range(2):
+            client.post(f'/store/carts/{cart_id}/items/', {'product_id': lamp.pk, 'quantity': 1},
+                        HTTP_IDEMPOTENCY_KEY='item-1')
+
+        assert models.CartItem.objects.get(cart_id=cart_id).quantity == 1
+
+    def test_a_key_in_use_by_another_worker_is_refused_until_it_lapses(self, lamp, buyer, fill_cart, monkeypatch):
+        monkeypatch.setattr(IdempotencyMixin, 'idempotency_wait', 0)
+        client = buyer()
+        cart_id = fill_cart(client, [(lamp, 2)])
+        user = User.objects.get(username='buyer')
+        now = timezone.now()
+        models.IdempotencyRecord.objects.create(
+            key=idempotency.record_key((user.pk, '/store/orders/'), 'order-1'), fingerprint='-',
+            locked_until=now + timedelta(minutes=1), expires_at=now + timedelta(days=1))
+
+        busy = client.post('/store/orders/', {'cart_id': cart_id}, HTTP_IDEMPOTENCY_KEY='order-1')
+        models.IdempotencyRecord.objects.update(locked_until=now)
+        placed = client.post('/store/orders/', {'cart_id': cart_id}, HTTP_IDEMPOTENCY_KEY='order-1')
+
+        assert busy.status_code == status.HTTP_409_CONFLICT
+        assert placed.status_code == status.HTTP_200_OK
+        assert models.IdempotencyRecord.objects.get().status_code == status.HTTP_200_OK
+
+    def test_failed_requests_free_the_key(self, lamp, buyer, fill_cart):
+        client = buyer()
+        fill_cart(client, [(lamp, 2)])
+        refused = client.post('/store/orders/', {'cart_id': str(uuid4())}, HTTP_IDEMPOTENCY_KEY='order-1')
+
+        assert refused.status_code == status.HTTP_400_BAD_REQUEST
+        assert not models.IdempotencyRecord.objects.exists()
+
+    def test_lapsed_keys_are_expired(self, lamp, buyer, fill_cart):
+        client = buyer()
+        cart_id = fill_cart(client, [(lamp, 2)])
+        client.post('/store/orders/', {'cart_id': cart_id}, HTTP_IDEMPOTENCY_KEY='order-1')
+        models.IdempotencyRecord.objects.update(expires_at=timezone.now())
+
+        assert idempotency.expire(batch_size=1) == 1
+        assert not models.IdempotencyRecord.objects.exists()
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.parametrize('lamp', [{'stock': 5}], indirect=True)
+class TestConcurrentDuplicates:
+
+    def test_concurrent_duplicates_place_one_order(self, lamp, buyer, fill_cart):
+        client = buyer()
+        cart_id = fill_cart(client, [(lamp, 2)])
+        barrier = threading.Barrier(4)
+        responses = []
+
+        def place():
+            try:
+                barrier.wait()
+                responses.append(client.post(
+                    '/store/orders/', {'cart_id': cart_id}, HTTP_IDEMPOTENCY_KEY='order-1'))
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=place) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert [response.status_code for response in responses] == [status.HTTP_200_OK] * 4
+        assert len({response.data['id'] for response in responses}) == 1
+        assert models.Order.objects.count() == 1
@@ -0,0 +1,111 @@
+import io
+import json
+
+import pytest
+from django.contrib.auth.hashers import check_password, make_password
+from django.core.management import call_command
+from django.test import override_settings
+
+from core.models import User
+from store import imports, models
+
+NAMES = {'first_name': 'Ann', 'last_name': 'Lee'}
+HEADER = 'username,email,first_name,last_name,password,password_hash,phone,birth_date,membership\n'
+
+
+def import_file(tmp_path, name, content, *args):
+    path = tmp_path / name
+    path.write_text(content)
+    out, err = io.StringIO(), io.StringIO()
+    call_command('import_customers', str(path), '--workers=0', *args, stdout=out, stderr=err)
+    return out.getvalue(), err.getvalue()
+
+
+@pytest.mark.django_db
+class TestImportCustomers:
+
+    def test_csv_rows_become_users_and_customers(self, tmp_path):
+        out, err = import_file(tmp_path, 'customers.csv', HEADER + (
+            'ann,ann@shop.com,Ann,Lee,secret-1,,555,1990-04-01,G\n'
+            f'bob,bob@shop.com,Bob,Ray,,{make_password("secret-2")},,,\n'
+            'cid,cid@shop.com,Cid,Day,,,,,\n'
+        ))
+
+        ann, bob, cid = User.objects.order_by('username')
+        assert 'imported 3 customers, 0 rows failed' in out
+        assert err == ''
+        assert check_password('secret-1', ann.password)
+        assert check_password('secret-2', bob.password)
+        assert not cid.has_usable_password()
+        assert (ann.customer.phone, str(ann.customer.birth_date), ann.customer.membership) == ('555', '1990-04-01', 'G')
+        assert bob.customer.membership == models.Customer.membership_bronze
+        assert models.Customer.objects.count() == 3
+
+    def test_bad_rows_are_reported_and_the_rest_imported(self, tmp_path):
+        User.objects.create(username='taken', email='taken@shop.com')
+        out, err = import_file(tmp_path, 'customers.csv', HEADER + (
+            'ann,ann@shop.com,Ann,Lee,secret,,,,\n'
+            'ann,other@shop.com,Ann,Lee,secret,,,,\n'
+            'taken,new@shop.com,Tom,Ken,secret,,,,\n'
+            'dan,not-an-email,Dan,Fox,secret,,,,\n'
+            'eve,eve@shop.com,Eve,Nolan,,not-a-hash,,,\n'
+            'fay,fay@shop.com,Fay,Owens,secret,,,01/02/1990,\n'
+        ), '--batch-size=3')
+
+        assert 'imported 1 customers, 5 rows failed' in out
+        assert err.splitlines() == [
+            'row 3: duplicates an earlier row',
+            'row 4: username or email already exists',
+            'row 5: email: Enter a valid email address.',
+            'row 6: password_hash: Unknown password hash format',
+            'row 7: birth_date: Use the YYYY-MM-DD format',
+        ]
+        assert set(User.objects.values_list('username', flat=True)) == {'taken', 'ann'}
+
+    def test_json_and_json_lines(self, tmp_path):
+        rows = [{'username': f'user{index}', 'email': f'user{index}@shop.com', **NAMES, 'password': 'secret'}
+                for index in range(5)]
+        import_file(tmp_path, 'customers.json', json.dumps(rows[:3], indent=2))
+        import_file(tmp_path, 'customers.jsonl', '\n'.join(json.dumps(row) for row in rows[3:]) + '\n')
+
+        assert User.objects.count() == models.Customer.objects.count() == 5
+
+    def test_undecodable_rows_are_reported(self, tmp_path):
+        row = json.dumps({'username': 'ann', 'email': 'ann@shop.com', **NAMES})
+        out, err = import_file(tmp_path, 'customers.jsonl', f'{{"username": "bob",\n[1, 2]\n{row}\n')
+
+        assert 'imported 1 customers, 2 rows failed' in out
+        assert [line.split(':')[:2] for line in err.splitlines()] == [['row 1', ' row'], ['row 2', ' row']]
+        assert 'Expected an object' in err
+
+        out, err = import_file(tmp_path, 'customers.json', f'[{row}, {{"username": ]')
+
+        assert 'imported 0 customers, 2 rows failed' in out
+        assert err.splitlines()[0] == 'row 1: username or email already exists'
+        assert err.splitlines()[1].startswith('row 2: row: Invalid JSON')
+
+    def test_json_arrays_are_read_in_chunks(self):
+        rows = [{'username': f'user{index}', 'note': 'x' * index} for index in range(50)]
+        assert list(imports.iter_json_array(io.StringIO(json.dumps(rows)), chunk_size=16)) == rows
+
+    def test_batches_take_constant_statements(self, django_assert_num_queries):
+        rows = [(index, {'username': f'user{index}', 'email': f'user{index}@shop.com', **NAMES}) for index in range(20)]
+
+        # existing accounts, users, customers and the savepoint pair
+        with django_assert_num_queries(5):
+            assert imports.import_batch(rows) == (20, [])
+
+
+@pytest.mark.django_db(transaction=True)
+class TestPooledHashing:
+
+    @override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+    def test_passwords_are_hashed_in_worker_processes(self):
+        rows = [(index, {'username': f'user{index}', 'email': f'user{index}@shop.com', 'password': f'pw{index}',
+                         **NAMES}) for index in range(10)]
+
+        results = list(imports.import_customers(rows, batch_size=4, workers=2))
+
+        assert [imported for imported, _ in results] == [4, 4, 2]
+        for user in User.objects.all():
+            assert check_password('pw' + user.username[4:], user.password)
@@ -0,0 +1,86 @@
+import time
+
+import pytest
+from django.db import DatabaseError
+from django.core.management import call_command
+from rest_framework import status
+
+from store import models, reservations
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('lamp', [{'stock': 3}], indirect=True)
+class TestQueuedOrders:
+
+    @pytest.fixture(autouse=True)
+    def queued(self, settings):
+        settings.ORDER_FINALIZE_ASYNC = True
+        settings.ORDER_WORKERS = 0
+
+    def test_placing_queues_the_order_and_the_worker_settles_it(
+            self, lamp, buyer, fill_cart, django_capture_on_commit_callbacks):
+        client = buyer()
+        cart_id = fill_cart(client, [(lamp, 2)])
+
+        with django_capture_on_commit_callbacks() as callbacks:
+            response = client.post('/store/orders/', {'cart_id': cart_id})
+
+        assert response.status_code == status.HTTP_202_ACCEPTED
+        assert response.data['processing_status'] == models.Order.processing_queued
+        assert models.Stock.objects.get(pk=lamp.pk).quantity_in_stock == 3
+        assert reservations.available([lamp.pk]) == {lamp.pk: 1}
+        assert not models.Cart.objects.filter(pk=cart_id).exists()
+
+        for callback in callbacks:
+            callback()
+        polled = client.get(response['Location'])
+
+        assert polled.data == {
+            'id': response.data['id'], 'processing_status': models.Order.processing_finalized, 'processing_error': ''}
+        assert models.Stock.objects.get(pk=lamp.pk).quantity_in_stock == 1
+        assert models.OrderItem.objects.get().unit_price == 10
+        assert not models.StockReservation.objects.exists()
+
+    def test_a_shortfall_fails_the_order(self, lamp, buyer, place_order):
+        order_id = place_order(buyer(), [(lamp, 2)]).data['id']
+        models.Stock.objects.filter(pk=lamp.pk).update(quantity_in_stock=1)
+
+        call_command('finalize_orders')
+
+        order = models.Order.objects.get(pk=order_id)
+        assert order.processing_status == models.Order.processing_failed
+        assert order.processing_error
+        assert models.Stock.objects.get(pk=lamp.pk).quantity_in_stock == 1
+        assert not models.StockReservation.objects.exists()
+
+    def test_status_is_private_to_the_customer(self, lamp, buyer, place_order):
+        order_id = place_order(buyer(), [(lamp, 2)]).data['id']
+
+        other = buyer('other')
+
+        assert other.get(f'/store/orders/{order_id}/status/').status_code == status.HTTP_404_NOT_FOUND
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.parametrize('lamp', [{'stock': 3}], indirect=True)
+class TestWorkerPool:
+
+    def test_pool_finalizes_in_the_background(self, lamp, buyer, place_order, settings):
+        settings.ORDER_FINALIZE_ASYNC = True
+        client = buyer()
+        location = place_order(client, [(lamp, 2)])['Location']
+
+        # sqlite's shared cache refuses reads of a table being written to, the
+        # poll is retried then
+        deadline = time.monotonic() + 5
+        processing_status = models.Order.processing_queued
+        while processing_status == models.Order.processing_queued:
+            assert time.monotonic() < deadline
+            time.sleep(0.05)
+            try:
+                processing_status = client.get(location).data['processing_status']
+            except DatabaseError:
+                pass
+
+        assert processing_status == models.Order.processing_finalized
+        assert models.Stock.objects.get(pk=lamp.pk).quantity_in_stock == 1
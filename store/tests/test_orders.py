@@ -0,0 +1,59 @@
+from datetime import timedelta
+from decimal import Decimal
+
+import pytest
+from django.core.management import call_command
+from django.utils import timezone
+from rest_framework import status
+
+from store import models
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('lamp', [{'price': Decimal('9.99')}], indirect=True)
+class TestOrderTotals:
+
+    def test_totals_are_persisted_at_checkout(self, buyer, lamp, place_order):
+        client = buyer()
+        response = place_order(client, [(lamp, 3)])
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['total'] == Decimal('29.97')
+        assert response.data['item'][0]['unit_price'] == Decimal('9.99')
+        assert response.data['item'][0]['sub_total'] == Decimal('29.97')
+        assert models.Order.objects.get().total == Decimal('29.97')
+
+    def test_promotions_do_not_reprice_past_orders(self, buyer, lamp, place_order):
+        client = buyer()
+        order_id = place_order(client, [(lamp, 2)]).data['id']
+        now = timezone.now()
+        promotion = models.Promotion.objects.create(
+            title='sale', description='-', discount=0.5,
+            start_date=now - timedelta(days=1), end_date=now + timedelta(days=1))
+        lamp.promotions.add(promotion)
+
+        order = client.get(f'/store/orders/{order_id}/').data
+
+        assert order['total'] == Decimal('19.98')
+        assert order['item'][0]['unit_price'] == Decimal('9.99')
+
+    def test_order_reads_do_not_grow_with_the_orders(self, buyer, lamp, place_order, django_assert_max_num_queries):
+        client = buyer()
+        for quantity in range(1, 6):
+            place_order(client, [(lamp, quantity)])
+
+        with django_assert_max_num_queries(4):
+            response = client.get('/store/orders/')
+
+        assert response.data['count'] == 5
+
+    def test_backfill_stores_missing_totals(self, buyer, lamp, place_order):
+        client = buyer()
+        place_order(client, [(lamp, 2)])
+        models.Order.objects.update(total=None)
+        models.OrderItem.objects.update(sub_total=None)
+
+        call_command('backfill_order_totals', batch_size=1)
+
+        assert models.Order.objects.get().total == Decimal('19.98')
+        assert models.OrderItem.objects.get().sub_total == Decimal('19.98')
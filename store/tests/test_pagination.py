@@ -0,0 +1,88 @@
+from decimal import Decimal
+
+import pytest
+from rest_framework.test import APIClient
+from rest_framework import status
+
+from core.models import User
+from store import models, pagination
+
+
+def create_products(count):
+    collection = models.Collection.objects.create(title='collection')
+    return [
+        models.Product.objects.create(
+            title=f'product {index:02}', description='-',
+            price=Decimal(10 + index % 3), collection=collection)
+        for index in range(count)
+    ]
+
+
+@pytest.mark.django_db
+class TestCursorPagination:
+
+    def test_pages_cover_every_product_once_in_order(self):
+        create_products(25)
+        client = APIClient()
+
+        url = '/store/products/?cursor=&ordering=-price&limit=10'
+        seen = []
+        while url:
+            response = client.get(url)
+            assert response.status_code == status.HTTP_200_OK
+            assert 'count' not in response.data
+            seen += [(product['price'], product['id']) for product in response.data['results']]
+            url = response.data['next']
+
+        assert len(seen) == 25
+        assert seen == sorted(seen, key=lambda item: (-item[0], -item[1]))
+
+    def test_insert_does_not_shift_next_page(self):
+        products = create_products(12)
+        client = APIClient()
+
+        first = client.get('/store/products/?cursor=&ordering=title&limit=5').data
+        models.Product.objects.create(
+            title='product 00a', description='-', price=1, collection=products[0].collection)
+        second = client.get(first['next']).data
+
+        assert second['results'][0]['title'] == 'product 05'
+        previous = client.get(second['previous']).data
+        assert [product['id'] for product in previous['results']][-4:] == \
+            [product['id'] for product in first['results']][-4:]
+
+    def test_unsupported_ordering_is_rejected(self):
+        response = APIClient().get('/store/products/?cursor=&ordering=stock__quantity_in_stock')
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db
+class TestCountModes:
+
+    def test_count_is_cached_until_exact_is_requested(self):
+        product = create_products(1)[0]
+        users = [User.objects.create(username=f'user{index}', email=f'user{index}@shop.com') for index in range(2)]
+        models.Review.objects.create(customer=users[0].customer, product=product, rating='4', description='-')
+        url = f'/store/products/{product.pk}/reviews/'
+        client = APIClient()
+
+        first = client.get(url).data
+        models.Review.objects.create(customer=users[1].customer, product=product, rating='5', description='-')
+        cached = client.get(url).data
+        exact = client.get(url + '?count=exact').data
+
+        assert (first['count'], first['count_is_exact']) == (1, True)
+        assert (cached['count'], cached['count_is_exact']) == (1, False)
+        assert (exact['count'], exact['count_is_exact']) == (2, True)
+
+    def test_large_unfiltered_tables_use_the_estimate(self, monkeypatch):
+        products = create_products(3)
+        monkeypatch.setattr(pagination, 'estimate_count', lambda queryset: 250000)
+        client = APIClient()
+
+        estimated = client.get('/store/products/').data
+        filtered = client.get(f'/store/products/?collection_id={products[0].collection_id}').data
+
+        assert (estimated['count'], estimated['count_is_exact']) == (250000, False)
+        assert (filtered['count'], filtered['count_is_exact']) == (3, True)
@@ -0,0 +1,143 @@
+from datetime import timedelta
+from decimal import Decimal
+
+import pytest
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework import status
+
+from core.models import User
+from store import models
+
+
+def create_promotion(discount, starts_in=-1, ends_in=1):
+    now = timezone.now()
+    return models.Promotion.objects.create(
+        title=f'promotion {discount}', description='-', discount=discount,
+        start_date=now + timedelta(days=starts_in),
+        end_date=now + timedelta(days=ends_in)
+    )
+
+
+def create_product(collection, price=Decimal('100.00'), title='product'):
+    product = models.Product.objects.create(
+        title=title, description='-', price=price, collection=collection)
+    models.Stock.objects.create(product=product, quantity_in_stock=10, threshold=2)
+    return product
+
+
+@pytest.mark.django_db
+class TestEffectivePrice:
+
+    def test_product_promotion_wins_over_collection_promotion(self):
+        collection = models.Collection.objects.create(
+            title='collection', promotion=create_promotion(0.5))
+        product = create_product(collection)
+        best = create_promotion(0.2)
+        product.promotions.add(create_promotion(0.1), best, create_promotion(0.9, starts_in=1, ends_in=2))
+
+        annotated = models.Product.objects.with_effective_price().get(pk=product.pk)
+
+        assert annotated.effective_promotion_id == best.id
+        assert annotated.new_price == Decimal('100.00') * Decimal(1 - 0.2)
+
+    def test_active_collection_promotion_applies(self):
+        promotion = create_promotion(0.25)
+        collection = models.Collection.objects.create(title='collection', promotion=promotion)
+        product = create_product(collection)
+        product.promotions.add(create_promotion(0.9, starts_in=-3, ends_in=-2))
+
+        annotated = models.Product.objects.with_effective_price().get(pk=product.pk)
+
+        assert annotated.effective_promotion_id == promotion.id
+        assert annotated.new_price == Decimal('75.00')
+        assert product.new_price == annotated.new_price
+
+    def test_no_active_promotion_keeps_price(self):
+        collection = models.Collection.objects.create(
+            title='collection', promotion=create_promotion(0.5, starts_in=2, ends_in=3))
+        product = create_product(collection)
+
+        annotated = models.Product.objects.with_effective_price().get(pk=product.pk)
+
+        assert annotated.effective_promotion_id is None
+        assert annotated.new_price == Decimal('100.00')
+
+    def test_listing_products_runs_constant_queries(self, django_assert_max_num_queries):
+        collection = models.Collection.objects.create(
+            title='collection', promotion=create_promotion(0.5))
+        for index in range(10):
+            create_product(collection, title=f'product {index}').promotions.add(create_promotion(0.1))
+
+        with django_assert_max_num_queries(5):
+            response = APIClient().get('/store/products/')
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['count'] == 10
+
+    def test_price_follows_promotion_schedule(self):
+        collection = models.Collection.objects.create(title='collection')
+        product = create_product(collection)
+        promotion = create_promotion(0.5, starts_in=1, ends_in=2)
+        product.promotions.add(promotion)
+        in_promotion = timezone.now() + timedelta(days=1, hours=1)
+        after_promotion = timezone.now() + timedelta(days=3)
+
+        assert models.Product.objects.with_effective_price().get(pk=product.pk).new_price == Decimal('100.00')
+        assert models.Product.objects.with_effective_price(in_promotion).get(pk=product.pk).new_price == Decimal('50.00')
+        assert models.Product.objects.with_effective_price(after_promotion).get(pk=product.pk).new_price == Decimal('100.00')
+
+        promotion.end_date = promotion.start_date
+        promotion.save()
+
+        assert models.Product.objects.with_effective_price(in_promotion).get(pk=product.pk).new_price == Decimal('100.00')
+
+
+@pytest.mark.django_db
+class TestRatingAggregates:
+
+    def test_reviews_maintain_product_rating(self):
+        product = create_product(models.Collection.objects.create(title='collection'))
+        customers = [
+            User.objects.create(username=f'user{index}', email=f'user{index}@shop.com').customer
+            for index in range(3)
+        ]
+        reviews = [
+            models.Review.objects.create(customer=customer, product=product, rating=rating, description='-')
+            for customer, rating in zip(customers, ['5', '4.5', '2'])
+        ]
+        reviews[2].rating = '4'
+        reviews[2].save()
+        reviews[0].delete()
+
+        response = APIClient().get(f'/store/products/{product.pk}/')
+
+        assert response.data['num_reviews'] == 2
+        assert response.data['average_rating'] == 4
+        assert response.data['rating_histogram']['4.5'] == 1
+        assert response.data['rating_histogram']['4'] == 1
+        assert response.data['rating_histogram']['5'] == 0
+
+
+@pytest.mark.django_db
+class TestSparseFieldsets:
+
+    def test_fields_omit_and_expand(self):
+        product = create_product(models.Collection.objects.create(title='collection'))
+        client = APIClient()
+
+        thin = client.get(f'/store/products/{product.pk}/?fields=id,title,price').data
+        omitted = client.get(f'/store/products/{product.pk}/?omit=description,promotions').data
+        expanded = client.get(f'/store/products/{product.pk}/?fields=id&expand=stock').data
+
+        assert list(thin) == ['id', 'title', 'price']
+        assert 'description' not in omitted and 'promotions' not in omitted and 'new_price' in omitted
+        assert expanded == {'id': product.pk, 'stock': {'product_id': product.pk, 'quantity_in_stock': 10, 'threshold': 2}}
+
+    def test_thin_listing_skips_joins_and_prefetches(self, django_assert_num_queries):
+        create_product(models.Collection.objects.create(title='collection'))
+
+        with django_assert_num_queries(4) as context:
+            APIClient().get('/store/products/?fields=id,title,price')
+
+        assert 'store_collection' not in context.captured_queries[-1]['sql']
@@ -0,0 +1,71 @@
+from datetime import timedelta
+from uuid import uuid4
+
+import pytest
+from django.db import DatabaseError
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework import status
+
+from store import models, reservations
+from store.carts import DatabaseCartBackend
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('lamp', [{'stock': 3}], indirect=True)
+class TestStockReservations:
+
+    def test_carts_can_not_hold_more_than_is_available(self, lamp):
+        client = APIClient()
+        first, second = [client.post('/store/carts/').data['id'] for _ in range(2)]
+
+        held = client.post(f'/store/carts/{first}/items/', {'product_id': lamp.pk, 'quantity': 2})
+        refused = client.post(f'/store/carts/{second}/items/', {'product_id': lamp.pk, 'quantity': 2})
+        accepted = client.post(f'/store/carts/{second}/items/', {'product_id': lamp.pk, 'quantity': 1})
+
+        assert held.status_code == status.HTTP_201_CREATED
+        assert refused.status_code == status.HTTP_400_BAD_REQUEST
+        assert accepted.status_code == status.HTTP_201_CREATED
+        assert reservations.available([lamp.pk]) == {lamp.pk: 0}
+
+    @pytest.mark.parametrize('backend', ['store.carts.DatabaseCartBackend', 'store.carts.CacheCartBackend'])
+    def test_unknown_carts_hold_nothing(self, settings, backend, lamp):
+        settings.CART_BACKEND = backend
+        client = APIClient()
+        items_url = f'/store/carts/{uuid4()}/items/'
+
+        single = client.post(items_url, {'product_id': lamp.pk, 'quantity': 3})
+        bulk = client.post(f'{items_url}bulk/', [{'product_id': lamp.pk, 'quantity': 3}], format='json')
+
+        assert single.status_code == bulk.status_code == status.HTTP_404_NOT_FOUND
+        assert not models.StockReservation.objects.exists()
+        assert reservations.available([lamp.pk]) == {lamp.pk: 3}
+
+    def test_a_failed_quantity_change_keeps_the_previous_hold(self, lamp, fill_cart, monkeypatch):
+        client = APIClient()
+        cart_id = fill_cart(client, [(lamp, 1)])
+        item_id = models.CartItem.objects.get().pk
+
+        def fail(self, item, quantity):
+            raise DatabaseError
+        monkeypatch.setattr(DatabaseCartBackend, 'set_quantity', fail)
+        with pytest.raises(DatabaseError):
+            client.patch(f'/store/carts/{cart_id}/items/{item_id}/', {'quantity': 3})
+
+        assert models.StockReservation.objects.get().quantity == 1
+
+    def test_lapsed_holds_free_the_stock_and_are_swept(self, lamp, fill_cart):
+        fill_cart(APIClient(), [(lamp, 3)])
+        models.StockReservation.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+
+        assert reservations.available([lamp.pk]) == {lamp.pk: 3}
+        assert reservations.expire(batch_size=1) == 1
+        assert not models.StockReservation.objects.exists()
+
+    def test_checkout_turns_holds_into_stock_decrements(self, lamp, buyer, place_order):
+        response = place_order(buyer(), [(lamp, 2)])
+
+        assert response.status_code == status.HTTP_200_OK
+        assert models.Stock.objects.get(pk=lamp.pk).quantity_in_stock == 1
+        assert not models.StockReservation.objects.exists()
+        assert reservations.available([lamp.pk]) == {lamp.pk: 1}
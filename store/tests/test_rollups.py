@@ -0,0 +1,96 @@
+from decimal import Decimal
+
+import pytest
+from django.contrib.admin.sites import site
+from django.core.management import call_command
+from django.test import RequestFactory
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework import status
+
+from core.models import User
+from store import models
+
+
+@pytest.fixture
+def catalog():
+    toys = models.Collection.objects.create(title='toys')
+    ball, kite = [
+        models.Product.objects.create(title=title, description='-', price=price, collection=toys)
+        for title, price in [('ball', Decimal('5.00')), ('kite', Decimal('20.00'))]
+    ]
+    models.Stock.objects.bulk_create([
+        models.Stock(product=product, quantity_in_stock=100, threshold=1) for product in [ball, kite]
+    ])
+    return toys, ball, kite
+
+
+def rollup(model, **key):
+    return model.objects.values(
+        'units', 'revenue', 'orders', 'paid_units', 'paid_revenue', 'paid_orders').get(
+        day=timezone.localdate(), **key)
+
+
+@pytest.mark.django_db
+class TestSalesRollups:
+
+    def test_checkout_adds_to_the_rollups(self, buyer, place_order, catalog):
+        client = buyer()
+        toys, ball, kite = catalog
+        place_order(client, [(ball, 2), (kite, 1)])
+        place_order(client, [(ball, 1)])
+
+        assert rollup(models.ProductDailySales, product=ball) == {
+            'units': 3, 'revenue': Decimal('15.00'), 'orders': 2,
+            'paid_units': 0, 'paid_revenue': Decimal('0.00'), 'paid_orders': 0}
+        assert rollup(models.CollectionDailySales, collection=toys) == {
+            'units': 4, 'revenue': Decimal('35.00'), 'orders': 2,
+            'paid_units': 0, 'paid_revenue': Decimal('0.00'), 'paid_orders': 0}
+
+    def test_payment_changes_move_the_paid_columns(self, buyer, place_order, catalog):
+        client = buyer()
+        toys, ball, kite = catalog
+        first = models.Order.objects.get(pk=place_order(client, [(ball, 2), (kite, 1)]).data['id'])
+        second = models.Order.objects.get(pk=place_order(client, [(ball, 1)]).data['id'])
+
+        admin = site._registry[models.Order]
+        admin.message_user = lambda *args: None
+        admin.payment_complete(RequestFactory().get('/'), models.Order.objects.all())
+        second.payment_status = models.Order.status_fail
+        second.save()
+
+        paid = rollup(models.CollectionDailySales, collection=toys)
+        assert (paid['paid_units'], paid['paid_revenue'], paid['paid_orders']) == (3, Decimal('30.00'), 1)
+        assert models.Order.objects.get(pk=first.pk).payment_status == models.Order.status_complete
+
+    def test_rebuild_matches_the_incremental_rollups(self, buyer, place_order, catalog):
+        client = buyer()
+        toys, ball, kite = catalog
+        order = models.Order.objects.get(pk=place_order(client, [(ball, 2), (kite, 1)]).data['id'])
+        place_order(client, [(kite, 3)])
+        order.payment_status = models.Order.status_complete
+        order.save()
+        incremental = list(models.ProductDailySales.objects.order_by('product').values())
+
+        call_command('rebuild_sales_rollups')
+
+        rebuilt = list(models.ProductDailySales.objects.order_by('product').values())
+        assert [dict(row, id=None) for row in rebuilt] == [dict(row, id=None) for row in incremental]
+
+    def test_range_queries_read_the_rollups(self, buyer, place_order, catalog, django_assert_num_queries):
+        client = buyer()
+        toys, ball, kite = catalog
+        place_order(client, [(ball, 2), (kite, 1)])
+        staff = APIClient()
+        staff.force_authenticate(User.objects.create(username='staff', email='staff@shop.com', is_staff=True))
+
+        with django_assert_num_queries(1):
+            response = staff.get(f'/store/sales/products/?ids={kite.pk}&per_day=true')
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['results'] == [{
+            'product_id': kite.pk, 'day': timezone.localdate(), 'units': 1, 'revenue': Decimal('20.00'),
+            'orders': 1, 'paid_units': 0, 'paid_revenue': Decimal('0.00'), 'paid_orders': 0}]
+        assert staff.get('/store/sales/collections/?start=2000-01-02&end=2000-01-01').status_code == \
+            status.HTTP_400_BAD_REQUEST
+        assert client.get('/store/sales/products/').status_code == status.HTTP_403_FORBIDDEN
@@ -0,0 +1,38 @@
+import pytest
+from rest_framework.test import APIClient
+
+from store import models
+
+
+@pytest.mark.django_db
+class TestProductSearch:
+
+    def test_results_are_ranked_and_require_every_term(self):
+        shoes = models.Collection.objects.create(title='Running Shoes')
+        other = models.Collection.objects.create(title='Accessories')
+        in_title = models.Product.objects.create(
+            title='Trail runner shoe', description='light', price=50, collection=other)
+        in_collection = models.Product.objects.create(
+            title='Road trainer', description='for runners', price=50, collection=shoes)
+        models.Product.objects.create(
+            title='Trail socks', description='wool', price=5, collection=other)
+
+        response = APIClient().get('/store/products/?search=trail run')
+
+        assert [product['id'] for product in response.data['results']] == [in_title.id]
+
+        response = APIClient().get('/store/products/?search=run')
+
+        assert [product['id'] for product in response.data['results']] == [in_title.id, in_collection.id]
+
+    def test_collection_rename_reindexes_its_products(self):
+        collection = models.Collection.objects.create(title='Summer')
+        product = models.Product.objects.create(
+            title='Hat', description='-', price=5, collection=collection)
+        collection.title = 'Winter'
+        collection.save()
+
+        response = APIClient().get('/store/products/?search=winter')
+
+        assert [item['id'] for item in response.data['results']] == [product.id]
+        assert APIClient().get('/store/products/?search=summer').data['count'] == 0
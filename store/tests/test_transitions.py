@@ -0,0 +1,96 @@
+from decimal import Decimal
+
+import pytest
+from rest_framework.test import APIClient
+from rest_framework import status
+
+from core.models import User
+from store import models, orders, rollups
+
+
+@pytest.fixture
+def placed_orders():
+    collection = models.Collection.objects.create(title='collection')
+    lamp = models.Product.objects.create(title='lamp', description='-', price=10, collection=collection)
+    customer = User.objects.create(username='buyer', email='buyer@shop.com').customer
+    placed = []
+    for order_status in ['P', 'P', 'S', 'D']:
+        order = models.Order.objects.create(customer=customer, order_status=order_status)
+        models.OrderItem.objects.create(
+            order=order, product=lamp, quantity=2, unit_price=Decimal('10.00'), sub_total=Decimal('20.00'))
+        placed.append(order)
+    rollups.rebuild()
+    return placed
+
+
+@pytest.fixture
+def staff():
+    client = APIClient()
+    client.force_authenticate(User.objects.create(username='staff', email='staff@shop.com', is_staff=True))
+    return client
+
+
+def statuses(field):
+    return list(models.Order.objects.order_by('pk').values_list(field, flat=True))
+
+
+@pytest.mark.django_db
+class TestOrderTransitions:
+
+    def test_moves_allowed_orders_and_rejects_the_rest(self, staff, placed_orders):
+        response = staff.post('/store/orders/transition/', {
+            'ids': [order.pk for order in placed_orders], 'order_status': 'S'}, format='json')
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data == {'updated': 2, 'rejected': [placed_orders[3].pk]}
+        assert statuses('order_status') == ['S', 'S', 'S', 'D']
+
+    def test_a_filter_selects_the_orders(self, staff, placed_orders):
+        response = staff.post('/store/orders/transition/', {
+            'filter': {'order_status': 'S'}, 'order_status': 'D'}, format='json')
+
+        assert response.data == {'updated': 1, 'rejected': []}
+        assert statuses('order_status') == ['P', 'P', 'D', 'D']
+
+    def test_updates_in_chunks_and_sends_one_event(self, placed_orders, django_assert_num_queries):
+        events = []
+
+        def receiver(sender, changes, previous, **kwargs):
+            events.append((changes, previous))
+        orders.orders_transitioned.connect(receiver)
+        try:
+            # rejected, locked previous statuses, two chunked updates, the
+            # paid rollups per table, the customers' spend and the savepoint pair
+            with django_assert_num_queries(2 + 2 + 6 + 3 + 2):
+                updated, rejected = orders.transition(
+                    models.Order.objects.all(), {'payment_status': 'C'}, chunk_size=2)
+        finally:
+            orders.orders_transitioned.disconnect(receiver)
+
+        assert len(updated) == 4 and rejected == []
+        assert events == [({'payment_status': 'C'}, {order.pk: {'payment_status': 'P'} for order in placed_orders})]
+        assert models.ProductDailySales.objects.get().paid_units == 8
+
+    def test_requests_are_validated(self, staff, placed_orders):
+        def post(data):
+            return staff.post('/store/orders/transition/', data, format='json').status_code
+
+        assert post({'order_status': 'S'}) == status.HTTP_400_BAD_REQUEST
+        assert post({'ids': [placed_orders[0].pk], 'filter': {'order_status': 'P'}, 'order_status': 'S'}) == \
+            status.HTTP_400_BAD_REQUEST
+        assert post({'ids': [placed_orders[0].pk]}) == status.HTTP_400_BAD_REQUEST
+        assert post({'filter': {'placed_at__gte': 'soon'}, 'order_status': 'S'}) == status.HTTP_400_BAD_REQUEST
+        assert post({'filter': {'statuss': 'S'}, 'order_status': 'D'}) == status.HTTP_400_BAD_REQUEST
+        assert post({'filter': {'order_status': ''}, 'order_status': 'D'}) == status.HTTP_400_BAD_REQUEST
+        assert post({'filter': {}, 'order_status': 'D'}) == status.HTTP_400_BAD_REQUEST
+        assert post({'all': True, 'ids': [placed_orders[0].pk], 'order_status': 'D'}) == \
+            status.HTTP_400_BAD_REQUEST
+        assert statuses('order_status') == ['P', 'P', 'S', 'D']
+        assert post({'all': True, 'order_status': 'D'}) == status.HTTP_200_OK
+        assert statuses('order_status') == ['D', 'D', 'D', 'D']
+
+        customer = APIClient()
+        customer.force_authenticate(User.objects.get(username='buyer'))
+        assert customer.post('/store/orders/transition/', {
+            'ids': [placed_orders[0].pk], 'order_status': 'S'}, format='json').status_code == \
+            status.HTTP_403_FORBIDDEN
@@ -32,6 +32,7 @@ router.register('carts', views.CartViewSet, basename='cart')
 item_router = routers.NestedDefaultRouter(router, 'carts', lookup='cart')
 item_router.register('items', views.CartItemViewSet, basename='cart-item')
 router.register('orders', views.OrderViewSet, basename='order')
+router.register('sales', views.SalesViewSet, basename='sales')
 urlpatterns = [
     path('', include(router.urls)),
     path('', include(stock_router.urls)),
@@ -0,0 +1,59 @@
+import hashlib
+from django.db import transaction
+from django.db.models import F, Max
+from django.utils import timezone
+from . import models
+
+
+def bump(*keys):
+    # runs after commit so hot keys never hold a row lock for the length of
+    # the writing transaction
+    keys = set(keys)
+    transaction.on_commit(lambda: _bump(keys))
+
+
+def _bump(keys):
+    now = timezone.now()
+    updated = models.ResourceVersion.objects.filter(key__in=keys) \
+        .update(version=F('version') + 1, updated_at=now)
+    if updated < len(keys):
+        models.ResourceVersion.objects.bulk_create(
+            [models.ResourceVersion(key=key, version=1, updated_at=now) for key in keys],
+            ignore_conflicts=True
+        )
+
+
+def product_keys(*product_ids):
+    return ['product', *(f'product:{product_id}' for product_id in product_ids)]
+
+
+def stock_keys(*product_ids):
+    # stock only shows in product representations, collections don't depend on it
+    return ['stock', *(f'product:{product_id}' for product_id in product_ids)]
+
+
+def get_validators(keys, price_segments=None):
+    # a digest and the last change time of the state made of the versioned
+    # `keys` plus, when given, the price segments in effect now
+    now = timezone.now()
+    versions = {
+        key: (version, updated_at)
+        for key, version, updated_at in models.ResourceVersion.objects
+        .filter(key__in=keys).values_list('key', 'version', 'updated_at')
+    }
+    modified = [updated_at for _, updated_at in versions.values()]
+    parts = [(key, versions.get(key, (0,))[0]) for key in sorted(keys)]
+
+    if price_segments is not None:
+        price_epoch = price_segments.filter(valid_from__lte=now) \
+            .aggregate(price_epoch=Max('valid_from'))['price_epoch']
+        parts.append(('price', price_epoch))
+        if price_epoch:
+            modified.append(price_epoch)
+
+    return hashlib.sha1(repr(parts).encode()).hexdigest(), max(modified, default=None)
+
+
+def vary(state, *representation):
+    # the same state renders differently per query string and media type
+    return '"%s"' % hashlib.sha1(repr((state, representation)).encode()).hexdigest()
@@ -1,13 +1,17 @@
-from django.db.models.aggregates import Count
+from django.conf import settings
+from django.db.models import Prefetch
+from django.http import Http404, StreamingHttpResponse
 from rest_framework.viewsets import ModelViewSet, GenericViewSet
 from rest_framework.response import Response
-from rest_framework.permissions import AllowAny, SAFE_METHODS, IsAuthenticated
+from rest_framework.reverse import reverse
+from rest_framework.permissions import AllowAny, SAFE_METHODS, IsAdminUser, IsAuthenticated
 from rest_framework import status
 from rest_framework.decorators import action
 from rest_framework.mixins import CreateModelMixin, RetrieveModelMixin
 from rest_framework.filters import OrderingFilter, SearchFilter
 from django_filters.rest_framework import DjangoFilterBackend
-from . import models, serializers, permissions, filters
+from . import models, serializers, permissions, filters, pagination, facets, carts, reservations, exports, orders, rollups
+from .mixins import ConditionalGetMixin, FastReadMixin, IdempotencyMixin
 
 
 class CustomerViewSet(ModelViewSet):
@@ -21,20 +25,16 @@ class CustomerViewSet(ModelViewSet):
     ]
 
     ordering_fields = [
-        'membership', 'birth_date',
+        'membership', 'birth_date', 'order_count', 'lifetime_spend',
         'customer__email', 'customer__first_name', 'customer__last_name'
     ]
 
     def get_queryset(self):
         user = self.request.user
         if not user.is_staff:
-            return models.Customer.objects.select_related('customer').filter(customer_id=user.id).annotate(
-                order_count=Count('orders')
-            )
+            return models.Customer.objects.select_related('customer').filter(customer_id=user.id)
 
-        return models.Customer.objects.select_related('customer').all().annotate(
-            order_count=Count('orders')
-        )
+        return models.Customer.objects.select_related('customer').all()
 
     def get_serializer_class(self):
         if self.request.method == 'PATCH' and self.request.user.is_staff:
@@ -48,9 +48,7 @@ class CustomerViewSet(ModelViewSet):
     @action(detail=False, methods=['GET', 'PATCH'], permission_classes=[IsAuthenticated])
     def me(self, request):
         customer = models.Customer.objects.select_related('customer')\
-            .filter(customer_id=request.user.id).annotate(
-            order_count=Count('orders')
-        ).first()
+            .filter(customer_id=request.user.id).first()
         if request.method == 'GET':
             serializer = serializers.CustomerSerializer(customer)
             return Response(serializer.data)
@@ -61,21 +59,39 @@ class CustomerViewSet(ModelViewSet):
             return Response(serializer.data)
 
 
-class CollectionViewSet(ModelViewSet):
+class CollectionViewSet(ConditionalGetMixin, FastReadMixin, ModelViewSet):
     filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
     search_fields = ['title', 'slug']
     ordering_fields = ['title', 'products_count']
-    queryset = models.Collection.objects.all().annotate(
-        products_count=Count('product')
-    )
+    pagination_class = pagination.StorePagination
+    cursor_ordering_fields = ['title']
+    cursor_ordering = ['title']
+
+    def get_queryset(self):
+        fields = serializers.CollectionSerializer.requested_fields(self.request)
+        queryset = models.Collection.objects.all()
+        if 'featured_product' in fields:
+            queryset = queryset.prefetch_related(
+                Prefetch('featured_product', queryset=models.Product.objects.with_effective_price()))
+        if 'promotion' in serializers.get_query_list(self.request, 'expand'):
+            queryset = queryset.select_related('promotion')
+        return queryset
 
     def get_serializer_class(self):
         if self.request.method in ['POST', 'PATCH', 'PUT']:
             return serializers.CreateCollectionSerializer
         return serializers.CollectionSerializer
 
+    def get_version_keys(self):
+        if self.action == 'retrieve':
+            return [f'collection:{self.kwargs["pk"]}', 'product', 'promotion']
+        return ['collection', 'product', 'promotion']
+
+    def get_price_segments(self):
+        return models.ProductPriceSegment.objects.all()
+
     def destroy(self, request, *args, **kwargs):
-        if models.Product.objects.filter(collection_id=kwargs['pk']).count() > 0:
+        if self.get_object().products_count > 0:
             return Response({'error': 'this collection can not be deleted'}, status=status.HTTP_403_FORBIDDEN)
         return super().destroy(request, *args, **kwargs)
 
@@ -85,40 +101,69 @@ class CollectionViewSet(ModelViewSet):
         return [permissions.ShopifyModelPermission()]
 
 
-class PromotionViewSet(ModelViewSet):
+class PromotionViewSet(ConditionalGetMixin, ModelViewSet):
     queryset = models.Promotion.objects.all()
     serializer_class = serializers.PromotionSerializer
 
     permission_classes = [permissions.DjangoModelPermissions]
 
+    def get_version_keys(self):
+        if self.action == 'retrieve':
+            return [f'promotion:{self.kwargs["pk"]}']
+        return ['promotion']
 
-class ProductViewSet(ModelViewSet):
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
-    search_fields = ['title', 'slug', 'collection__title']
+
+class ProductViewSet(ConditionalGetMixin, FastReadMixin, ModelViewSet):
+    filter_backends = [DjangoFilterBackend, filters.ProductSearchFilter, OrderingFilter]
     filterset_class = filters.ProductFilter
     ordering_fields = [
         'title', 'price',
         'stock__quantity_in_stock', 'last_update'
     ]
+    pagination_class = pagination.StorePagination
+    cursor_ordering_fields = ['title', 'price', 'last_update', 'search_rank']
+    cursor_ordering = ['title']
     http_method_names = ['get', 'post', 'patch', 'head', 'options', 'delete']
-    queryset = models.Product.objects \
-        .select_related('collection__promotion') \
-        .prefetch_related('promotions') \
-        .select_related('stock') \
-        .prefetch_related('reviews__customer__customer') \
-        .all().annotate(num_reviews=Count('reviews'),
-                        )
+
+    def get_queryset(self):
+        fields = serializers.ProductSerializer.requested_fields(self.request)
+        queryset = models.Product.objects.all()
+        if 'new_price' in fields:
+            queryset = queryset.with_effective_price()
+        if 'collection' in fields:
+            queryset = queryset.select_related('collection')
+        if 'promotions' in fields:
+            queryset = queryset.prefetch_related('promotions')
+        if 'status' in fields or 'stock' in fields:
+            queryset = queryset.select_related('stock')
+        return queryset
 
     def get_serializer_class(self):
         if self.request.method in ['POST', 'PATCH']:
             return serializers.CreateProductSerializer
         return serializers.ProductSerializer
 
+    def get_version_keys(self):
+        if self.action == 'retrieve':
+            return [f'product:{self.kwargs["pk"]}', 'collection', 'promotion']
+        return ['product', 'stock', 'collection', 'promotion']
+
+    def get_price_segments(self):
+        if self.action != 'retrieve':
+            return models.ProductPriceSegment.objects.all()
+        if self.kwargs['pk'].isdigit():
+            return models.ProductPriceSegment.objects.filter(product_id=self.kwargs['pk'])
+
     def get_permissions(self):
         if self.request.method in SAFE_METHODS:
             return [AllowAny()]
         return [permissions.ShopifyModelPermission()]
 
+    @action(detail=False, methods=['GET'])
+    def facets(self, request):
+        queryset = self.filter_queryset(models.Product.objects.all())
+        return Response(facets.product_facets(queryset))
+
     def destroy(self, request, *args, **kwargs):
         if models.OrderItem.objects.filter(product_id=self.kwargs['pk']).count() > 0:
             return Response({'error': 'this Product con not be deleted'}, status=status.HTTP_403_FORBIDDEN)
@@ -144,11 +189,14 @@ class StockViewSet(ModelViewSet):
         return [permissions.ShopifyModelPermission()]
 
 
-class ReviewViewSet(ModelViewSet):
+class ReviewViewSet(FastReadMixin, ModelViewSet):
     filter_backends = [DjangoFilterBackend, OrderingFilter]
     ordering_fields = [
         'rating', 'created_at', 'is_updated', 'updated_at',
         'customer__customer__first_name', 'customer__customer__last_name']
+    pagination_class = pagination.StorePagination
+    cursor_ordering_fields = ['rating', 'created_at']
+    cursor_ordering = ['created_at']
     http_method_names = ['get', 'post', 'patch', 'head', 'options', 'delete']
 
     def get_queryset(self):
@@ -180,15 +228,63 @@ class ReviewViewSet(ModelViewSet):
 
 
 class CartViewSet(GenericViewSet, CreateModelMixin, RetrieveModelMixin):
-    queryset = models.Cart.objects.all()
     serializer_class = serializers.CartSerializer
+    queryset = models.Cart.objects.all()
 
+    def get_object(self):
+        fields = serializers.CartSerializer.requested_fields(self.request)
+        try:
+            return carts.get_backend().get(self.kwargs['pk'], with_items='items' in fields or 'total' in fields)
+        except (models.Cart.DoesNotExist, ValueError):
+            raise Http404
 
-class CartItemViewSet(ModelViewSet):
+    def perform_create(self, serializer):
+        serializer.instance = carts.get_backend().create()
+
+
+class CartItemViewSet(IdempotencyMixin, ModelViewSet):
     http_method_names = ['get', 'post', 'patch', 'head', 'options', 'delete']
 
     def get_queryset(self):
-        return models.CartItem.objects.filter(cart_id=self.kwargs['cart_pk'])
+        try:
+            return carts.get_backend().items(self.kwargs['cart_pk'])
+        except (models.Cart.DoesNotExist, ValueError):
+            raise Http404
+
+    def get_object(self):
+        try:
+            return carts.get_backend().get_item(self.kwargs['cart_pk'], self.kwargs['pk'])
+        except (models.Cart.DoesNotExist, models.CartItem.DoesNotExist, ValueError):
+            raise Http404
+
+    def perform_create(self, serializer):
+        try:
+            serializer.save()
+        except models.Cart.DoesNotExist:
+            raise Http404
+
+    def perform_destroy(self, instance):
+        carts.get_backend().remove_item(instance)
+        reservations.release(instance.cart_id, [instance.product_id])
+
+    @action(detail=False, methods=['POST'])
+    def bulk(self, request, cart_pk=None):
+        return self.respond_idempotently(self.add_items, request)
+
+    def add_items(self, request):
+        serializer = serializers.BulkCartItemSerializer(
+            data=request.data, many=True, context=self.get_serializer_context())
+        serializer.is_valid(raise_exception=True)
+        try:
+            serializer.save()
+        except models.Cart.DoesNotExist:
+            raise Http404
+
+        errors = serializer.line_errors
+        items = serializers.CartItemSerializer(self.get_queryset(), many=True).data
+        if errors and all(errors):
+            return Response({'items': items, 'errors': errors}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'items': items, 'errors': errors if any(errors) else []})
 
     def get_serializer_class(self):
         if self.request.method == 'POST':
@@ -201,9 +297,12 @@ class CartItemViewSet(ModelViewSet):
         return {'cart_id': self.kwargs['cart_pk']}
 
 
-class OrderViewSet(ModelViewSet):
+class OrderViewSet(FastReadMixin, IdempotencyMixin, ModelViewSet):
     filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
     ordering_fields = ['order_status', 'payment_status', 'placed_at']
+    pagination_class = pagination.StorePagination
+    cursor_ordering_fields = ['placed_at']
+    cursor_ordering = ['-placed_at']
     search_fields = [
         'customer__customer__first_name',
         'customer__customer__last_name'
@@ -211,17 +310,16 @@ class OrderViewSet(ModelViewSet):
     http_method_names = ['get', 'patch', 'post', 'head', 'options']
 
     def get_queryset(self):
+        fields = serializers.OrderSerializer.requested_fields(self.request)
+        queryset = models.Order.objects.all()
+        if 'customer' in fields:
+            queryset = queryset.select_related('customer__customer')
+        if 'item' in fields:
+            queryset = queryset.prefetch_related(
+                Prefetch('item', queryset=models.OrderItem.objects.select_related('product')))
         if not self.request.user.is_staff:
-            return models.Order.objects \
-                .select_related('customer__customer') \
-                .prefetch_related('item__product__promotions') \
-                .prefetch_related('item__product__collection') \
-                .filter(customer_id=self.request.user.id)
-        return models.Order.objects \
-            .select_related('customer__customer') \
-            .prefetch_related('item__product__promotions') \
-            .prefetch_related('item__product__collection') \
-            .all()
+            return queryset.filter(customer_id=self.request.user.id)
+        return queryset.all()
 
     def get_serializer_class(self):
         if self.request.method == 'POST':
@@ -231,16 +329,89 @@ class OrderViewSet(ModelViewSet):
         return serializers.OrderSerializer
 
     def create(self, request, *args, **kwargs):
-        serializer = serializers.CreateOrderSerializer(
+        return self.respond_idempotently(self.place_order, request)
+
+    def place_order(self, request):
+        # with ORDER_FINALIZE_ASYNC the order is only queued here, clients
+        # poll its processing status until a worker has finalized it
+        queued = getattr(settings, 'ORDER_FINALIZE_ASYNC', False)
+        serializer_class = serializers.PlaceOrderSerializer if queued else serializers.CreateOrderSerializer
+        serializer = serializer_class(
             data=self.request.data,
             context={'user_id': self.request.user.id}
         )
         serializer.is_valid(raise_exception=True)
         order = serializer.save()
-        serializer = serializers.OrderSerializer(order)
+        if queued:
+            return Response(
+                {'id': order.pk, 'processing_status': order.processing_status},
+                status=status.HTTP_202_ACCEPTED,
+                headers={'Location': reverse('order-processing', args=[order.pk], request=request)})
+        serializer = serializers.OrderSerializer(self.get_queryset().get(pk=order.pk))
         return Response(serializer.data)
 
+    @action(detail=True, methods=['GET'], url_path='status')
+    def processing(self, request, pk=None):
+        queryset = models.Order.objects.filter(pk=pk)
+        if not request.user.is_staff:
+            queryset = queryset.filter(customer_id=request.user.id)
+        order = queryset.values('id', 'processing_status', 'processing_error').first()
+        if order is None:
+            raise Http404
+        return Response(order)
+
+    @action(detail=False, methods=['GET'])
+    def export(self, request):
+        # ?as=csv (default) or ndjson, streamed whatever the number of orders
+        export_format = request.query_params.get('as', 'csv')
+        if export_format not in exports.FORMATS:
+            return Response({'error': f'as must be one of {", ".join(exports.FORMATS)}'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        order_filter = filters.OrderFilter(request.query_params, models.Order.objects.all())
+        if not order_filter.is_valid():
+            return Response(order_filter.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        chunks, content_type = exports.FORMATS[export_format]
+        response = StreamingHttpResponse(chunks(order_filter.qs), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="orders.{export_format}"'
+        return response
+
+    @action(detail=False, methods=['POST'])
+    def transition(self, request):
+        serializer = serializers.TransitionOrdersSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        updated, rejected = orders.transition(
+            serializer.validated_data['orders'], serializer.validated_data['changes'])
+        return Response({'updated': len(updated), 'rejected': rejected})
+
     def get_permissions(self):
+        if self.action in ['export', 'transition']:
+            return [IsAdminUser()]
         if self.request.method in ['GET', 'POST', 'HEAD', 'OPTIONS']:
             return [IsAuthenticated()]
         return [permissions.ShopifyModelPermission()]
+
+
+class SalesViewSet(GenericViewSet):
+    # answered from the daily rollups, ?start=&end= (last 30 days by
+    # default), ?ids= to narrow the keys and ?per_day=true for a series
+    permission_classes = [IsAdminUser]
+
+    @action(detail=False, methods=['GET'])
+    def products(self, request):
+        return self.respond(request, 'product')
+
+    @action(detail=False, methods=['GET'])
+    def collections(self, request):
+        return self.respond(request, 'collection')
+
+    @staticmethod
+    def respond(request, by):
+        query = serializers.SalesQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        params = query.validated_data
+        return Response({
+            'start': params['start'],
+            'end': params['end'],
+            'results': list(rollups.sales(by, params['start'], params['end'], params.get('ids'), params['per_day']))
+        })
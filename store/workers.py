@@ -0,0 +1,33 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import connection, transaction
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'ORDER_WORKERS', 4), thread_name_prefix='store-worker')
+        return _pool
+
+
+def submit(function, *args):
+    # runs function in the local pool once the current transaction commits,
+    # with ORDER_WORKERS set to 0 it runs right after the commit instead
+    if not getattr(settings, 'ORDER_WORKERS', 4):
+        transaction.on_commit(lambda: function(*args))
+        return
+    transaction.on_commit(lambda: get_pool().submit(run, function, *args))
+
+
+def run(function, *args):
+    # pool threads keep no connection between tasks
+    try:
+        return function(*args)
+    finally:
+        connection.close()